@@ -0,0 +1,67 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from aiohttp import web
+
+
+class RequestLimiter:
+    """
+    リクエストの同時実行数を制限するクラス
+
+    同時に処理するのはmax_concurrency件までで、それを超えたリクエストは待機させる。
+    待機中のリクエストがmax_pending件に達している場合は、待たせずに503を返す。
+    """
+
+    def __init__(self, max_concurrency: int, max_pending: int):
+        """
+        Args:
+            max_concurrency: 同時に処理するリクエストの最大数
+            max_pending: 処理待ちで待機させるリクエストの最大数
+        """
+        if max_concurrency <= 0:
+            raise ValueError("max_concurrency must be positive")
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.active = 0
+        self.pending = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        処理枠を確保する
+
+        Raises:
+            web.HTTPServiceUnavailable: 待機数が上限に達している場合
+        """
+        if self._semaphore.locked() and self.pending >= self.max_pending:
+            self.rejected += 1
+            raise web.HTTPServiceUnavailable(
+                text=json.dumps({"error": "server is busy"}),
+                content_type="application/json",
+                headers={"Retry-After": "1"}
+            )
+        self.pending += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.pending -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        """処理中・待機中・拒否したリクエスト数を返す"""
+        return {
+            "active": self.active,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "max_concurrency": self.max_concurrency,
+            "max_pending": self.max_pending,
+        }
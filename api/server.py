@@ -0,0 +1,236 @@
+import asyncio
+import functools
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Tuple
+
+import click
+from aiohttp import web
+
+from api.request_limiter import RequestLimiter
+from app.config import (
+    SERVER_HOST,
+    SERVER_MAX_CONCURRENCY,
+    SERVER_MAX_PENDING,
+    SERVER_PORT,
+    SERVER_WORKERS,
+)
+from app.pipeline import Pipeline
+from app.utils.metrics import REGISTRY
+
+PIPELINE = web.AppKey("pipeline", Pipeline)
+EXECUTOR = web.AppKey("executor", ThreadPoolExecutor)
+LIMITER = web.AppKey("limiter", RequestLimiter)
+INGEST_LOCK = web.AppKey("ingest_lock", asyncio.Lock)
+
+# ストリームの終端を表す値
+_END = object()
+
+
+def create_app(
+    pipeline: Pipeline,
+    max_workers: int = SERVER_WORKERS,
+    max_concurrency: int = SERVER_MAX_CONCURRENCY,
+    max_pending: int = SERVER_MAX_PENDING
+) -> web.Application:
+    """
+    PipelineをHTTPで公開するアプリケーションを作成
+
+    GeminiやベクトルストアへのブロッキングI/Oは、イベントループを止めないよう
+    スレッド数を制限したExecutorで実行する。
+
+    Args:
+        pipeline: 使用するPipeline
+        max_workers: ブロッキング処理を実行するスレッド数
+        max_concurrency: 同時に処理する質問の最大数
+        max_pending: 処理待ちで待機させる質問の最大数（超えた分は503を返す）
+
+    Returns:
+        web.Application: aiohttpのアプリケーション
+    """
+    app = web.Application()
+    app[PIPELINE] = pipeline
+    app[EXECUTOR] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline")
+    app[LIMITER] = RequestLimiter(max_concurrency, max_pending)
+    app[INGEST_LOCK] = asyncio.Lock()
+
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics)
+    app.router.add_post("/query", query)
+    app.router.add_post("/query/stream", query_stream)
+    app.router.add_post("/ingest", ingest)
+    app.on_cleanup.append(_shutdown_executor)
+    return app
+
+
+async def _shutdown_executor(app: web.Application) -> None:
+    app[EXECUTOR].shutdown(wait=False, cancel_futures=True)
+
+
+async def _run_blocking(request: web.Request, func: Callable, *args: Any) -> Any:
+    """ブロッキングする関数をExecutorで実行"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        request.app[EXECUTOR],
+        functools.partial(func, *args)
+    )
+
+
+def _json_error(status: int, message: str) -> web.Response:
+    return web.json_response({"error": message}, status=status)
+
+
+async def _read_json(request: web.Request) -> Dict[str, Any]:
+    """リクエストボディをJSONとして読み込む（空の場合は空の辞書）"""
+    if not request.can_read_body:
+        return {}
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(
+            text=json.dumps({"error": "invalid JSON body"}),
+            content_type="application/json"
+        )
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(
+            text=json.dumps({"error": "JSON body must be an object"}),
+            content_type="application/json"
+        )
+    return body
+
+
+async def _read_query(request: web.Request) -> Tuple[str, Dict[str, Any]]:
+    """リクエストから質問とリクエストボディを取り出す"""
+    body = await _read_json(request)
+    query_text = body.get("query")
+    if not isinstance(query_text, str) or not query_text.strip():
+        raise web.HTTPBadRequest(
+            text=json.dumps({"error": "'query' is required"}),
+            content_type="application/json"
+        )
+    return query_text, body
+
+
+def _sse(event: str, data: Dict[str, Any]) -> bytes:
+    """Server-Sent Eventsの1イベント分のバイト列を作成"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+async def health(request: web.Request) -> web.Response:
+    """稼働状況と同時実行数、まとめて処理した同一質問の数を返す"""
+    return web.json_response({
+        "status": "ok",
+        **request.app[LIMITER].stats(),
+        "single_flight": request.app[PIPELINE].single_flight.stats(include_keys=False),
+    })
+
+
+async def metrics(request: web.Request) -> web.Response:
+    """段階ごとの所要時間とカウンターをPrometheusのテキスト形式（?format=jsonでJSON）で返す"""
+    if request.query.get("format") == "json":
+        return web.json_response(REGISTRY.snapshot())
+    return web.Response(text=REGISTRY.to_prometheus(), content_type="text/plain", charset="utf-8")
+
+
+async def query(request: web.Request) -> web.Response:
+    """質問に対する回答をまとめて返す（"trace": trueで段階ごとの所要時間を含める）"""
+    query_text, body = await _read_query(request)
+    async with request.app[LIMITER].slot():
+        try:
+            response = await _run_blocking(
+                request, request.app[PIPELINE].run, query_text, bool(body.get("trace"))
+            )
+        except Exception as e:
+            return _json_error(500, str(e))
+    return web.json_response(response)
+
+
+async def query_stream(request: web.Request) -> web.StreamResponse:
+    """質問に対する回答をServer-Sent Eventsで少しずつ返す"""
+    query_text, _ = await _read_query(request)
+    async with request.app[LIMITER].slot():
+        try:
+            response_stream = await _run_blocking(
+                request, request.app[PIPELINE].run_stream, query_text
+            )
+        except Exception as e:
+            return _json_error(500, str(e))
+
+        response = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+        })
+        await response.prepare(request)
+
+        deltas = iter(response_stream)
+        try:
+            while True:
+                # 次の差分の生成を待つ間もイベントループは他のリクエストを処理できる
+                delta = await _run_blocking(request, next, deltas, _END)
+                if delta is _END:
+                    break
+                await response.write(_sse("delta", {"text": delta}))
+            await response.write(_sse("done", {
+                **response_stream.to_dict(),
+                "time_to_first_token": response_stream.time_to_first_token,
+                "total_latency": response_stream.total_latency,
+                "context_stats": response_stream.context_stats,
+            }))
+        except (ConnectionResetError, asyncio.CancelledError):
+            # クライアントが切断した場合は生成を打ち切る
+            await _run_blocking(request, deltas.close)
+            raise
+        except Exception as e:
+            await response.write(_sse("error", {"error": str(e)}))
+        await response.write_eof()
+        return response
+
+
+async def ingest(request: web.Request) -> web.Response:
+    """文書ディレクトリの変更を取り込む（同時に実行できる取り込みは1つだけ）"""
+    body = await _read_json(request)
+    metadata = body.get("metadata")
+    lock = request.app[INGEST_LOCK]
+    if lock.locked():
+        return _json_error(409, "ingest is already running")
+    async with lock:
+        try:
+            stats = await _run_blocking(request, request.app[PIPELINE].initialize, metadata)
+        except Exception as e:
+            return _json_error(500, str(e))
+    return web.json_response({"stats": stats})
+
+
+@click.command()
+@click.option(
+    '--docs-dir',
+    type=click.Path(exists=True, file_okay=False, dir_okay=True),
+    default='docs',
+    help='文書が格納されているディレクトリ'
+)
+@click.option(
+    '--collection-name',
+    default='documents',
+    help='コレクション名'
+)
+@click.option('--host', default=SERVER_HOST, help='待ち受けるホスト')
+@click.option('--port', default=SERVER_PORT, type=int, help='待ち受けるポート')
+@click.option(
+    '--ingest/--no-ingest',
+    'ingest_on_start',
+    default=True,
+    help='起動時に文書を取り込む'
+)
+def main(docs_dir: str, collection_name: str, host: str, port: int, ingest_on_start: bool):
+    """RAGチャットボットのHTTP APIサーバー"""
+    pipeline = Pipeline(docs_dir=Path(docs_dir), collection_name=collection_name)
+    if ingest_on_start:
+        click.echo("文書を読み込んでいます...")
+        stats = pipeline.initialize()
+        click.echo(f"文書の読み込みが完了しました: {stats}")
+    web.run_app(create_app(pipeline), host=host, port=port)
+
+
+if __name__ == '__main__':
+    main()
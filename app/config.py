@@ -7,14 +7,132 @@ env_path = Path(__file__).parent.parent / '.env'
 load_dotenv(env_path)
 
 # Google Gemini API
+# APIキーは実際にAPIを呼び出すときに検証する（インポート時には検証しない）
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
-if not GOOGLE_API_KEY:
-    raise ValueError("GOOGLE_API_KEY environment variable is not set")
+GENERATION_MODEL = os.getenv('GENERATION_MODEL', 'gemini-1.5-pro')
+
+
+def get_google_api_key() -> str:
+    """
+    GOOGLE_API_KEYを取得する
+
+    Returns:
+        str: APIキー
+
+    Raises:
+        ValueError: 環境変数が設定されていない場合
+    """
+    api_key = os.getenv('GOOGLE_API_KEY') or GOOGLE_API_KEY
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY environment variable is not set")
+    return api_key
+
 
 # Vector DB settings
 CHROMA_PERSIST_DIRECTORY = os.getenv('CHROMA_PERSIST_DIRECTORY', '.chroma')
+# ベクトルインデックスのバックエンド（chroma または numpy）
+VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'chroma')
+# numpyバックエンドの検索方式（flat: 厳密検索, ivf: 近似検索）
+VECTOR_INDEX_TYPE = os.getenv('VECTOR_INDEX_TYPE', 'flat')
+IVF_NLIST = int(os.getenv('IVF_NLIST', '0'))
+IVF_NPROBE = int(os.getenv('IVF_NPROBE', '8'))
+# numpyバックエンドで保存する埋め込みの型（float32, float16 または int8）
+VECTOR_DTYPE = os.getenv('VECTOR_DTYPE', 'float32')
+
+# Embedding settings
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'models/embedding-001')
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '100'))
+EMBEDDING_MAX_WORKERS = int(os.getenv('EMBEDDING_MAX_WORKERS', '4'))
+EMBEDDING_REQUESTS_PER_MINUTE = float(os.getenv('EMBEDDING_REQUESTS_PER_MINUTE', '1500'))
+EMBEDDING_MAX_RETRIES = int(os.getenv('EMBEDDING_MAX_RETRIES', '5'))
+# 空文字を指定すると埋め込みキャッシュを無効化
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', '.cache/embeddings.sqlite3')
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', '200000'))
+# メモリ上に保持する検索クエリの埋め込みの数（0で無効化）
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '1024'))
 
 # Application settings
 CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', '1000'))
 CHUNK_OVERLAP = int(os.getenv('CHUNK_OVERLAP', '200'))
-MAX_RETRIEVAL_DOCS = int(os.getenv('MAX_RETRIEVAL_DOCS', '5')) 
\ No newline at end of file
+# チャンクの長さの単位（chars: 文字数, tokens: 推定トークン数）
+CHUNK_LENGTH_UNIT = os.getenv('CHUNK_LENGTH_UNIT', 'chars')
+MAX_RETRIEVAL_DOCS = int(os.getenv('MAX_RETRIEVAL_DOCS', '5'))
+
+# Rerank settings
+# 候補の並べ替え方法（lexical: 質問の語の一致度, none: 並べ替えない）
+RERANKER = os.getenv('RERANKER', 'none')
+# 並べ替えで検索時の順位に置く重み（0〜1、0で並べ替えのスコアのみを使う）
+RERANK_RANK_WEIGHT = float(os.getenv('RERANK_RANK_WEIGHT', '0.5'))
+# 並べ替えのために取得する候補数
+RERANK_CANDIDATES = int(os.getenv('RERANK_CANDIDATES', '20'))
+RERANK_BATCH_SIZE = int(os.getenv('RERANK_BATCH_SIZE', '16'))
+# 並べ替えにかけてよい秒数（超えた場合は検索時の順位を使う、0で無制限）。
+# 各バッチの採点前に確認する緩い上限で、最大で1バッチ分の採点時間だけ超えることがある
+RERANK_LATENCY_BUDGET = float(os.getenv('RERANK_LATENCY_BUDGET', '0.5'))
+RERANK_CACHE_SIZE = int(os.getenv('RERANK_CACHE_SIZE', '10000'))
+
+# Context settings
+# プロンプトに入れるコンテキストのトークン数の上限（0で無制限）
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '4000'))
+# ほぼ同じ内容のチャンクとみなす類似度（MinHashによる推定Jaccard係数）
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv('CONTEXT_DEDUP_THRESHOLD', '0.8'))
+
+# Context cache settings（すべての質問で共通のプロンプトの固定部分）
+# 回答生成のシステム指示（空文字列で指定しない）
+SYSTEM_INSTRUCTION = os.getenv('SYSTEM_INSTRUCTION', '')
+# 常にプロンプトに含める参考文書のパス（カンマ区切り）
+STATIC_CONTEXT_FILES = [path.strip() for path in os.getenv('STATIC_CONTEXT_FILES', '').split(',') if path.strip()]
+# 固定部分をGemini側にキャッシュする秒数（0でキャッシュせず毎回送る）
+CONTEXT_CACHE_TTL = float(os.getenv('CONTEXT_CACHE_TTL', '3600'))
+# 有効期限の何秒前にキャッシュの期限を延長するか
+CONTEXT_CACHE_REFRESH_MARGIN = float(os.getenv('CONTEXT_CACHE_REFRESH_MARGIN', '300'))
+# キャッシュする固定部分の最小の推定トークン数（モデルが受け付ける下限に合わせる）
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv('CONTEXT_CACHE_MIN_TOKENS', '32768'))
+
+# Hybrid search settings（BM25とベクトル検索の結果をReciprocal Rank Fusionで統合）
+HYBRID_SEARCH = os.getenv('HYBRID_SEARCH', 'true').lower() in ('1', 'true', 'yes')
+HYBRID_VECTOR_WEIGHT = float(os.getenv('HYBRID_VECTOR_WEIGHT', '1.0'))
+HYBRID_LEXICAL_WEIGHT = float(os.getenv('HYBRID_LEXICAL_WEIGHT', '1.0'))
+HYBRID_RRF_K = int(os.getenv('HYBRID_RRF_K', '60'))
+# 統合前にそれぞれの検索で取得する候補数
+HYBRID_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', '20'))
+# BM25で読み飛ばす語の文書頻度の割合（これを超える割合の文書に現れる語はスコアに加えない、1.0で無効）
+HYBRID_MAX_DF_RATIO = float(os.getenv('HYBRID_MAX_DF_RATIO', '0.5'))
+
+# Response cache settings（RESPONSE_CACHE_MAX_ENTRIES=0で無効化）
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1000'))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '3600'))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv('RESPONSE_CACHE_SIMILARITY', '0.95'))
+
+# Chat session settings
+# 会話履歴としてそのまま保持するやり取りの数（超えた分は要約にまとめる）
+CHAT_HISTORY_TURNS = int(os.getenv('CHAT_HISTORY_TURNS', '6'))
+# 追加の質問を同じ話題とみなす、話題のクエリ埋め込みとの類似度
+CHAT_TOPIC_SIMILARITY = float(os.getenv('CHAT_TOPIC_SIMILARITY', '0.7'))
+# 会話中に再利用する検索済みチャンクの最大数
+CHAT_WORKING_SET_SIZE = int(os.getenv('CHAT_WORKING_SET_SIZE', '20'))
+# 要約に残す1回の回答の最大文字数
+CHAT_SUMMARY_CHARS = int(os.getenv('CHAT_SUMMARY_CHARS', '200'))
+
+# Batch query settings（run_batchで同時に実行する回答生成の数）
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '8'))
+
+# Ingest settings
+# 読み込み・分割のワーカープロセス数（未指定でCPUコア数、0で同一プロセス内で実行）
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS')) if os.getenv('INGEST_WORKERS') else None
+# ベクトルストアへまとめて登録するチャンク数
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '256'))
+# PDFから抽出したページのテキストのキャッシュ（空文字列でキャッシュしない）
+PDF_CACHE_PATH = os.getenv('PDF_CACHE_PATH', '.cache/pdf_pages.sqlite3')
+PDF_CACHE_MAX_FILES = int(os.getenv('PDF_CACHE_MAX_FILES', '1000'))
+# PDFのテキスト抽出で1つのワーカーにまとめて渡すページ数
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', '8'))
+
+# HTTP server settings
+SERVER_HOST = os.getenv('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.getenv('SERVER_PORT', '8000'))
+# Gemini・ベクトルストアの呼び出しを実行するスレッド数
+SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', '8'))
+# 同時に処理するリクエスト数と、それを超えて待機させるリクエスト数（超えた分は503を返す）
+SERVER_MAX_CONCURRENCY = int(os.getenv('SERVER_MAX_CONCURRENCY', '16'))
+SERVER_MAX_PENDING = int(os.getenv('SERVER_MAX_PENDING', '64'))
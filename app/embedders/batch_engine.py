@@ -0,0 +1,118 @@
+import contextvars
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+
+from app.embedders.rate_limiter import TokenBucket
+from app.utils.metrics import count
+
+
+class BatchEmbeddingEngine:
+    """テキストをバッチにまとめ、並列かつレート制限付きで埋め込みを生成するエンジン"""
+
+    def __init__(
+        self,
+        backend: Any,
+        batch_size: int = 100,
+        max_workers: int = 4,
+        requests_per_minute: Optional[float] = None,
+        max_retries: int = 5,
+        initial_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        """
+        Args:
+            backend: embed_batch(texts, task_type)とis_retryable(error)を持つ埋め込みバックエンド
+            batch_size: 1回のAPI呼び出しにまとめるテキスト数
+            max_workers: 同時に実行するバッチ数の上限
+            requests_per_minute: 1分あたりのAPI呼び出し数の上限（Noneで無制限）
+            max_retries: 再試行可能なエラーに対する最大再試行回数
+            initial_backoff: 最初の再試行までの待機秒数
+            max_backoff: 再試行時の待機秒数の上限
+            sleep: 待機関数（テスト用に差し替え可能）
+        """
+        if batch_size <= 0:
+            raise ValueError("batch_size must be positive")
+        if max_workers <= 0:
+            raise ValueError("max_workers must be positive")
+        self.backend = backend
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self._sleep = sleep
+        self.rate_limiter = None
+        if requests_per_minute:
+            self.rate_limiter = TokenBucket(
+                rate=requests_per_minute / 60.0,
+                capacity=max(1.0, float(max_workers)),
+                sleep=sleep
+            )
+
+    def embed(self, texts: List[str], task_type: Optional[str] = None) -> np.ndarray:
+        """
+        テキストのリストを埋め込む
+
+        Args:
+            texts: 埋め込みを生成するテキストのリスト
+            task_type: 埋め込みの用途（"retrieval_document"、"retrieval_query"など）
+
+        Returns:
+            np.ndarray: 入力と同じ順序の埋め込みを行とするfloat32の行列
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        batches = [
+            texts[i:i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        if len(batches) == 1 or self.max_workers == 1:
+            results = [self._embed_batch(batch, task_type) for batch in batches]
+        else:
+            workers = min(self.max_workers, len(batches))
+            # 呼び出し元のトレースに記録されるよう、バッチごとにコンテキストを引き継ぐ
+            contexts = [contextvars.copy_context() for _ in batches]
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # mapは入力順に結果を返すため、完了順に関係なく順序が保たれる
+                results = list(executor.map(
+                    lambda context, batch: context.run(self._embed_batch, batch, task_type),
+                    contexts,
+                    batches
+                ))
+
+        return np.concatenate(
+            [np.asarray(batch_result, dtype=np.float32) for batch_result in results]
+        )
+
+    def _embed_batch(self, batch: List[str], task_type: Optional[str]) -> List[List[float]]:
+        """1バッチ分の埋め込みを、レート制限と再試行を適用して生成"""
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            count("api_calls_total", api="embed")
+            try:
+                embeddings = self.backend.embed_batch(batch, task_type=task_type)
+            except Exception as e:
+                count("api_errors_total", api="embed")
+                if attempt >= self.max_retries or not self.backend.is_retryable(e):
+                    raise
+                self._sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            if len(embeddings) != len(batch):
+                raise ValueError(
+                    f"Backend returned {len(embeddings)} embeddings for {len(batch)} texts"
+                )
+            count("embedded_texts_total", len(batch))
+            return embeddings
+
+    def _backoff(self, attempt: int) -> float:
+        """指数バックオフ（ジッター付き）の待機秒数を計算"""
+        delay = min(self.max_backoff, self.initial_backoff * (2 ** attempt))
+        return delay * (0.5 + random.random() / 2)
@@ -0,0 +1,166 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    モデル名とチャンク本文のハッシュをキーにした永続埋め込みキャッシュ
+
+    SQLiteにfloat32のバイト列として保存し、件数が上限を超えた場合は
+    最終アクセスが古いものから削除する（LRU）。
+    """
+
+    def __init__(self, path: Union[str, Path] = ":memory:", max_entries: int = 200_000):
+        """
+        Args:
+            path: SQLiteファイルのパス（":memory:"でメモリ上に作成）
+            max_entries: 保持する埋め込みの最大件数
+        """
+        if max_entries <= 0:
+            raise ValueError("max_entries must be positive")
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                embedding BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings (last_access)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        """モデル名とテキストからキャッシュキーを生成"""
+        digest = hashlib.sha256()
+        digest.update(model_name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_many(self, model_name: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """
+        複数テキストの埋め込みをキャッシュから取得
+
+        Args:
+            model_name: 埋め込みモデル名
+            texts: テキストのリスト
+
+        Returns:
+            List[Optional[np.ndarray]]: 入力と同じ順序のfloat32の埋め込み（未登録の場合はNone）
+        """
+        keys = [self.make_key(model_name, text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            # SQLiteのパラメータ数上限を避けるため分割して問い合わせる
+            for i in range(0, len(unique_keys), 500):
+                part = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, embedding FROM embeddings WHERE key IN ({placeholders})",
+                    part
+                ).fetchall()
+                for key, blob in rows:
+                    # 保存済みのバイト列をコピーせずに配列として参照する
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+            results = [found.get(key) for key in keys]
+            hit_count = sum(1 for result in results if result is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        return results
+
+    def put_many(
+        self,
+        model_name: str,
+        texts: Sequence[str],
+        embeddings: Sequence[Sequence[float]]
+    ) -> None:
+        """
+        複数テキストの埋め込みをキャッシュに登録
+
+        Args:
+            model_name: 埋め込みモデル名
+            texts: テキストのリスト
+            embeddings: textsと同じ順序の埋め込みベクトル
+        """
+        now = time.time()
+        rows = [
+            (self.make_key(model_name, text), np.asarray(embedding, dtype=np.float32).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, embedding, last_access) VALUES (?, ?, ?)",
+                rows
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """上限を超えた分を最終アクセスが古い順に削除"""
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                """
+                DELETE FROM embeddings WHERE key IN (
+                    SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?
+                )
+                """,
+                (excess,)
+            )
+            self.evictions += excess
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return count
+
+    def stats(self) -> Dict[str, float]:
+        """ヒット数・ミス数・ヒット率などの統計情報を返す"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def clear(self) -> None:
+        """キャッシュを空にする"""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+
+    def close(self) -> None:
+        """データベース接続を閉じる"""
+        with self._lock:
+            self._conn.close()
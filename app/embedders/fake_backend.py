@@ -0,0 +1,77 @@
+import hashlib
+import math
+import threading
+import time
+from typing import List, Optional
+
+
+class FakeQuotaError(Exception):
+    """FakeEmbeddingBackendが擬似的に発生させるクォータ超過エラー"""
+
+
+class FakeEmbeddingBackend:
+    """
+    テストやベンチマーク用のローカル埋め込みバックエンド
+
+    文字bigramをハッシュして固定次元のベクトルに射影するため、
+    同じテキストには常に同じベクトルが返り、文字が重なるテキスト同士は類似度が高くなる。
+    """
+
+    def __init__(
+        self,
+        dimension: int = 64,
+        latency: float = 0.0,
+        fail_first: int = 0,
+        model_name: str = "fake-embedding"
+    ):
+        """
+        Args:
+            dimension: 埋め込みベクトルの次元数
+            latency: 1回の呼び出しごとに待機する秒数（APIの遅延を模擬）
+            fail_first: 最初のN回の呼び出しでFakeQuotaErrorを発生させる
+            model_name: モデル名
+        """
+        self.dimension = dimension
+        self.latency = latency
+        self.model_name = model_name
+        self.call_count = 0
+        self.batch_sizes: List[int] = []
+        self._failures_left = fail_first
+        self._lock = threading.Lock()
+
+    def embed_batch(self, texts: List[str], task_type: Optional[str] = None) -> List[List[float]]:
+        """
+        複数テキストの埋め込みを生成
+
+        Args:
+            texts: 埋め込みを生成するテキストのリスト
+            task_type: 埋め込みの用途（このバックエンドでは結果に影響しない）
+
+        Returns:
+            List[List[float]]: 入力と同じ順序の埋め込みベクトルのリスト
+        """
+        with self._lock:
+            self.call_count += 1
+            if self._failures_left > 0:
+                self._failures_left -= 1
+                raise FakeQuotaError("quota exceeded")
+            self.batch_sizes.append(len(texts))
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimension
+        grams = [text[i:i + 2] for i in range(max(len(text) - 1, 1))]
+        for gram in grams:
+            digest = hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            sign = 1.0 if value & 1 else -1.0
+            vector[(value >> 1) % self.dimension] += sign
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        """再試行すべきエラーかどうかを判定"""
+        return isinstance(error, FakeQuotaError)
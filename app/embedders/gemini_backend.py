@@ -0,0 +1,56 @@
+from typing import List, Optional
+
+from app.config import EMBEDDING_MODEL, get_google_api_key
+
+
+class GeminiEmbeddingBackend:
+    """Gemini APIのバッチ埋め込みエンドポイントを呼び出すバックエンド"""
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        """
+        Args:
+            model_name: 埋め込みモデル名
+
+        Raises:
+            ValueError: GOOGLE_API_KEYが設定されていない場合
+        """
+        self.model_name = model_name
+        self._api_key = get_google_api_key()
+        self._genai = None
+
+    def _client(self):
+        """google.generativeaiは読み込みが重いため、最初のAPI呼び出し時にインポートする"""
+        if self._genai is None:
+            import google.generativeai as genai
+            genai.configure(api_key=self._api_key)
+            self._genai = genai
+        return self._genai
+
+    def embed_batch(self, texts: List[str], task_type: Optional[str] = None) -> List[List[float]]:
+        """
+        1回のAPI呼び出しで複数テキストの埋め込みを生成
+
+        Args:
+            texts: 埋め込みを生成するテキストのリスト
+            task_type: 埋め込みの用途（"retrieval_document"、"retrieval_query"など）
+
+        Returns:
+            List[List[float]]: 入力と同じ順序の埋め込みベクトルのリスト
+        """
+        result = self._client().embed_content(
+            model=self.model_name,
+            content=texts,
+            task_type=task_type
+        )
+        return result["embedding"]
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        """再試行すべきエラー（クォータ超過や一時的な障害）かどうかを判定"""
+        from google.api_core import exceptions as google_exceptions
+        return isinstance(error, (
+            google_exceptions.ResourceExhausted,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.DeadlineExceeded,
+            google_exceptions.InternalServerError,
+        ))
@@ -1,19 +1,74 @@
-from typing import List
+from typing import Any, List, Optional
 
-import google.generativeai as genai
+import numpy as np
 
-from app.config import GOOGLE_API_KEY
+from app.config import (
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MAX_RETRIES,
+    EMBEDDING_MAX_WORKERS,
+    EMBEDDING_MODEL,
+    EMBEDDING_REQUESTS_PER_MINUTE,
+    QUERY_EMBEDDING_CACHE_SIZE,
+)
+from app.embedders.batch_engine import BatchEmbeddingEngine
+from app.embedders.embedding_cache import EmbeddingCache
+from app.embedders.query_embedding_cache import QueryEmbeddingCache
+from app.utils.metrics import count, stage
+from app.utils.single_flight import SingleFlight
+from app.utils.text import normalize_query
 
 
 class GeminiEmbedder:
-    """Google Gemini APIを使用した埋め込み生成クラス"""
+    """
+    Google Gemini APIを使用した埋め込み生成クラス
 
-    def __init__(self):
-        """Gemini APIの初期化"""
-        genai.configure(api_key=GOOGLE_API_KEY)
-        self.model = genai.GenerativeModel('embedding-001')
+    埋め込みはfloat32のNumPy配列（複数の場合は行列）として返す。
+    """
 
-    def embed_text(self, text: str) -> List[float]:
+    DOCUMENT_TASK = "retrieval_document"
+    QUERY_TASK = "retrieval_query"
+
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL,
+        backend: Optional[Any] = None,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_workers: int = EMBEDDING_MAX_WORKERS,
+        requests_per_minute: Optional[float] = EMBEDDING_REQUESTS_PER_MINUTE,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+        cache: Optional[EmbeddingCache] = None,
+        query_cache_size: int = QUERY_EMBEDDING_CACHE_SIZE
+    ):
+        """
+        Args:
+            model_name: 埋め込みモデル名
+            backend: 埋め込みバックエンド（省略時はGemini APIを使用）
+            batch_size: 1回のAPI呼び出しにまとめるテキスト数
+            max_workers: 同時に実行するバッチ数の上限
+            requests_per_minute: 1分あたりのAPI呼び出し数の上限
+            max_retries: クォータ超過時などの最大再試行回数
+            cache: 埋め込みキャッシュ（省略時はキャッシュしない）
+            query_cache_size: メモリ上に保持する検索クエリの埋め込みの数（0でキャッシュしない）
+        """
+        if backend is None:
+            from app.embedders.gemini_backend import GeminiEmbeddingBackend
+            backend = GeminiEmbeddingBackend(model_name)
+        self.backend = backend
+        self.model_name = getattr(backend, "model_name", model_name)
+        self.engine = BatchEmbeddingEngine(
+            backend=backend,
+            batch_size=batch_size,
+            max_workers=max_workers,
+            requests_per_minute=requests_per_minute,
+            max_retries=max_retries
+        )
+        self.cache = cache
+        # 繰り返される質問はAPIもディスクのキャッシュも使わずに返す
+        self.query_cache = QueryEmbeddingCache(query_cache_size) if query_cache_size > 0 else None
+        # 同じクエリの同時リクエストはAPI呼び出しを1回にまとめる
+        self.single_flight = SingleFlight()
+
+    def embed_text(self, text: str) -> np.ndarray:
         """
         テキストの埋め込みベクトルを生成
 
@@ -21,23 +76,123 @@ class GeminiEmbedder:
             text: 埋め込みを生成するテキスト
 
         Returns:
-            List[float]: 埋め込みベクトル
+            np.ndarray: 埋め込みベクトル
+        """
+        return self.embed_texts([text])[0]
+
+    def embed_query(self, query: str) -> np.ndarray:
         """
-        result = self.model.embed_content(text)
-        return result.embedding
+        検索クエリの埋め込みベクトルを生成
 
-    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        最近埋め込んだクエリ（正規化後に同じもの）はキャッシュから返し、
+        正規化後に同じクエリの埋め込みを生成中であれば、その結果を共有する。
+        共有される配列のため読み取り専用で返す。
+
+        Args:
+            query: 検索クエリ
+
+        Returns:
+            np.ndarray: 埋め込みベクトル
+        """
+        cached = self._get_cached_query(query)
+        if cached is not None:
+            return cached
+        key = (self.QUERY_TASK, normalize_query(query))
+        return self.single_flight.do(key, self._embed_query, query)
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        embedding = self.embed_texts([query], task_type=self.QUERY_TASK)[0]
+        if self.query_cache is not None:
+            return self.query_cache.put(self._query_cache_model, query, embedding)
+        embedding.setflags(write=False)
+        return embedding
+
+    @property
+    def _query_cache_model(self) -> str:
+        return f"{self.model_name}:{self.QUERY_TASK}"
+
+    def _get_cached_query(self, query: str) -> Optional[np.ndarray]:
+        """クエリの埋め込みをメモリ上のキャッシュから取得（ない場合はNone）"""
+        if self.query_cache is None:
+            return None
+        embedding = self.query_cache.get(self._query_cache_model, query)
+        count("cache_hits_total" if embedding is not None else "cache_misses_total", cache="query_embedding")
+        return embedding
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        複数の検索クエリの埋め込みベクトルをまとめて生成
+
+        Args:
+            queries: 検索クエリのリスト
+
+        Returns:
+            np.ndarray: 入力と同じ順序の埋め込みを行とする行列
+        """
+        if self.query_cache is None:
+            return self.embed_texts(queries, task_type=self.QUERY_TASK)
+
+        embeddings = [self._get_cached_query(query) for query in queries]
+        missing = list(dict.fromkeys(
+            query for query, embedding in zip(queries, embeddings) if embedding is None
+        ))
+        if missing:
+            new_embeddings = self.embed_texts(missing, task_type=self.QUERY_TASK)
+            computed = {
+                query: self.query_cache.put(self._query_cache_model, query, embedding)
+                for query, embedding in zip(missing, new_embeddings)
+            }
+            embeddings = [
+                embedding if embedding is not None else computed[query]
+                for query, embedding in zip(queries, embeddings)
+            ]
+        if not embeddings:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack(embeddings)
+
+    def embed_texts(
+        self,
+        texts: List[str],
+        task_type: str = DOCUMENT_TASK
+    ) -> np.ndarray:
         """
         複数のテキストの埋め込みベクトルを生成
 
+        キャッシュ済みのテキストはAPIを呼ばずに返し、残りはAPIのバッチ単位に
+        まとめて複数バッチを並列に処理する。
+
         Args:
             texts: 埋め込みを生成するテキストのリスト
+            task_type: 埋め込みの用途（文書登録用または検索クエリ用）
 
         Returns:
-            List[List[float]]: 埋め込みベクトルのリスト
+            np.ndarray: 入力と同じ順序の埋め込みを行とするfloat32の行列
         """
-        embeddings = []
-        for text in texts:
-            embedding = self.embed_text(text)
-            embeddings.append(embedding)
-        return embeddings 
\ No newline at end of file
+        with stage("embed", task=task_type):
+            return self._embed_texts(list(texts), task_type)
+
+    def _embed_texts(self, texts: List[str], task_type: str) -> np.ndarray:
+        if self.cache is None:
+            return self.engine.embed(texts, task_type=task_type)
+
+        # 用途によって埋め込みが変わるため、キャッシュキーには用途も含める
+        cache_model = f"{self.model_name}:{task_type}"
+        embeddings = self.cache.get_many(cache_model, texts)
+        hits = sum(1 for embedding in embeddings if embedding is not None)
+        count("cache_hits_total", hits, cache="embedding")
+        count("cache_misses_total", len(texts) - hits, cache="embedding")
+        # 同じテキストは1回だけ埋め込む
+        missing = list(dict.fromkeys(
+            text for text, embedding in zip(texts, embeddings) if embedding is None
+        ))
+        if missing:
+            new_embeddings = self.engine.embed(missing, task_type=task_type)
+            self.cache.put_many(cache_model, missing, new_embeddings)
+            computed = dict(zip(missing, new_embeddings))
+            embeddings = [
+                embedding if embedding is not None else computed[text]
+                for text, embedding in zip(texts, embeddings)
+            ]
+        if not embeddings:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack(embeddings)
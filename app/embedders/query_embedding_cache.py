@@ -0,0 +1,100 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from app.utils.text import normalize_query
+
+
+class QueryEmbeddingCache:
+    """
+    検索クエリの埋め込みのメモリ上のLRUキャッシュ
+
+    正規化したクエリとモデル名をキーにし、件数が上限を超えると最も使われていない
+    ものから削除する。複数スレッドから共有でき、返す配列は読み取り専用。
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        """
+        Args:
+            max_entries: 保持するクエリの最大数
+        """
+        if max_entries <= 0:
+            raise ValueError("max_entries must be positive")
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model_name: str, query: str) -> Tuple[str, str]:
+        """キャッシュのキー（モデル名, 正規化したクエリ）"""
+        return model_name, normalize_query(query)
+
+    def get(self, model_name: str, query: str) -> Optional[np.ndarray]:
+        """
+        クエリの埋め込みを取得
+
+        Args:
+            model_name: 埋め込みモデル名（用途を含む）
+            query: 検索クエリ
+
+        Returns:
+            Optional[np.ndarray]: 埋め込みベクトル（未登録の場合はNone）
+        """
+        key = self.make_key(model_name, query)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, model_name: str, query: str, embedding: np.ndarray) -> np.ndarray:
+        """
+        クエリの埋め込みを登録
+
+        Args:
+            model_name: 埋め込みモデル名（用途を含む）
+            query: 検索クエリ
+            embedding: 埋め込みベクトル
+
+        Returns:
+            np.ndarray: 登録した読み取り専用の埋め込みベクトル
+        """
+        embedding = np.array(embedding, dtype=np.float32)
+        embedding.setflags(write=False)
+        key = self.make_key(model_name, query)
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return embedding
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict[str, float]:
+        """ヒット数・ミス数・ヒット率などの統計情報を返す"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def clear(self) -> None:
+        """キャッシュを空にする"""
+        with self._lock:
+            self._entries.clear()
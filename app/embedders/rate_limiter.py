@@ -0,0 +1,70 @@
+import threading
+import time
+from typing import Callable, Optional
+
+
+class TokenBucket:
+    """スレッドセーフなトークンバケット方式のレートリミッター"""
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        """
+        Args:
+            rate: 1秒あたりに補充されるトークン数
+            capacity: バケットの最大トークン数（省略時はrateと同じ）
+            clock: 現在時刻を返す関数（テスト用に差し替え可能）
+            sleep: 待機関数（テスト用に差し替え可能）
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        elapsed = now - self._updated_at
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated_at = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """
+        トークンの取得を試みる
+
+        Args:
+            tokens: 取得するトークン数
+
+        Returns:
+            float: 取得できた場合は0、できなかった場合は必要な待ち時間（秒）
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """
+        トークンが取得できるまで待機する
+
+        Args:
+            tokens: 取得するトークン数
+        """
+        if tokens > self.capacity:
+            raise ValueError("tokens must not exceed bucket capacity")
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0.0:
+                return
+            self._sleep(wait)
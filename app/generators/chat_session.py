@@ -0,0 +1,292 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import (
+    CHAT_HISTORY_TURNS,
+    CHAT_SUMMARY_CHARS,
+    CHAT_TOPIC_SIMILARITY,
+    CHAT_WORKING_SET_SIZE,
+)
+from app.generators.generator import Generator
+from app.generators.response_stream import ResponseStream
+from app.utils.metrics import count, stage
+
+
+class ChatSession:
+    """
+    履歴を踏まえて追加の質問に答える会話セッション
+
+    直近のやり取りはGeminiのマルチターンチャット（start_chat/send_message）で保持し、
+    各ターンでは質問と、まだ送っていない検索結果だけを送る。話題が変わらない追加の
+    質問では検索を省略し、既に送った検索結果（作業セット）をそのまま使う。
+    履歴が上限を超えると古いやり取りを要約にまとめ、要約と作業セットを先頭に置いて
+    チャットを作り直す。1つのセッションを複数のスレッドから同時に使うことはできない。
+    """
+
+    def __init__(
+        self,
+        generator: Generator,
+        max_turns: int = CHAT_HISTORY_TURNS,
+        topic_similarity: float = CHAT_TOPIC_SIMILARITY,
+        working_set_size: int = CHAT_WORKING_SET_SIZE,
+        summary_chars: int = CHAT_SUMMARY_CHARS
+    ):
+        """
+        Args:
+            generator: 検索器・回答生成モデル・コンテキストの組み立て方を提供するGenerator
+            max_turns: そのまま保持するやり取りの最大数（超えた分は要約にまとめる）
+            topic_similarity: 追加の質問を同じ話題とみなすクエリ埋め込みの類似度の下限
+            working_set_size: 再利用する検索済みチャンクの最大数
+            summary_chars: 要約に残す1回の回答の最大文字数
+        """
+        if max_turns <= 0:
+            raise ValueError("max_turns must be positive")
+        self.generator = generator
+        self.retriever = generator.retriever
+        self.max_turns = max_turns
+        self.topic_similarity = topic_similarity
+        self.working_set_size = working_set_size
+        self.summary_chars = summary_chars
+        self.turns: List[Dict[str, str]] = []
+        self.summary: List[str] = []
+        self.working_set: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.stats = {"turns": 0, "retrievals": 0, "reused": 0, "chunks_sent": 0, "restarts": 0}
+        self._topic_embedding: Optional[np.ndarray] = None
+        self._topic_docs: List[Dict[str, Any]] = []
+        self._collection_version: Any = None
+        self._chat: Optional[Any] = None
+        # チャットを作成したモデル（固定部分のキャッシュが作り直されたらチャットも作り直す）
+        self._chat_model: Optional[Any] = None
+        # 現在のチャットに本文を送ったチャンクのID
+        self._sent_ids: set = set()
+        # 送信に失敗した、またはストリーミングの途中で終わったターンがあればチャットを作り直す
+        self._incomplete = False
+
+    def ask(self, query: str) -> Dict[str, Any]:
+        """
+        質問に対する回答を生成
+
+        Args:
+            query: ユーザーの質問
+
+        Returns:
+            Dict[str, Any]: 回答（answer）・参考文書の情報（sources）・
+                検索を省略して作業セットを再利用したか（reused_context）
+        """
+        message, docs, reused, new_ids = self._prepare(query)
+        with stage("generate", mode="chat"):
+            try:
+                response = self._chat.send_message(message)
+                answer = response.text
+            except Exception:
+                # 送信に失敗したターンがチャットに残っている可能性があるため作り直す
+                self._incomplete = True
+                raise
+        self._mark_sent(new_ids)
+        self.generator.count_generation(message, answer, getattr(response, "usage_metadata", None))
+        self._record(query, answer)
+        return {
+            "answer": answer,
+            "sources": self.generator.prompt_template.format_sources(docs),
+            "reused_context": reused,
+        }
+
+    def ask_stream(self, query: str) -> ResponseStream:
+        """
+        質問に対する回答を少しずつ生成
+
+        最後まで読み込んだ時点でやり取りが履歴に追加される。
+
+        Args:
+            query: ユーザーの質問
+
+        Returns:
+            ResponseStream: 回答の差分テキストを返すイテレータ
+        """
+        started_at = time.perf_counter()
+        message, docs, _, new_ids = self._prepare(query)
+        self._incomplete = True
+        response = self._chat.send_message(message, stream=True)
+
+        def on_complete(result: Dict[str, str]) -> None:
+            self._incomplete = False
+            self._mark_sent(new_ids)
+            self.generator.count_generation(message, result["answer"])
+            self._record(query, result["answer"])
+
+        return ResponseStream(
+            self.generator.iter_text(response),
+            self.generator.prompt_template.format_sources(docs),
+            started_at=started_at,
+            on_complete=on_complete
+        )
+
+    def reset(self) -> None:
+        """履歴・要約・作業セットを消去して新しい会話を始める"""
+        self.turns.clear()
+        self.summary.clear()
+        self._clear_working_set()
+        self._chat = None
+
+    def _prepare(self, query: str) -> Tuple[str, List[Dict[str, Any]], bool, List[str]]:
+        """
+        このターンで送るメッセージを作成
+
+        Returns:
+            (送信するメッセージ, 参考にする検索結果, 検索を省略したか, 本文を初めて送るチャンクのID)
+        """
+        version = self.retriever.collection_version
+        if version != self._collection_version:
+            # 文書が更新された場合、送ったチャンクは古い可能性がある
+            self._clear_working_set()
+            self._collection_version = version
+            self._chat = None
+
+        query_embedding = self._normalize(self.retriever.embed_query(query))
+        reused = self._is_on_topic(query_embedding)
+        if reused:
+            docs = self._topic_docs
+            self._topic_embedding = self._normalize(self._topic_embedding + query_embedding)
+            self.stats["reused"] += 1
+        else:
+            docs = self.retriever.retrieve(query, query_embedding=query_embedding)
+            self._topic_embedding = query_embedding
+            self._topic_docs = docs
+            self.stats["retrievals"] += 1
+        count("chat_turns_total", context="reused" if reused else "retrieved")
+        self._add_to_working_set(docs)
+
+        model, prefix = self.generator.resolve_model()
+        if self._chat is None or self._incomplete or model is not self._chat_model:
+            # 作り直したチャットには作業セット全体が含まれる
+            self._restart_chat(model, prefix)
+        new_docs = [doc for doc in docs if doc.get("id") not in self._sent_ids]
+        message, new_ids = self._format_message(query, new_docs)
+        return message, docs, reused, new_ids
+
+    def _mark_sent(self, ids: List[str]) -> None:
+        """送信に成功したチャンクを送信済みとして記録"""
+        self._sent_ids.update(ids)
+        self.stats["chunks_sent"] += len(ids)
+
+    def _is_on_topic(self, query_embedding: np.ndarray) -> bool:
+        """追加の質問が直前に検索した話題から変わっていないか"""
+        if self._topic_embedding is None or not self._topic_docs:
+            return False
+        return float(self._topic_embedding @ query_embedding) >= self.topic_similarity
+
+    def _add_to_working_set(self, docs: List[Dict[str, Any]]) -> None:
+        """検索結果を作業セットに追加し、上限を超えた分は最も使われていないものから削除"""
+        for doc in docs:
+            id_ = doc.get("id")
+            if id_ is None:
+                continue
+            self.working_set[id_] = doc
+            self.working_set.move_to_end(id_)
+        while len(self.working_set) > self.working_set_size:
+            self.working_set.popitem(last=False)
+
+    def _clear_working_set(self) -> None:
+        self.working_set.clear()
+        self._sent_ids.clear()
+        self._topic_embedding = None
+        self._topic_docs = []
+
+    def _record(self, query: str, answer: str) -> None:
+        """
+        やり取りを履歴に追加
+
+        上限を超えた場合は古い半分を要約にまとめ、次のターンでチャットを作り直す。
+        """
+        self.turns.append({"query": query, "answer": answer})
+        self.stats["turns"] += 1
+        if len(self.turns) > self.max_turns:
+            condensed = len(self.turns) - self.max_turns // 2
+            self.summary.extend(self._condense(turn) for turn in self.turns[:condensed])
+            # 要約も古いものから捨てて長さを抑える
+            del self.summary[:-self.max_turns * 2]
+            del self.turns[:condensed]
+            self._chat = None
+
+    def _condense(self, turn: Dict[str, str]) -> str:
+        """1回のやり取りを1行の要約にする"""
+        answer = " ".join(turn["answer"].split())
+        if len(answer) > self.summary_chars:
+            answer = answer[:self.summary_chars] + "…"
+        return f"- 質問: {turn['query']} / 回答: {answer}"
+
+    def _restart_chat(self, model: Any, prefix: str) -> None:
+        """
+        要約・作業セット・直近のやり取りを履歴としてチャットを作り直す
+
+        Args:
+            model: チャットに使うモデル
+            prefix: 先頭に付けるプロンプトの固定部分（キャッシュを使う場合は空）
+        """
+        history = []
+        primer, packed_ids = self._format_primer()
+        primer = prefix + primer
+        if primer:
+            history.append({"role": "user", "parts": [primer]})
+            history.append({"role": "model", "parts": ["承知しました。"]})
+        for turn in self.turns:
+            history.append({"role": "user", "parts": [self._format_message(turn["query"], [])[0]]})
+            history.append({"role": "model", "parts": [turn["answer"]]})
+        self._chat = model.start_chat(history=history)
+        self._chat_model = model
+        # 重複の除去やトークン数の上限で文脈から外れたチャンクは、次に使うときに送る
+        self._sent_ids = set(packed_ids)
+        self._incomplete = False
+        self.stats["restarts"] += 1
+
+    def _format_primer(self) -> Tuple[str, List[str]]:
+        """
+        チャットの先頭に置く指示・会話の要約・作業セットの文脈を作成
+
+        Returns:
+            (チャットの先頭に置くテキスト, 文脈に含めたチャンクのID)
+        """
+        if not self.summary and not self.working_set:
+            return "", []
+        parts = [
+            "以下の文脈と会話の要約に基づいて、続く質問に答えてください。\n"
+            "文脈が質問に関連していない場合は、その旨を伝えてください。"
+        ]
+        packed_ids: List[str] = []
+        if self.summary:
+            parts.append("これまでの会話の要約:\n" + "\n".join(self.summary))
+        if self.working_set:
+            # 最近使ったチャンクほどトークン数の上限に残りやすいよう先に並べる
+            context, packed_ids = self._build_context(list(reversed(self.working_set.values())))
+            parts.append("文脈:\n" + context)
+        return "\n\n".join(parts), packed_ids
+
+    def _format_message(self, query: str, new_docs: List[Dict[str, Any]]) -> Tuple[str, List[str]]:
+        """
+        質問と、まだ送っていない検索結果の文脈からメッセージを作成
+
+        Returns:
+            (送信するメッセージ, 文脈に含めたチャンクのID)
+        """
+        if not new_docs:
+            return f"質問: {query}", []
+        context, packed_ids = self._build_context(new_docs)
+        return f"""以下の文脈を追加します。
+
+文脈:
+{context}
+
+質問: {query}""", packed_ids
+
+    def _build_context(self, docs: List[Dict[str, Any]]) -> Tuple[str, List[str]]:
+        with stage("prompt_build", mode="chat"):
+            context, _, packed_ids = self.generator.context_builder.build(docs)
+        return context, packed_ids
+
+    @staticmethod
+    def _normalize(vector: Any) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        return array / max(float(np.linalg.norm(array)), 1e-12)
@@ -0,0 +1,187 @@
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.text import estimate_tokens
+
+# MinHashで使うハッシュ関数の法（メルセンヌ素数 2^31 - 1）
+_MERSENNE_PRIME = (1 << 31) - 1
+
+
+class ContextBuilder:
+    """
+    検索結果からプロンプトに入れるコンテキストを組み立てるクラス
+
+    同じファイルの重複・隣接するチャンクを1つにまとめ、MinHashで
+    ほぼ同じ内容のチャンクを除いたうえで、検索順位の高いものから
+    トークン数の上限に収まるだけ詰める。
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 4000,
+        dedup_threshold: Optional[float] = 0.8,
+        shingle_size: int = 5,
+        num_perm: int = 64,
+        token_counter: Callable[[str], int] = estimate_tokens
+    ):
+        """
+        Args:
+            token_budget: コンテキストのトークン数の上限（0以下で無制限）
+            dedup_threshold: 重複とみなす推定Jaccard類似度の下限（Noneで重複除去しない）
+            shingle_size: MinHashに使う文字shingleの長さ
+            num_perm: MinHashのハッシュ関数の数
+            token_counter: トークン数を数える関数
+        """
+        self.token_budget = token_budget
+        self.dedup_threshold = dedup_threshold
+        self.shingle_size = shingle_size
+        self.token_counter = token_counter
+        rng = np.random.default_rng(0)
+        self._hash_a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._hash_b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def build(self, docs: List[Dict[str, Any]]) -> Tuple[str, Dict[str, int], List[str]]:
+        """
+        コンテキストを組み立てる
+
+        Args:
+            docs: 検索順位の高い順の検索結果
+
+        Returns:
+            Tuple[str, Dict[str, int], List[str]]: コンテキスト、統計情報（元のトークン数、
+                コンテキストのトークン数、削減したトークン数、統合・除去したチャンク数）、
+                コンテキストに含めたチャンクのID（重複として除いたチャンクや上限で
+                入らなかったチャンクのIDは含まない）
+        """
+        original_tokens = self.token_counter("\n".join(doc["text"] for doc in docs))
+        merged = self._merge(docs)
+        unique = self._deduplicate(merged)
+        packed = self._pack(unique)
+
+        context = "\n".join(passage["text"] for passage in packed)
+        context_tokens = self.token_counter(context)
+        packed_ids = [id_ for passage in packed for id_ in passage["ids"]]
+        return context, {
+            "chunks": len(docs),
+            "chunks_merged": len(docs) - len(merged),
+            "duplicates_dropped": len(merged) - len(unique),
+            "passages_dropped": len(unique) - len(packed),
+            "original_tokens": original_tokens,
+            "context_tokens": context_tokens,
+            "tokens_saved": original_tokens - context_tokens,
+        }, packed_ids
+
+    def _merge(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        同じファイルで範囲が重なる・隣接するチャンクを結合
+
+        Returns:
+            List[Dict[str, Any]]: text, rank（構成するチャンクの最上位の順位）,
+                ids（構成するチャンクのID）を持つ文章のリスト
+        """
+        passages = []
+        groups: Dict[str, List[Tuple[int, int, str, List[str]]]] = {}
+        for rank, doc in enumerate(docs):
+            metadata = doc.get("metadata") or {}
+            file_key = metadata.get("file_path")
+            start = metadata.get("start_index")
+            ids = [doc["id"]] if doc.get("id") is not None else []
+            if file_key is None or not isinstance(start, int) or start < 0:
+                passages.append({"text": doc["text"], "rank": rank, "ids": ids})
+                continue
+            groups.setdefault(file_key, []).append((start, rank, doc["text"], ids))
+
+        for chunks in groups.values():
+            chunks.sort(key=lambda chunk: chunk[:2])
+            start, rank, text, ids = chunks[0]
+            for next_start, next_rank, next_text, next_ids in chunks[1:]:
+                end = start + len(text)
+                if next_start <= end:
+                    # 重なっている部分を除いて後ろにつなげる
+                    text += next_text[end - next_start:]
+                    rank = min(rank, next_rank)
+                    ids = ids + next_ids
+                else:
+                    passages.append({"text": text, "rank": rank, "ids": ids})
+                    start, rank, text, ids = next_start, next_rank, next_text, next_ids
+            passages.append({"text": text, "rank": rank, "ids": ids})
+
+        passages.sort(key=lambda passage: passage["rank"])
+        return passages
+
+    def _deduplicate(self, passages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        順位の高い文章とほぼ同じ内容の文章を除く
+
+        推定Jaccard係数がしきい値以上の場合に加えて、文章の大部分が
+        既に選んだ文章に含まれている場合（推定包含率がしきい値以上）も除く。
+        """
+        if self.dedup_threshold is None:
+            return passages
+        kept, signatures = [], []
+        for passage in passages:
+            signature, size = self._minhash(passage["text"])
+            if any(
+                self._is_duplicate(signature, size, other, other_size)
+                for other, other_size in signatures
+            ):
+                continue
+            kept.append(passage)
+            signatures.append((signature, size))
+        return kept
+
+    def _is_duplicate(
+        self,
+        signature: np.ndarray,
+        size: int,
+        other: np.ndarray,
+        other_size: int
+    ) -> bool:
+        jaccard = float(np.mean(signature == other))
+        # |A∩B| = J(|A|+|B|)/(1+J) から、この文章のうち既存の文章に含まれる割合を推定
+        containment = jaccard * (size + other_size) / ((1.0 + jaccard) * size)
+        return max(jaccard, containment) >= self.dedup_threshold
+
+    def _minhash(self, text: str) -> Tuple[np.ndarray, int]:
+        """文字shingleの集合のMinHashシグネチャと集合の大きさを計算"""
+        text = " ".join(text.split())
+        size = self.shingle_size
+        shingles = {text[i:i + size] for i in range(max(len(text) - size + 1, 1))}
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        )
+        values = (np.outer(hashes, self._hash_a) + self._hash_b) % _MERSENNE_PRIME
+        return values.min(axis=0), len(shingles)
+
+    def _pack(self, passages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """順位の高い文章から上限トークン数に収まるだけ選ぶ"""
+        if self.token_budget <= 0:
+            return passages
+        packed = []
+        used = 0
+        for passage in passages:
+            # 区切りの改行の分も数える
+            tokens = self.token_counter(passage["text"]) + (1 if packed else 0)
+            if used + tokens <= self.token_budget:
+                packed.append(passage)
+                used += tokens
+            elif not packed:
+                # 最上位の文章だけで上限を超える場合は、上限に収まるよう切り詰める
+                packed.append({**passage, "text": self._truncate(passage["text"])})
+                used = self.token_budget
+        return packed
+
+    def _truncate(self, text: str) -> str:
+        """上限トークン数に収まる長さまでテキストを切り詰める"""
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.token_counter(text[:middle]) <= self.token_budget:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low]
@@ -0,0 +1,189 @@
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from app.config import (
+    CONTEXT_CACHE_MIN_TOKENS,
+    CONTEXT_CACHE_REFRESH_MARGIN,
+    CONTEXT_CACHE_TTL,
+    GENERATION_MODEL,
+    STATIC_CONTEXT_FILES,
+    SYSTEM_INSTRUCTION,
+)
+from app.utils.metrics import count
+from app.utils.text import estimate_tokens
+
+
+class ContextCache:
+    """
+    すべての質問で共通のプロンプトの固定部分（システム指示と常に含める参考文書）を
+    プロバイダー側にキャッシュするクラス
+
+    固定部分からキャッシュを1つ作成して使い回し、有効期限が近づくと期限を延長する。
+    期限切れの場合は作り直す。バックエンドがない場合、固定部分が短すぎる場合、
+    作成に失敗した場合は、キャッシュを使わず固定部分をプロンプトの先頭に含める。
+    スレッドセーフ。
+    """
+
+    def __init__(
+        self,
+        backend: Optional[Any],
+        model_name: str = GENERATION_MODEL,
+        system_instruction: str = "",
+        documents: Optional[List[str]] = None,
+        ttl: float = CONTEXT_CACHE_TTL,
+        refresh_margin: float = CONTEXT_CACHE_REFRESH_MARGIN,
+        min_tokens: int = CONTEXT_CACHE_MIN_TOKENS,
+        clock: Callable[[], float] = time.time
+    ):
+        """
+        Args:
+            backend: キャッシュの作成・延長・削除を行うバックエンド（Noneでキャッシュしない）
+            model_name: 回答生成モデル名
+            system_instruction: システム指示
+            documents: 常にプロンプトに含める参考文書のテキスト
+            ttl: キャッシュの有効期間（秒、0以下でキャッシュしない）
+            refresh_margin: 有効期限の何秒前に期限を延長するか
+            min_tokens: キャッシュする固定部分の最小の推定トークン数
+            clock: 時刻を返す関数
+        """
+        self.backend = backend
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.documents = list(documents or [])
+        self.ttl = ttl
+        self.refresh_margin = min(refresh_margin, ttl / 2)
+        self.min_tokens = min_tokens
+        self.clock = clock
+        self._handle: Optional[Any] = None
+        self._model: Optional[Any] = None
+        self._expires_at = 0.0
+        # 作成に失敗した後、再び作成を試みる時刻
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.creates = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    @property
+    def contents(self) -> List[str]:
+        """キャッシュする内容（参考文書）"""
+        if not self.documents:
+            return []
+        return ["参考資料:\n\n" + "\n\n".join(self.documents)]
+
+    @property
+    def inline_prefix(self) -> str:
+        """キャッシュを使わない場合にプロンプトの先頭に付ける固定部分"""
+        parts = [self.system_instruction] if self.system_instruction else []
+        parts.extend(self.contents)
+        return "".join(f"{part}\n\n" for part in parts)
+
+    @property
+    def enabled(self) -> bool:
+        """プロバイダー側のキャッシュを使う設定か"""
+        return (
+            self.backend is not None
+            and self.ttl > 0
+            and estimate_tokens(self.inline_prefix) >= self.min_tokens
+        )
+
+    def get_model(self) -> Optional[Any]:
+        """
+        キャッシュを参照する回答生成モデルを取得
+
+        キャッシュがなければ作成し、有効期限が近ければ期限を延長する。
+
+        Returns:
+            Optional[Any]: キャッシュを参照するモデル（キャッシュを使えない場合はNone）
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            now = self.clock()
+            if self._handle is not None and now < self._expires_at - self.refresh_margin:
+                self.hits += 1
+                count("cache_hits_total", cache="context")
+                return self._model
+            if self._handle is None and now < self._retry_at:
+                return None
+            count("cache_misses_total", cache="context")
+            try:
+                if self._handle is not None and now < self._expires_at:
+                    self.backend.refresh(self._handle, self.ttl)
+                    self.refreshes += 1
+                else:
+                    self._handle = self.backend.create(
+                        self.model_name,
+                        self.system_instruction or None,
+                        self.contents,
+                        self.ttl
+                    )
+                    self._model = self.backend.model_for(self._handle)
+                    self.creates += 1
+                count("api_calls_total", api="context_cache")
+            except Exception:
+                # 次に試すまでの間は固定部分をプロンプトに含めて送る
+                count("api_errors_total", api="context_cache")
+                self.failures += 1
+                self._handle = self._model = None
+                self._retry_at = now + self.refresh_margin
+                return None
+            self._expires_at = now + self.ttl
+            return self._model
+
+    def close(self) -> None:
+        """作成したキャッシュを削除"""
+        with self._lock:
+            handle, self._handle, self._model = self._handle, None, None
+        if handle is not None:
+            try:
+                self.backend.delete(handle)
+            except Exception:
+                # 削除できなくても有効期限が切れれば消える
+                pass
+
+    def stats(self) -> Dict[str, float]:
+        """キャッシュの利用回数・作成回数・延長回数・失敗回数を返す"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "creates": self.creates,
+                "refreshes": self.refreshes,
+                "failures": self.failures,
+                "prefix_tokens": estimate_tokens(self.inline_prefix),
+            }
+
+
+def create_context_cache(
+    model_name: str = GENERATION_MODEL,
+    provider_cache: bool = True
+) -> Optional[ContextCache]:
+    """
+    設定（SYSTEM_INSTRUCTION、STATIC_CONTEXT_FILES）からContextCacheを作成
+
+    Args:
+        model_name: 回答生成モデル名
+        provider_cache: Falseのときキャッシュは作成せず、固定部分を毎回プロンプトに含める
+
+    Returns:
+        Optional[ContextCache]: 固定部分がない場合はNone
+    """
+    from app.loaders.document_loader import DocumentLoader
+
+    documents = [DocumentLoader.load_document(Path(path)) for path in STATIC_CONTEXT_FILES]
+    if not SYSTEM_INSTRUCTION and not documents:
+        return None
+    backend = None
+    if provider_cache and CONTEXT_CACHE_TTL > 0:
+        from app.generators.gemini_cache_backend import GeminiContextCacheBackend
+        backend = GeminiContextCacheBackend()
+    return ContextCache(
+        backend,
+        model_name=model_name,
+        system_instruction=SYSTEM_INSTRUCTION,
+        documents=documents
+    )
@@ -0,0 +1,80 @@
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+
+class FakeContextCacheBackend:
+    """
+    テスト用のローカルなコンテキストキャッシュのバックエンド
+
+    GeminiContextCacheBackendと同じ操作を持ち、キャッシュの内容と有効期限をメモリ上に記録する。
+    キャッシュを参照するモデルとして、渡されたモデルをそのまま返す。
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        clock: Callable[[], float] = time.time,
+        fail_create: bool = False
+    ):
+        """
+        Args:
+            model: キャッシュを参照するモデルとして返すモデル（FakeGenerativeModelなど）
+            clock: 有効期限の判定に使う時刻を返す関数
+            fail_create: Trueのときキャッシュの作成でRuntimeErrorを発生させる
+        """
+        self.model = model
+        self.clock = clock
+        self.fail_create = fail_create
+        self.caches: Dict[str, Dict[str, Any]] = {}
+        self.create_count = 0
+        self.refresh_count = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def create(
+        self,
+        model_name: str,
+        system_instruction: Optional[str],
+        contents: List[str],
+        ttl: float
+    ) -> Any:
+        """キャッシュを作成し、nameを持つハンドルを返す"""
+        if self.fail_create:
+            raise RuntimeError("cached content is too small")
+        with self._lock:
+            self.create_count += 1
+            name = f"cachedContents/fake-{next(self._ids)}"
+            self.caches[name] = {
+                "model": model_name,
+                "system_instruction": system_instruction,
+                "contents": list(contents),
+                "expire_time": self.clock() + ttl,
+            }
+        return SimpleNamespace(name=name)
+
+    def refresh(self, handle: Any, ttl: float) -> None:
+        """キャッシュの有効期限を延長（期限切れ・削除済みの場合はKeyError）"""
+        with self._lock:
+            cache = self._get(handle)
+            cache["expire_time"] = self.clock() + ttl
+            self.refresh_count += 1
+
+    def model_for(self, handle: Any) -> Any:
+        """キャッシュを参照するモデルを返す"""
+        with self._lock:
+            self._get(handle)
+        return self.model
+
+    def delete(self, handle: Any) -> None:
+        """キャッシュを削除"""
+        with self._lock:
+            self.caches.pop(handle.name, None)
+
+    def _get(self, handle: Any) -> Dict[str, Any]:
+        cache = self.caches.get(handle.name)
+        if cache is None or cache["expire_time"] <= self.clock():
+            raise KeyError(handle.name)
+        return cache
@@ -0,0 +1,113 @@
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+
+class FakeGenerativeModel:
+    """
+    テストやベンチマーク用のローカル回答生成モデル
+
+    genai.GenerativeModelのgenerate_contentと同じ形のレスポンスを返し、
+    start_chatでマルチターンチャットも模擬する。
+    """
+
+    def __init__(
+        self,
+        answer: Union[str, Callable[[str], str]] = "これはテスト回答です。",
+        latency: float = 0.0,
+        chunk_size: int = 8
+    ):
+        """
+        Args:
+            answer: 返す回答、またはプロンプトから回答を作る関数
+            latency: 1回の呼び出しごとに待機する秒数（APIの遅延を模擬）
+            chunk_size: ストリーミング時に1回で返す文字数
+        """
+        self.answer = answer
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.call_count = 0
+        self.chat_count = 0
+        self.prompts: List[str] = []
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt: str, stream: bool = False, **kwargs):
+        """
+        プロンプトに対する回答を生成
+
+        Args:
+            prompt: 入力プロンプト
+            stream: Trueのとき回答を少しずつ返すイテレータを返す
+
+        Returns:
+            textを持つレスポンス、またはそのイテレータ
+        """
+        with self._lock:
+            self.call_count += 1
+            self.prompts.append(prompt)
+        if self.latency:
+            time.sleep(self.latency)
+        text = self.answer(prompt) if callable(self.answer) else self.answer
+        if stream:
+            return self._stream(text)
+        return SimpleNamespace(text=text)
+
+    def start_chat(self, history: Optional[List[Dict[str, Any]]] = None) -> "FakeChatSession":
+        """
+        マルチターンチャットを開始
+
+        Args:
+            history: これまでのやり取り（{"role", "parts"}のリスト）
+
+        Returns:
+            FakeChatSession: genai.ChatSessionと同じ形のチャット
+        """
+        with self._lock:
+            self.chat_count += 1
+        return FakeChatSession(self, history)
+
+    def _stream(self, text: str):
+        for i in range(0, len(text), self.chunk_size):
+            yield SimpleNamespace(text=text[i:i + self.chunk_size])
+
+
+class FakeChatSession:
+    """
+    FakeGenerativeModelのマルチターンチャット
+
+    モデルのpromptsには送信したメッセージだけが記録され、履歴はhistoryに残る。
+    """
+
+    def __init__(self, model: FakeGenerativeModel, history: Optional[List[Dict[str, Any]]] = None):
+        self.model = model
+        self.history: List[Dict[str, Any]] = list(history or [])
+
+    def send_message(self, content: str, stream: bool = False, **kwargs):
+        """
+        メッセージを送信して回答を受け取る
+
+        Args:
+            content: 送信するメッセージ
+            stream: Trueのとき回答を少しずつ返すイテレータを返す
+
+        Returns:
+            textを持つレスポンス、またはそのイテレータ
+        """
+        response = self.model.generate_content(content, stream=stream)
+        if stream:
+            return self._stream(content, response)
+        self._append(content, response.text)
+        return response
+
+    def _stream(self, content: str, chunks: Iterator[Any]) -> Iterator[Any]:
+        # 最後まで読み込んだ時点で履歴に追加する（genai.ChatSessionと同じ）
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk.text)
+            yield chunk
+        self._append(content, "".join(parts))
+
+    def _append(self, content: str, answer: str) -> None:
+        self.history.append({"role": "user", "parts": [content]})
+        self.history.append({"role": "model", "parts": [answer]})
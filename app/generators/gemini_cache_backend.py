@@ -0,0 +1,67 @@
+from datetime import timedelta
+from typing import Any, List, Optional
+
+from app.config import get_google_api_key
+
+
+class GeminiContextCacheBackend:
+    """google.generativeaiのcaching.CachedContentでプロンプトの固定部分をキャッシュするバックエンド"""
+
+    def __init__(self):
+        """
+        Raises:
+            ValueError: GOOGLE_API_KEYが設定されていない場合
+        """
+        self._api_key = get_google_api_key()
+        self._genai = None
+
+    def _client(self):
+        """google.generativeaiは読み込みが重いため、最初のAPI呼び出し時にインポートする"""
+        if self._genai is None:
+            import google.generativeai as genai
+            genai.configure(api_key=self._api_key)
+            self._genai = genai
+        return self._genai
+
+    def create(
+        self,
+        model_name: str,
+        system_instruction: Optional[str],
+        contents: List[str],
+        ttl: float
+    ) -> Any:
+        """
+        キャッシュを作成
+
+        Args:
+            model_name: キャッシュを使うモデル名（キャッシュは作成したモデルでのみ使える）
+            system_instruction: システム指示
+            contents: キャッシュする内容
+            ttl: 有効期間（秒）
+
+        Returns:
+            Any: 作成したcaching.CachedContent
+        """
+        self._client()
+        from google.generativeai import caching
+
+        name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        return caching.CachedContent.create(
+            model=name,
+            display_name="rag-static-context",
+            system_instruction=system_instruction,
+            contents=contents or None,
+            ttl=timedelta(seconds=ttl)
+        )
+
+    def refresh(self, handle: Any, ttl: float) -> None:
+        """キャッシュの有効期限を今からttl秒後まで延長"""
+        handle.update(ttl=timedelta(seconds=ttl))
+
+    def model_for(self, handle: Any) -> Any:
+        """キャッシュを参照して回答を生成するモデルを作成"""
+        return self._client().GenerativeModel.from_cached_content(cached_content=handle)
+
+    def delete(self, handle: Any) -> None:
+        """キャッシュを削除"""
+        handle.delete()
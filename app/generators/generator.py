@@ -1,53 +1,321 @@
-import os
-from typing import Dict, List, Any
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
-import google.generativeai as genai
-
-from app.config import GOOGLE_API_KEY
+from app.config import (
+    BATCH_MAX_WORKERS,
+    CONTEXT_DEDUP_THRESHOLD,
+    CONTEXT_TOKEN_BUDGET,
+    GENERATION_MODEL,
+    get_google_api_key,
+)
+from app.generators.context_builder import ContextBuilder
+from app.generators.context_cache import ContextCache
 from app.generators.prompt_template import PromptTemplate
+from app.generators.response_cache import ResponseCache
+from app.generators.response_stream import ResponseStream
 from app.retrievers.retriever import Retriever
+from app.utils.metrics import count, stage
+from app.utils.text import estimate_tokens
 
 
 class Generator:
     """Gemini APIを使用した回答生成クラス"""
 
-    def __init__(self, retriever: Retriever):
+    def __init__(
+        self,
+        retriever: Retriever,
+        model: Optional[Any] = None,
+        response_cache: Optional[ResponseCache] = None,
+        model_name: str = GENERATION_MODEL,
+        context_builder: Optional[ContextBuilder] = None,
+        context_cache: Optional[ContextCache] = None
+    ):
         """
         Args:
             retriever: 文書検索用のRetrieverインスタンス
+            model: 回答生成モデル（省略時は最初の生成時にGeminiのモデルを作成）
+            response_cache: 回答キャッシュ（省略時はキャッシュしない）
+            model_name: Geminiのモデル名
+            context_builder: コンテキストの組み立て方（省略時は設定のトークン数上限を使用）
+            context_cache: システム指示など全質問で共通の固定部分とそのキャッシュ（省略時は固定部分なし）
+
+        Raises:
+            ValueError: modelを省略し、GOOGLE_API_KEYが設定されていない場合
         """
         self.retriever = retriever
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEY environment variable is not set")
-        genai.configure(api_key=api_key)
-        
-        # 利用可能なモデルを確認
-        for m in genai.list_models():
-            print(f"Model: {m.name}")
-            print(f"Display name: {m.display_name}")
-            print(f"Description: {m.description}")
-            print("---")
-        
-        self.model = genai.GenerativeModel('gemini-1.5-pro')
+        self.model_name = model_name
+        if model is None:
+            # キーの有無だけ先に確認し、クライアントの作成は最初の呼び出しまで遅らせる
+            get_google_api_key()
+        self._model = model
         self.prompt_template = PromptTemplate()
+        self.response_cache = response_cache
+        self.context_builder = context_builder or ContextBuilder(
+            token_budget=CONTEXT_TOKEN_BUDGET,
+            dedup_threshold=CONTEXT_DEDUP_THRESHOLD
+        )
+        self.context_cache = context_cache
+        # コンテキストの組み立てで削減したトークン数の累計
+        self.context_stats = {"queries": 0, "original_tokens": 0, "context_tokens": 0, "tokens_saved": 0}
+        self.last_context_stats: Optional[Dict[str, int]] = None
+        self._stats_lock = threading.Lock()
+
+    @property
+    def model(self) -> Any:
+        """回答生成モデル（google.generativeaiは読み込みが重いため初回アクセス時に作成）"""
+        if self._model is None:
+            import google.generativeai as genai
+
+            genai.configure(api_key=get_google_api_key())
+            self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    def resolve_model(self) -> Tuple[Any, str]:
+        """
+        回答生成に使うモデルと、プロンプトの先頭に付ける固定部分を決める
+
+        固定部分がキャッシュされていればキャッシュを参照するモデルを使い、固定部分は送らない。
+
+        Returns:
+            Tuple[Any, str]: モデルとプロンプトの先頭に付ける文字列
+        """
+        if self.context_cache is None:
+            return self.model, ""
+        cached_model = self.context_cache.get_model()
+        if cached_model is not None:
+            return cached_model, ""
+        return self.model, self.context_cache.inline_prefix
 
-    def generate_response(self, query: str) -> str:
+    def generate_response(self, query: str) -> Dict[str, str]:
         """
         質問に対する回答を生成
 
+        回答キャッシュが設定されている場合は、類似した質問や同じ検索結果に対する
+        過去の回答を再利用する。
+
         Args:
             query: ユーザーの質問
 
         Returns:
-            str: 生成された回答
-        """
-        # 関連文書の検索
-        docs = self.retriever.retrieve(query)
-        
-        # プロンプトの作成
-        context = "\n".join([doc["text"] for doc in docs])
-        prompt = f"""以下の文脈に基づいて質問に答えてください。
+            Dict[str, str]: 回答（answer）と参考文書の情報（sources）
+        """
+        cached, docs, cache_key = self._retrieve(query)
+        if cached is not None:
+            return cached
+        return self._generate(query, docs, cache_key)
+
+    def generate_batch(
+        self,
+        queries: List[str],
+        max_workers: int = BATCH_MAX_WORKERS
+    ) -> List[Dict[str, str]]:
+        """
+        複数の質問に対する回答をまとめて生成
+
+        質問の埋め込みと検索はバッチでまとめて実行し、回答の生成は
+        最大max_workers件を並行に実行する。
+
+        Args:
+            queries: ユーザーの質問のリスト
+            max_workers: 同時に実行する回答生成の最大数
+
+        Returns:
+            List[Dict[str, str]]: 質問と同じ順序の結果。成功した場合はanswerとsources、
+                失敗した場合はerrorを含む
+        """
+        if not queries:
+            return []
+        try:
+            retrieved = self._retrieve_batch(queries)
+        except Exception as e:
+            return [{"error": str(e)} for _ in queries]
+
+        def generate(item: Tuple[str, tuple]) -> Dict[str, str]:
+            query, (cached, docs, cache_key) = item
+            if cached is not None:
+                return cached
+            try:
+                return self._generate(query, docs, cache_key)
+            except Exception as e:
+                return {"error": str(e)}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(queries)))) as executor:
+            return list(executor.map(generate, zip(queries, retrieved)))
+
+    def _generate(
+        self,
+        query: str,
+        docs: List[Dict[str, Any]],
+        cache_key: Optional[tuple]
+    ) -> Dict[str, str]:
+        """検索結果から回答を生成し、キャッシュに登録"""
+        prompt, _ = self._build_prompt(query, docs)
+        model, prefix = self.resolve_model()
+        prompt = prefix + prompt
+        with stage("generate"):
+            response = model.generate_content(prompt)
+            answer = response.text
+        self.count_generation(prompt, answer, getattr(response, "usage_metadata", None))
+        result = {
+            "answer": answer,
+            "sources": self.prompt_template.format_sources(docs),
+        }
+        self._store(query, cache_key, result)
+        return result
+
+    def stream_response(self, query: str) -> ResponseStream:
+        """
+        質問に対する回答を少しずつ生成
+
+        Args:
+            query: ユーザーの質問
+
+        Returns:
+            ResponseStream: 回答の差分テキストを返すイテレータ。
+                最初のトークンまでの時間と全体の所要時間も記録される
+        """
+        started_at = time.perf_counter()
+        cached, docs, cache_key = self._retrieve(query)
+        if cached is not None:
+            return ResponseStream([cached["answer"]], cached["sources"], started_at=started_at)
+
+        prompt, context_stats = self._build_prompt(query, docs)
+        model, prefix = self.resolve_model()
+        prompt = prefix + prompt
+        response = model.generate_content(prompt, stream=True)
+
+        def on_complete(result: Dict[str, str]) -> None:
+            self.count_generation(prompt, result["answer"])
+            self._store(query, cache_key, result)
+
+        return ResponseStream(
+            self.iter_text(response),
+            self.prompt_template.format_sources(docs),
+            started_at=started_at,
+            on_complete=on_complete,
+            context_stats=context_stats
+        )
+
+    def _retrieve(
+        self,
+        query: str
+    ) -> Tuple[Optional[Dict[str, str]], List[Dict[str, Any]], Optional[tuple]]:
+        """
+        関連文書を検索し、キャッシュ済みの回答があればそれも返す
+
+        Returns:
+            (キャッシュされた回答またはNone, 検索結果, キャッシュ登録用のキー)
+        """
+        cache = self.response_cache
+        if cache is None:
+            return None, self.retriever.retrieve(query), None
+
+        # 類似した質問の回答があれば検索も省略する
+        query_embedding = self.retriever.embed_query(query)
+        version = self.retriever.collection_version
+        cached = cache.get_semantic(query_embedding, version)
+        if cached is not None:
+            count("cache_hits_total", cache="response")
+            return cached, [], None
+
+        docs = self.retriever.retrieve(query, query_embedding=query_embedding)
+        chunk_ids = [doc.get("id") for doc in docs]
+        cached = cache.get_exact(query, chunk_ids, version)
+        count("cache_hits_total" if cached is not None else "cache_misses_total", cache="response")
+        return cached, docs, (chunk_ids, query_embedding, version)
+
+    def _retrieve_batch(
+        self,
+        queries: List[str]
+    ) -> List[Tuple[Optional[Dict[str, str]], List[Dict[str, Any]], Optional[tuple]]]:
+        """
+        _retrieveの複数質問版（埋め込みと検索をまとめて実行）
+
+        Returns:
+            質問と同じ順序の（キャッシュされた回答またはNone, 検索結果, キャッシュ登録用のキー）
+        """
+        cache = self.response_cache
+        if cache is None:
+            return [(None, docs, None) for docs in self.retriever.retrieve_batch(queries)]
+
+        query_embeddings = self.retriever.embed_queries(queries)
+        version = self.retriever.collection_version
+        results: List[Any] = [None] * len(queries)
+        pending = []
+        for i, query_embedding in enumerate(query_embeddings):
+            cached = cache.get_semantic(query_embedding, version)
+            if cached is not None:
+                results[i] = (cached, [], None)
+            else:
+                pending.append(i)
+
+        docs_list = self.retriever.retrieve_batch(
+            [queries[i] for i in pending],
+            query_embeddings=[query_embeddings[i] for i in pending]
+        ) if pending else []
+        for i, docs in zip(pending, docs_list):
+            chunk_ids = [doc.get("id") for doc in docs]
+            cached = cache.get_exact(queries[i], chunk_ids, version)
+            results[i] = (cached, docs, (chunk_ids, query_embeddings[i], version))
+        return results
+
+    def _store(self, query: str, cache_key: Optional[tuple], result: Dict[str, str]) -> None:
+        """生成した回答をキャッシュに登録"""
+        if self.response_cache is not None and cache_key is not None:
+            chunk_ids, query_embedding, version = cache_key
+            self.response_cache.put(query, chunk_ids, result, query_embedding, version)
+
+    @staticmethod
+    def count_generation(prompt: str, answer: str, usage: Optional[Any] = None) -> None:
+        """
+        回答生成のAPI呼び出し数と入出力トークン数を記録（使用量が返らない場合は推定値）
+
+        入力トークン数のうちキャッシュから読まれた分はtokens_cached_totalにも記録する。
+        """
+        count("api_calls_total", api="generate")
+        count("tokens_in_total", getattr(usage, "prompt_token_count", None) or estimate_tokens(prompt))
+        count("tokens_out_total", getattr(usage, "candidates_token_count", None) or estimate_tokens(answer))
+        cached_tokens = getattr(usage, "cached_content_token_count", None)
+        if cached_tokens:
+            count("tokens_cached_total", cached_tokens)
+
+    @staticmethod
+    def iter_text(response: Iterable[Any]) -> Iterator[str]:
+        """ストリーミングレスポンスからテキストの差分を取り出す"""
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # 安全性フィルターなどでテキストを含まないチャンクは読み飛ばす
+                continue
+            if text:
+                yield text
+
+    def context_summary(self) -> Dict[str, int]:
+        """コンテキストの組み立てで削減したトークン数の累計を返す"""
+        with self._stats_lock:
+            return dict(self.context_stats)
+
+    def _build_prompt(self, query: str, docs: List[Dict[str, Any]]) -> Tuple[str, Dict[str, int]]:
+        """
+        検索結果と質問からプロンプトを作成
+
+        重なったチャンクの結合・重複の除去・トークン数の上限に合わせた選択を行い、
+        削減したトークン数を記録する。
+
+        Returns:
+            Tuple[str, Dict[str, int]]: プロンプトとコンテキストの統計情報
+        """
+        with stage("prompt_build"):
+            context, stats, _ = self.context_builder.build(docs)
+        with self._stats_lock:
+            self.last_context_stats = stats
+            self.context_stats["queries"] += 1
+            for key in ("original_tokens", "context_tokens", "tokens_saved"):
+                self.context_stats[key] += stats[key]
+        return f"""以下の文脈に基づいて質問に答えてください。
 文脈が質問に関連していない場合は、その旨を伝えてください。
 
 文脈:
@@ -55,8 +323,4 @@ class Generator:
 
 質問: {query}
 
-回答:"""
-        
-        # 回答の生成
-        response = self.model.generate_content(prompt)
-        return response.text 
\ No newline at end of file
+回答:""", stats 
\ No newline at end of file
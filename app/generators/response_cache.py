@@ -0,0 +1,211 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.utils.text import normalize_query
+
+
+class ResponseCache:
+    """
+    Generatorの回答キャッシュ
+
+    正規化した質問と検索されたチャンクIDの組をキーにする完全一致層と、
+    質問の埋め込みの類似度がしきい値以上なら回答を再利用する意味的類似層を持つ。
+    エントリはTTLで失効し、件数が上限を超えると最も使われていないものから削除される。
+    コレクションが更新された場合（バージョンが変わった場合）はすべて無効化される。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl: Optional[float] = 3600.0,
+        similarity_threshold: Optional[float] = 0.95,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            max_entries: 保持するエントリの最大数
+            ttl: エントリの有効期間（秒、Noneで無期限）
+            similarity_threshold: 意味的類似層で再利用するコサイン類似度の下限（Noneで無効）
+            clock: 現在時刻を返す関数（テスト用に差し替え可能）
+        """
+        if max_entries <= 0:
+            raise ValueError("max_entries must be positive")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self._clock = clock
+        self._entries: "OrderedDict[Tuple[str, Tuple[str, ...]], Dict[str, Any]]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[Tuple[str, Tuple[str, ...]]] = []
+        self._version: Any = None
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """全角・半角、大文字・小文字、空白、末尾の句読点の違いを吸収する"""
+        return normalize_query(query)
+
+    def get_exact(
+        self,
+        query: str,
+        chunk_ids: Sequence[str],
+        version: Any = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        完全一致層から回答を取得
+
+        Args:
+            query: ユーザーの質問
+            chunk_ids: 検索されたチャンクのID
+            version: コレクションのバージョン
+
+        Returns:
+            Optional[Dict[str, Any]]: キャッシュされた回答（なければNone）
+        """
+        key = (self.normalize_query(query), tuple(chunk_ids))
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None or self._expire_if_stale(key, entry):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return dict(entry["response"])
+
+    def get_semantic(
+        self,
+        query_embedding: Sequence[float],
+        version: Any = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        意味的類似層から回答を取得
+
+        Args:
+            query_embedding: 質問の埋め込み
+            version: コレクションのバージョン
+
+        Returns:
+            Optional[Dict[str, Any]]: 最も類似した質問の回答（しきい値未満ならNone）
+        """
+        if self.similarity_threshold is None:
+            return None
+        query = self._normalize_vector(query_embedding)
+        with self._lock:
+            self._check_version(version)
+            while True:
+                if self._matrix is None:
+                    # 埋め込みを持たないエントリは意味的類似層の対象外
+                    self._matrix_keys = [
+                        key for key, entry in self._entries.items()
+                        if entry["embedding"] is not None
+                    ]
+                    if not self._matrix_keys:
+                        return None
+                    self._matrix = np.stack([
+                        self._entries[key]["embedding"] for key in self._matrix_keys
+                    ])
+                scores = self._matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] < self.similarity_threshold:
+                    break
+                key = self._matrix_keys[best]
+                entry = self._entries[key]
+                if self._expire_if_stale(key, entry):
+                    continue
+                self._entries.move_to_end(key)
+                self.semantic_hits += 1
+                return dict(entry["response"])
+            return None
+
+    def put(
+        self,
+        query: str,
+        chunk_ids: Sequence[str],
+        response: Dict[str, Any],
+        query_embedding: Optional[Sequence[float]] = None,
+        version: Any = None
+    ) -> None:
+        """
+        回答をキャッシュに登録
+
+        Args:
+            query: ユーザーの質問
+            chunk_ids: 検索されたチャンクのID
+            response: 回答
+            query_embedding: 質問の埋め込み（意味的類似層で使用）
+            version: コレクションのバージョン
+        """
+        key = (self.normalize_query(query), tuple(chunk_ids))
+        embedding = None
+        if query_embedding is not None:
+            embedding = self._normalize_vector(query_embedding)
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = {
+                "response": dict(response),
+                "embedding": embedding,
+                "created_at": self._clock(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._matrix = None
+
+    def invalidate(self) -> None:
+        """すべてのエントリを無効化"""
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> Dict[str, float]:
+        """ヒット率などの統計情報を返す"""
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": hits / (hits + self.misses) if hits + self.misses else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def _check_version(self, version: Any) -> None:
+        """コレクションのバージョンが変わっていればキャッシュを破棄"""
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._clear()
+            self._version = version
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._matrix = None
+        self._matrix_keys = []
+
+    def _expire_if_stale(self, key: Tuple[str, Tuple[str, ...]], entry: Dict[str, Any]) -> bool:
+        """TTLを過ぎたエントリを削除し、削除した場合はTrueを返す"""
+        if self.ttl is None or self._clock() - entry["created_at"] <= self.ttl:
+            return False
+        del self._entries[key]
+        self._matrix = None
+        self.expirations += 1
+        return True
+
+    @staticmethod
+    def _normalize_vector(vector: Sequence[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        return array / max(float(np.linalg.norm(array)), 1e-12)
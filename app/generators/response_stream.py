@@ -0,0 +1,65 @@
+import time
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+
+class ResponseStream:
+    """
+    少しずつ生成される回答を表すイテレータ
+
+    反復すると回答の差分テキストを返し、反復が終わるとanswerに全文が入る。
+    最初のトークンまでの時間と全体の所要時間も計測する。
+    """
+
+    def __init__(
+        self,
+        deltas: Iterable[str],
+        sources: str,
+        started_at: Optional[float] = None,
+        on_complete: Optional[Callable[[Dict[str, str]], None]] = None,
+        clock: Callable[[], float] = time.perf_counter,
+        context_stats: Optional[Dict[str, int]] = None
+    ):
+        """
+        Args:
+            deltas: 回答の差分テキストのイテラブル
+            sources: 参考文書の情報
+            started_at: リクエストの開始時刻（clockと同じ基準、省略時は生成時）
+            on_complete: 回答が完了したときに{answer, sources}を渡して呼ばれる関数
+            clock: 時刻を返す関数
+            context_stats: コンテキストの組み立ての統計情報（削減したトークン数など）
+        """
+        self._deltas = deltas
+        self._on_complete = on_complete
+        self._clock = clock
+        self.started_at = started_at if started_at is not None else clock()
+        self.sources = sources
+        self.answer = ""
+        self.time_to_first_token: Optional[float] = None
+        self.total_latency: Optional[float] = None
+        self.completed = False
+        self.context_stats = context_stats
+
+    def __iter__(self) -> Iterator[str]:
+        parts = []
+        for delta in self._deltas:
+            if not delta:
+                continue
+            if self.time_to_first_token is None:
+                self.time_to_first_token = self._clock() - self.started_at
+            parts.append(delta)
+            yield delta
+        self.answer = "".join(parts)
+        self.total_latency = self._clock() - self.started_at
+        self.completed = True
+        if self._on_complete is not None:
+            self._on_complete(self.to_dict())
+
+    def read(self) -> str:
+        """最後まで読み込んで回答全文を返す"""
+        for _ in self:
+            pass
+        return self.answer
+
+    def to_dict(self) -> Dict[str, str]:
+        """generate_responseと同じ形式の辞書を返す"""
+        return {"answer": self.answer, "sources": self.sources}
@@ -1,13 +1,15 @@
 from pathlib import Path
-from typing import List, Union
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, Union
 
-import markdown
-from pypdf import PdfReader
+from app.loaders.markdown_converter import MarkdownConverter, Section
+from app.splitters.text_splitter import PAGE_BREAK
 
 
 class DocumentLoader:
     """PDFとMarkdownファイルを読み込むためのローダークラス"""
 
+    SUPPORTED_EXTENSIONS = ('.pdf', '.md', '.markdown')
+
     @staticmethod
     def load_document(file_path: Union[str, Path]) -> str:
         """
@@ -19,6 +21,25 @@ class DocumentLoader:
         Returns:
             str: 読み込まれたテキスト
 
+        Raises:
+            ValueError: サポートされていないファイル形式の場合
+        """
+        return DocumentLoader.load_document_with_sections(file_path)[0]
+
+    @staticmethod
+    def load_document_with_sections(file_path: Union[str, Path]) -> Tuple[str, List[Section]]:
+        """
+        指定されたファイルを読み込み、テキストとセクションの区切りを返す
+
+        セクションはMarkdownでは見出しの階層（"section"）、PDFではページ番号（"page"）で、
+        分割したチャンクのメタデータに使う。
+
+        Args:
+            file_path: 読み込むファイルのパス
+
+        Returns:
+            Tuple[str, List[Section]]: 読み込まれたテキストと、(開始位置, メタデータ)のリスト
+
         Raises:
             ValueError: サポートされていないファイル形式の場合
         """
@@ -35,51 +56,126 @@ class DocumentLoader:
             raise ValueError(f"Unsupported file format: {file_path.suffix}")
 
     @staticmethod
-    def _load_pdf(file_path: Path) -> str:
+    def _load_pdf(file_path: Path) -> Tuple[str, List[Section]]:
         """PDFファイルを読み込む"""
+        pages = list(DocumentLoader._iter_pdf_pages(file_path))
+        return DocumentLoader.join_pdf_pages(pages), DocumentLoader.page_sections(pages)
+
+    @staticmethod
+    def join_pdf_pages(pages: Iterable[str]) -> str:
+        """
+        ページごとのテキストを1つのテキストに結合する
+
+        文字列の繰り返し連結を避けて一度に結合し、ページの間には分割時に
+        チャンクを区切る改ページ文字を入れる。
+
+        Args:
+            pages: ページごとのテキスト
+
+        Returns:
+            str: 結合したテキスト
+        """
+        return PAGE_BREAK.join(page_text + "\n" for page_text in pages)
+
+    @staticmethod
+    def page_sections(pages: List[str]) -> List[Section]:
+        """
+        join_pdf_pagesで結合したテキスト中の各ページの開始位置を求める
+
+        Args:
+            pages: ページごとのテキスト
+
+        Returns:
+            List[Section]: (開始位置, {"page": ページ番号（1始まり）})のリスト
+        """
+        sections = []
+        offset = 0
+        for page_number, page_text in enumerate(pages, 1):
+            sections.append((offset, {"page": page_number}))
+            offset += len(page_text) + 1 + len(PAGE_BREAK)
+        return sections
+
+    @staticmethod
+    def _iter_pdf_pages(file_path: Path) -> Iterator[str]:
+        """PDFファイルのテキストを1ページずつ読み込む"""
+        from pypdf import PdfReader
+
         reader = PdfReader(file_path)
-        text = ""
         for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+            yield page.extract_text() or ""
 
     @staticmethod
-    def _load_markdown(file_path: Path) -> str:
-        """Markdownファイルを読み込む"""
+    def _load_markdown(file_path: Path) -> Tuple[str, List[Section]]:
+        """Markdownファイルを読み込み、記法を除いたテキストに変換する"""
         with open(file_path, 'r', encoding='utf-8') as f:
             md_text = f.read()
-        # MarkdownをHTMLに変換し、テキストのみを抽出
-        html = markdown.markdown(md_text)
-        # 簡易的なHTMLタグ除去（実際のプロジェクトではBeautifulSoupなどを使用することを推奨）
-        text = html.replace('<p>', '').replace('</p>', '\n')
-        text = text.replace('<h1>', '# ').replace('</h1>', '\n')
-        text = text.replace('<h2>', '## ').replace('</h2>', '\n')
-        text = text.replace('<h3>', '### ').replace('</h3>', '\n')
-        return text
+        return MarkdownConverter().convert(md_text)
 
     @staticmethod
-    def load_documents(directory: Union[str, Path]) -> List[str]:
+    def find_documents(directory: Union[str, Path]) -> List[Path]:
         """
-        指定されたディレクトリ内のPDFとMarkdownファイルを読み込む
+        指定されたディレクトリ内の読み込み対象ファイルを列挙する
 
         Args:
-            directory: 読み込むディレクトリのパス
+            directory: 検索するディレクトリのパス
 
         Returns:
-            List[str]: 読み込まれたテキストのリスト
+            List[Path]: 対象ファイルのパス（パス順）
         """
         directory = Path(directory)
         if not directory.exists():
             raise FileNotFoundError(f"Directory not found: {directory}")
 
-        texts = []
-        for file_path in directory.glob('**/*'):
-            if file_path.suffix.lower() in ['.pdf', '.md', '.markdown']:
-                try:
-                    text = DocumentLoader.load_document(file_path)
-                    texts.append(text)
-                except Exception as e:
-                    print(f"Error loading {file_path}: {e}")
-                    continue
-
-        return texts 
\ No newline at end of file
+        return sorted(
+            file_path for file_path in directory.glob('**/*')
+            if file_path.is_file()
+            and file_path.suffix.lower() in DocumentLoader.SUPPORTED_EXTENSIONS
+        )
+
+    @staticmethod
+    def iter_documents(
+        directory: Union[str, Path],
+        per_page: bool = False
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        指定されたディレクトリ内の文書を1件ずつ読み込んで返す
+
+        全文書をまとめてメモリに載せないよう、ファイル（またはページ）単位で遅延評価する。
+
+        Args:
+            directory: 読み込むディレクトリのパス
+            per_page: TrueのときPDFをページ単位のレコードとして返す
+
+        Yields:
+            Dict[str, Any]: "text"と"metadata"（source, type, page）を持つ文書レコード
+        """
+        for file_path in DocumentLoader.find_documents(directory):
+            is_pdf = file_path.suffix.lower() == '.pdf'
+            metadata = {
+                "source": str(file_path),
+                "type": "pdf" if is_pdf else "markdown",
+            }
+            try:
+                if is_pdf and per_page:
+                    for page_number, page_text in enumerate(
+                        DocumentLoader._iter_pdf_pages(file_path), 1
+                    ):
+                        yield {"text": page_text, "metadata": {**metadata, "page": page_number}}
+                else:
+                    yield {"text": DocumentLoader.load_document(file_path), "metadata": metadata}
+            except Exception as e:
+                print(f"Error loading {file_path}: {e}")
+                continue
+
+    @staticmethod
+    def load_documents(directory: Union[str, Path]) -> List[str]:
+        """
+        指定されたディレクトリ内のPDFとMarkdownファイルを読み込む
+
+        Args:
+            directory: 読み込むディレクトリのパス
+
+        Returns:
+            List[str]: 読み込まれたテキストのリスト
+        """
+        return [document["text"] for document in DocumentLoader.iter_documents(directory)] 
\ No newline at end of file
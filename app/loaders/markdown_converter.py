@@ -0,0 +1,191 @@
+import html
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# ブロック要素
+_ATX_HEADING = re.compile(r"^ {0,3}(#{1,6})(?:[ \t]+(.*?))?(?:[ \t]+#+)?[ \t]*$")
+_SETEXT_UNDERLINE = re.compile(r"^ {0,3}(=+|-+)[ \t]*$")
+_FENCE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+# 閉じるフェンス（開始と同じ記号が開始以上の数だけ続き、info stringを持たない行）
+_FENCE_CLOSE = re.compile(r"^ {0,3}(`{3,}|~{3,})[ \t]*$")
+_THEMATIC_BREAK = re.compile(r"^ {0,3}([-*_])(?:[ \t]*\1){2,}[ \t]*$")
+_BLOCKQUOTE = re.compile(r"^ {0,3}(?:>[ \t]?)+")
+_LIST_ITEM = re.compile(r"^[ \t]*(?:[-*+]|\d{1,9}[.)])[ \t]+(?:\[[ xX]\][ \t]+)?")
+_LINK_DEFINITION = re.compile(r"^ {0,3}\[[^\]]+\]:[ \t]*\S+")
+_TABLE_DELIMITER = re.compile(r"^[ \t]*\|?[ \t]*:?-+:?[ \t]*(?:\|[ \t]*:?-+:?[ \t]*)+\|?[ \t]*$")
+_HTML_COMMENT_START = "<!--"
+_HTML_COMMENT_END = "-->"
+
+# インライン要素（置換後のテキスト）
+_CODE_SPAN = re.compile(r"(`+)(.+?)\1")
+_INLINE_RULES = [
+    (re.compile(r"!\[([^\]]*)\]\([^)]*\)"), r"\1"),
+    (re.compile(r"\[([^\]]+)\]\([^)]*\)"), r"\1"),
+    (re.compile(r"\[([^\]]+)\]\[[^\]]*\]"), r"\1"),
+    (re.compile(r"<((?:https?|mailto):[^>\s]+)>"), r"\1"),
+    (re.compile(r"<!--.*?-->|</?[A-Za-z][^>]*>"), ""),
+    (re.compile(r"(\*\*|__)(?=\S)(.+?)(?<=\S)\1"), r"\2"),
+    (re.compile(r"(?<![*\w])\*(?=\S)(.+?)(?<=\S)\*(?![*\w])"), r"\1"),
+    (re.compile(r"(?<![_\w])_(?=\S)(.+?)(?<=\S)_(?![_\w])"), r"\1"),
+    (re.compile(r"~~(?=\S)(.+?)(?<=\S)~~"), r"\1"),
+]
+# Markdownの記号の前のバックスラッシュだけをエスケープとして扱う（Windowsのパスなどは残す）
+_ESCAPE = re.compile(r"\\([\\`*_{}\[\]()#+\-.!<>~|])")
+# エスケープされた記号はインラインの規則を適用する間、私用領域の文字に置き換えておく
+_ESCAPED_BASE = 0xE000
+_ESCAPED = re.compile("[\uE000-\uE07F]")
+
+Section = Tuple[int, Dict[str, Any]]
+
+
+class MarkdownConverter:
+    """
+    Markdownをプレーンテキストに変換するクラス
+
+    HTMLへの変換を経由せず、行を先頭から1回たどって記法（強調・リンク・リスト記号・
+    コードブロックの囲み・表の区切りなど）を取り除く。見出しは分割時の区切りとして
+    "#"を残し、見出しの階層（"親 > 子"）を変換後のテキストの位置とともに返す。
+    """
+
+    def convert(self, markdown_text: str) -> Tuple[str, List[Section]]:
+        """
+        Markdownをプレーンテキストに変換
+
+        Args:
+            markdown_text: Markdownのテキスト
+
+        Returns:
+            Tuple[str, List[Section]]: 変換後のテキストと、(見出しの開始位置, {"section": 見出しの階層})のリスト
+        """
+        lines = markdown_text.splitlines()
+        output: List[str] = []
+        length = 0
+        sections: List[Section] = []
+        headings: List[Tuple[int, str]] = []
+        fence: Optional[str] = None
+        in_comment = False
+        previous_blank = True
+
+        index = self._skip_front_matter(lines)
+        while index < len(lines):
+            line = lines[index]
+            index += 1
+
+            if fence is not None:
+                if self._closes_fence(line, fence):
+                    fence = None
+                    continue
+                # コードのコメント行（"# install"など）が見出しとして区切られないよう字下げする
+                text = " " + line if line.startswith("#") else line
+            elif in_comment:
+                if _HTML_COMMENT_END in line:
+                    in_comment = False
+                continue
+            else:
+                fence_match = _FENCE.match(line)
+                if fence_match:
+                    fence = fence_match.group(1)
+                    continue
+                if line.lstrip().startswith(_HTML_COMMENT_START) and _HTML_COMMENT_END not in line:
+                    in_comment = True
+                    continue
+
+                line = _BLOCKQUOTE.sub("", line, count=1)
+                heading = self._heading(line, lines[index] if index < len(lines) else None, previous_blank)
+                if heading is not None:
+                    level, title, consumed = heading
+                    index += consumed
+                    while headings and headings[-1][0] >= level:
+                        headings.pop()
+                    headings.append((level, title))
+                    if not previous_blank:
+                        output.append("\n")
+                        length += 1
+                    sections.append((length, {"section": " > ".join(t for _, t in headings)}))
+                    text = "#" * level + " " + title
+                elif (
+                    _THEMATIC_BREAK.match(line)
+                    or _LINK_DEFINITION.match(line)
+                    or _TABLE_DELIMITER.match(line)
+                ):
+                    continue
+                elif line.lstrip().startswith("|"):
+                    cells = line.strip().strip("|").split("|")
+                    text = " ".join(self._inline(cell.strip()) for cell in cells)
+                else:
+                    text = self._inline(_LIST_ITEM.sub("", line, count=1).strip())
+
+            if not text.strip():
+                # 連続する空行は1つにまとめる
+                if previous_blank:
+                    continue
+                text = ""
+            previous_blank = not text.strip()
+            output.append(text + "\n")
+            length += len(text) + 1
+
+        return "".join(output), sections
+
+    @staticmethod
+    def _skip_front_matter(lines: List[str]) -> int:
+        """先頭のYAMLフロントマターを読み飛ばした行番号を返す"""
+        if not lines or lines[0].strip() != "---":
+            return 0
+        for index in range(1, len(lines)):
+            if lines[index].strip() in ("---", "..."):
+                return index + 1
+        return 0
+
+    def _heading(
+        self,
+        line: str,
+        next_line: Optional[str],
+        previous_blank: bool
+    ) -> Optional[Tuple[int, str, int]]:
+        """
+        見出し行を解析
+
+        Returns:
+            Optional[Tuple[int, str, int]]: (レベル, 見出しのテキスト, 下線として読み進める行数)
+                （見出しでない場合はNone）
+        """
+        match = _ATX_HEADING.match(line)
+        if match:
+            return len(match.group(1)), self._inline((match.group(2) or "").strip()), 0
+        # 下線（=== または ---）による見出しは、段落の1行目のテキストの次の行で判定する
+        if next_line is None or not previous_blank or not line.strip():
+            return None
+        underline = _SETEXT_UNDERLINE.match(next_line)
+        if underline is None or _LIST_ITEM.match(line) or line.lstrip().startswith("|"):
+            return None
+        return (1 if underline.group(1)[0] == "=" else 2), self._inline(line.strip()), 1
+
+    @staticmethod
+    def _closes_fence(line: str, fence: str) -> bool:
+        """コードブロックを閉じる行か（CommonMarkと同じく、```pythonのような行では閉じない）"""
+        match = _FENCE_CLOSE.match(line)
+        return match is not None and match.group(1)[0] == fence[0] and len(match.group(1)) >= len(fence)
+
+    @staticmethod
+    def _inline(text: str) -> str:
+        """インラインの記法を取り除く（コードの中はそのまま残す）"""
+        parts = []
+        position = 0
+        for match in _CODE_SPAN.finditer(text):
+            parts.append(MarkdownConverter._strip_inline(text[position:match.start()]))
+            parts.append(match.group(2).strip())
+            position = match.end()
+        parts.append(MarkdownConverter._strip_inline(text[position:]))
+        return "".join(parts)
+
+    @staticmethod
+    def _strip_inline(text: str) -> str:
+        escaped = "\\" in text
+        if escaped:
+            text = _ESCAPE.sub(lambda m: chr(_ESCAPED_BASE + ord(m.group(1))), text)
+        for pattern, replacement in _INLINE_RULES:
+            if any(c in text for c in "[<*_~"):
+                text = pattern.sub(replacement, text)
+        if escaped:
+            text = _ESCAPED.sub(lambda m: chr(ord(m.group()) - _ESCAPED_BASE), text)
+        return html.unescape(text) if "&" in text else text
@@ -0,0 +1,208 @@
+import os
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.loaders.document_loader import DocumentLoader
+from app.loaders.markdown_converter import Section
+from app.loaders.pdf_extractor import PdfExtractor, extract_page_range
+from app.splitters.text_splitter import TextSplitter
+
+# (開始位置, チャンク, セクションのメタデータ)
+Chunk = Tuple[int, str, Dict[str, Any]]
+
+# ワーカープロセスごとに生成したTextSplitterを使い回す
+_splitters: Dict[Tuple[int, int], TextSplitter] = {}
+
+
+def _get_splitter(chunk_size: int, chunk_overlap: int) -> TextSplitter:
+    key = (chunk_size, chunk_overlap)
+    splitter = _splitters.get(key)
+    if splitter is None:
+        splitter = _splitters[key] = TextSplitter(chunk_size, chunk_overlap)
+    return splitter
+
+
+def _split(
+    text: str,
+    sections: List[Section],
+    chunk_size: int,
+    chunk_overlap: int
+) -> List[Chunk]:
+    """テキストを分割し、各チャンクに開始位置を含むセクションのメタデータを付ける"""
+    starts = [start for start, _ in sections]
+    chunks = []
+    for offset, chunk in _get_splitter(chunk_size, chunk_overlap).split_text_with_offsets(text):
+        index = bisect_right(starts, offset) - 1
+        chunks.append((offset, chunk, sections[index][1] if index >= 0 else {}))
+    return chunks
+
+
+def _load_and_split(
+    file_path: str,
+    chunk_size: int,
+    chunk_overlap: int
+) -> List[Chunk]:
+    """ワーカープロセスで1ファイルを読み込み、(開始位置, チャンク, メタデータ)のリストに分割する"""
+    text, sections = DocumentLoader.load_document_with_sections(file_path)
+    return _split(text, sections, chunk_size, chunk_overlap)
+
+
+class ParallelDocumentProcessor:
+    """
+    ファイルの読み込みと分割をプロセスプールで並列に実行するクラス
+
+    PdfExtractorを指定した場合、PDFはページ範囲ごとのタスクに分けて同じプールで抽出し、
+    すべてのページがそろったところで分割する（キャッシュ済みのページは抽出しない）。
+    """
+
+    def __init__(
+        self,
+        chunk_size: int,
+        chunk_overlap: int,
+        max_workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        pdf_extractor: Optional[PdfExtractor] = None
+    ):
+        """
+        Args:
+            chunk_size: チャンクの最大サイズ
+            chunk_overlap: チャンク間のオーバーラップ
+            max_workers: ワーカープロセス数（NoneでCPUコア数、0で同一プロセス内で逐次実行）
+            max_pending: 同時に投入しておくタスク数の上限（メモリ使用量の上限になる）
+            pdf_extractor: PDFのテキストを抽出するPdfExtractor（Noneで他の形式と同様にファイル単位で読み込む）
+        """
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.max_workers = max_workers
+        self.max_pending = max_pending or max(1, max_workers) * 2
+        self.pdf_extractor = pdf_extractor
+
+    def process(
+        self,
+        file_paths: Iterable[Path],
+        file_hashes: Optional[Dict[Path, str]] = None
+    ) -> Iterator[Tuple[Path, List[Chunk]]]:
+        """
+        ファイルを読み込んで分割し、完了したものから順に返す
+
+        読み込みに失敗したファイルはエラーを表示して読み飛ばす。
+
+        Args:
+            file_paths: 処理するファイルのパス
+            file_hashes: ファイルの内容ハッシュ（PDFのキャッシュキーに使う、省略時は計算する）
+
+        Yields:
+            Tuple[Path, List[Chunk]]: (ファイルパス, (開始位置, チャンク, メタデータ)のリスト)
+                （メタデータはMarkdownの見出しの階層"section"またはPDFのページ番号"page"）
+        """
+        file_hashes = file_hashes or {}
+        if self.max_workers == 0:
+            for file_path in file_paths:
+                try:
+                    if self._is_pdf(file_path):
+                        pages = self.pdf_extractor.extract(
+                            file_path, file_hashes.get(file_path), max_workers=0
+                        )
+                        chunks = self._split_pages(pages)
+                    else:
+                        chunks = _load_and_split(str(file_path), self.chunk_size, self.chunk_overlap)
+                except Exception as e:
+                    print(f"Error loading {file_path}: {e}")
+                    continue
+                yield file_path, chunks
+            return
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            # タスクは(ファイルパス, ページ範囲)で、ページ範囲がNoneの場合はファイル全体を処理する
+            pending: Dict[Future, Tuple[Path, Optional[Tuple[int, int]]]] = {}
+            tasks: Deque[Tuple[Path, Optional[Tuple[int, int]]]] = deque()
+            # 抽出中のPDFの状態
+            pdfs: Dict[Path, Dict[str, Any]] = {}
+            paths = iter(file_paths)
+            exhausted = False
+            while True:
+                # 投入中のタスク数が上限に達するまでワーカーに渡す
+                while len(pending) < self.max_pending:
+                    if not tasks:
+                        file_path = None if exhausted else next(paths, None)
+                        if file_path is None:
+                            exhausted = True
+                            break
+                        if not self._is_pdf(file_path):
+                            tasks.append((file_path, None))
+                            continue
+                        try:
+                            state = self.pdf_extractor.plan(file_path, file_hashes.get(file_path))
+                            if not state["ranges"]:
+                                # すべてのページがキャッシュ済み
+                                chunks = self._split_pages(self.pdf_extractor.finish(file_path, state))
+                        except Exception as e:
+                            print(f"Error loading {file_path}: {e}")
+                            continue
+                        if not state["ranges"]:
+                            yield file_path, chunks
+                            continue
+                        state["remaining"] = len(state["ranges"])
+                        pdfs[file_path] = state
+                        tasks.extend((file_path, page_range) for page_range in state["ranges"])
+
+                    file_path, page_range = tasks.popleft()
+                    if page_range is None:
+                        future = executor.submit(
+                            _load_and_split, str(file_path), self.chunk_size, self.chunk_overlap
+                        )
+                    elif file_path in pdfs:
+                        future = executor.submit(extract_page_range, str(file_path), *page_range)
+                    else:
+                        # 他のページ範囲の抽出に失敗したPDF
+                        continue
+                    pending[future] = (file_path, page_range)
+                if not pending:
+                    return
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_path, page_range = pending.pop(future)
+                    if page_range is None:
+                        try:
+                            chunks = future.result()
+                        except Exception as e:
+                            print(f"Error loading {file_path}: {e}")
+                            continue
+                        yield file_path, chunks
+                        continue
+
+                    state = pdfs.get(file_path)
+                    if state is None:
+                        continue
+                    try:
+                        texts, seconds = future.result()
+                        state["pages"].update(zip(range(*page_range), texts))
+                        state["seconds"] += seconds
+                        state["remaining"] -= 1
+                        if state["remaining"] > 0:
+                            continue
+                        del pdfs[file_path]
+                        chunks = self._split_pages(self.pdf_extractor.finish(file_path, state))
+                    except Exception as e:
+                        print(f"Error loading {file_path}: {e}")
+                        pdfs.pop(file_path, None)
+                        continue
+                    yield file_path, chunks
+
+    def _is_pdf(self, file_path: Path) -> bool:
+        return self.pdf_extractor is not None and Path(file_path).suffix.lower() == '.pdf'
+
+    def _split_pages(self, pages: List[str]) -> List[Chunk]:
+        """ページごとのテキストを結合して分割する"""
+        return _split(
+            DocumentLoader.join_pdf_pages(pages),
+            DocumentLoader.page_sections(pages),
+            self.chunk_size,
+            self.chunk_overlap
+        )
@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from app.config import PDF_PAGES_PER_TASK
+from app.loaders.pdf_page_cache import PdfPageCache
+from app.retrievers.manifest import IngestManifest
+
+
+def extract_page_range(file_path: str, start: int, end: int) -> Tuple[List[str], float]:
+    """
+    PDFの指定範囲のページのテキストを抽出（ワーカープロセスから呼ばれる）
+
+    Args:
+        file_path: PDFファイルのパス
+        start: 最初のページ番号（0始まり）
+        end: 最後のページ番号の次
+
+    Returns:
+        Tuple[List[str], float]: ページごとのテキストと抽出にかかった秒数
+    """
+    from pypdf import PdfReader
+
+    started_at = time.perf_counter()
+    reader = PdfReader(file_path)
+    texts = [reader.pages[page].extract_text() or "" for page in range(start, end)]
+    return texts, time.perf_counter() - started_at
+
+
+class PdfExtractor:
+    """
+    PDFのテキストをページ単位で抽出するクラス
+
+    大きなPDFはページ範囲に分けてプロセスプールで並列に抽出し、抽出したテキストは
+    ファイルハッシュとページ番号をキーにキャッシュする（変更されていないPDFは
+    開かずにキャッシュから返す）。ファイルごとの抽出時間を記録する。
+    """
+
+    def __init__(
+        self,
+        cache: Optional[PdfPageCache] = None,
+        max_workers: Optional[int] = None,
+        pages_per_task: int = PDF_PAGES_PER_TASK
+    ):
+        """
+        Args:
+            cache: 抽出済みテキストのキャッシュ（Noneでキャッシュしない）
+            max_workers: extractで使うワーカープロセス数（NoneでCPUコア数、0で同一プロセス内で逐次実行）
+            pages_per_task: 1つのワーカーにまとめて渡すページ数
+        """
+        if pages_per_task <= 0:
+            raise ValueError("pages_per_task must be positive")
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        self.cache = cache
+        self.max_workers = max_workers
+        self.pages_per_task = pages_per_task
+        self.timings: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def plan(self, file_path: Union[str, Path], file_hash: Optional[str] = None) -> Dict[str, Any]:
+        """
+        抽出が必要なページ範囲を求める
+
+        キャッシュにすべてのページがある場合はPDFを開かない。
+
+        Args:
+            file_path: PDFファイルのパス
+            file_hash: ファイルの内容ハッシュ（省略時は計算する）
+
+        Returns:
+            Dict[str, Any]: file_hash, page_count, pages（キャッシュ済みのテキスト）,
+                ranges（抽出するページ範囲のリスト）, seconds（抽出にかかった秒数）
+        """
+        if self.cache is not None and file_hash is None:
+            file_hash = IngestManifest.hash_file(file_path)
+        page_count, pages = (None, {})
+        if self.cache is not None:
+            page_count, pages = self.cache.get(file_hash)
+        if page_count is None:
+            from pypdf import PdfReader
+
+            page_count = len(PdfReader(str(file_path)).pages)
+
+        ranges = []
+        start = None
+        for page in range(page_count + 1):
+            missing = page < page_count and page not in pages
+            if missing and start is None:
+                start = page
+            if start is not None and (not missing or page - start == self.pages_per_task):
+                ranges.append((start, page))
+                start = page if missing else None
+        return {
+            "file_hash": file_hash,
+            "page_count": page_count,
+            "cached_pages": len(pages),
+            "pages": dict(pages),
+            "ranges": ranges,
+            "seconds": 0.0,
+        }
+
+    def finish(self, file_path: Union[str, Path], state: Dict[str, Any]) -> List[str]:
+        """
+        抽出したページをキャッシュに登録し、抽出時間を記録してページ順のテキストを返す
+
+        Args:
+            file_path: PDFファイルのパス
+            state: planで作成し、抽出したページをpagesに加えた状態
+
+        Returns:
+            List[str]: ページごとのテキスト
+        """
+        pages = state["pages"]
+        if self.cache is not None and len(pages) > state["cached_pages"]:
+            self.cache.put(state["file_hash"], state["page_count"], pages)
+        with self._lock:
+            self.timings[str(file_path)] = {
+                "pages": state["page_count"],
+                "cached_pages": state["cached_pages"],
+                "seconds": state["seconds"],
+            }
+        return [pages[page] for page in range(state["page_count"])]
+
+    def extract(
+        self,
+        file_path: Union[str, Path],
+        file_hash: Optional[str] = None,
+        max_workers: Optional[int] = None
+    ) -> List[str]:
+        """
+        PDFのテキストをページごとに抽出
+
+        Args:
+            file_path: PDFファイルのパス
+            file_hash: ファイルの内容ハッシュ（省略時は計算する）
+            max_workers: ワーカープロセス数（Noneでインスタンスの設定、0で逐次実行）
+
+        Returns:
+            List[str]: ページごとのテキスト
+        """
+        if max_workers is None:
+            max_workers = self.max_workers
+        state = self.plan(file_path, file_hash)
+        ranges = state["ranges"]
+        if len(ranges) > 1 and max_workers != 0:
+            with ProcessPoolExecutor(max_workers=min(max_workers, len(ranges))) as executor:
+                results = list(executor.map(
+                    extract_page_range,
+                    [str(file_path)] * len(ranges),
+                    [start for start, _ in ranges],
+                    [end for _, end in ranges]
+                ))
+        else:
+            results = [extract_page_range(str(file_path), start, end) for start, end in ranges]
+        for (start, end), (texts, seconds) in zip(ranges, results):
+            state["pages"].update(zip(range(start, end), texts))
+            state["seconds"] += seconds
+        return self.finish(file_path, state)
+
+    def slowest(self, n: int = 5) -> List[Tuple[str, Dict[str, float]]]:
+        """
+        抽出に時間がかかったPDFを返す
+
+        Args:
+            n: 返す件数
+
+        Returns:
+            List[Tuple[str, Dict[str, float]]]: 抽出時間の長い順の(ファイルパス, 計測値)のリスト
+        """
+        with self._lock:
+            return sorted(self.timings.items(), key=lambda item: -item[1]["seconds"])[:n]
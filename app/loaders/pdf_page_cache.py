@@ -0,0 +1,134 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+
+class PdfPageCache:
+    """
+    PDFのファイルハッシュとページ番号をキーにした抽出済みテキストの永続キャッシュ
+
+    SQLiteにページ単位で保存し、ファイル数が上限を超えた場合は
+    最終アクセスが古いファイルから削除する（LRU）。
+    """
+
+    def __init__(self, path: Union[str, Path] = ":memory:", max_files: int = 1000):
+        """
+        Args:
+            path: SQLiteファイルのパス（":memory:"でメモリ上に作成）
+            max_files: 保持するPDFの最大数
+        """
+        if max_files <= 0:
+            raise ValueError("max_files must be positive")
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_files = max_files
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pdf_files (
+                file_hash TEXT PRIMARY KEY,
+                page_count INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pdf_pages (
+                file_hash TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (file_hash, page)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, file_hash: str) -> Tuple[Optional[int], Dict[int, str]]:
+        """
+        PDFのページ数と抽出済みのページのテキストを取得
+
+        Args:
+            file_hash: PDFの内容ハッシュ
+
+        Returns:
+            Tuple[Optional[int], Dict[int, str]]: ページ数（未登録の場合はNone）と
+                ページ番号（0始まり）ごとのテキスト
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page_count FROM pdf_files WHERE file_hash = ?", (file_hash,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None, {}
+            pages = dict(self._conn.execute(
+                "SELECT page, text FROM pdf_pages WHERE file_hash = ?", (file_hash,)
+            ).fetchall())
+            self._conn.execute(
+                "UPDATE pdf_files SET last_access = ? WHERE file_hash = ?", (time.time(), file_hash)
+            )
+            self._conn.commit()
+            if len(pages) == row[0]:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return row[0], pages
+
+    def put(self, file_hash: str, page_count: int, pages: Dict[int, str]) -> None:
+        """
+        PDFのページ数と抽出したページのテキストを登録
+
+        Args:
+            file_hash: PDFの内容ハッシュ
+            page_count: PDFのページ数
+            pages: ページ番号（0始まり）ごとのテキスト
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pdf_files (file_hash, page_count, last_access) VALUES (?, ?, ?)",
+                (file_hash, page_count, time.time())
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pdf_pages (file_hash, page, text) VALUES (?, ?, ?)",
+                [(file_hash, page, text) for page, text in pages.items()]
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """上限を超えた分を最終アクセスが古いファイルから削除"""
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM pdf_files").fetchone()
+        excess = count - self.max_files
+        if excess > 0:
+            stale = [
+                file_hash for (file_hash,) in self._conn.execute(
+                    "SELECT file_hash FROM pdf_files ORDER BY last_access ASC LIMIT ?", (excess,)
+                ).fetchall()
+            ]
+            self._conn.executemany("DELETE FROM pdf_files WHERE file_hash = ?", [(h,) for h in stale])
+            self._conn.executemany("DELETE FROM pdf_pages WHERE file_hash = ?", [(h,) for h in stale])
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM pdf_files").fetchone()
+        return count
+
+    def clear(self) -> None:
+        """キャッシュを空にする"""
+        with self._lock:
+            self._conn.execute("DELETE FROM pdf_files")
+            self._conn.execute("DELETE FROM pdf_pages")
+            self._conn.commit()
+
+    def close(self) -> None:
+        """データベース接続を閉じる"""
+        with self._lock:
+            self._conn.close()
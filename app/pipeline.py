@@ -1,49 +1,190 @@
+import time
+from functools import cached_property
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Any, Dict, List, Optional
 
+from app.config import (
+    BATCH_MAX_WORKERS,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_SIMILARITY,
+    RESPONSE_CACHE_TTL,
+)
+from app.generators.chat_session import ChatSession
+from app.generators.context_cache import create_context_cache
 from app.generators.generator import Generator
+from app.generators.response_stream import ResponseStream
+from app.generators.response_cache import ResponseCache
 from app.retrievers.document_store import DocumentStore
 from app.retrievers.retriever import Retriever
+from app.utils.metrics import stage, tracing
+from app.utils.single_flight import SingleFlight
 
 
 class Pipeline:
-    """チャンク検索→回答生成の一連処理を管理するクラス"""
+    """
+    チャンク検索→回答生成の一連処理を管理するクラス
 
-    def __init__(self, docs_dir: Path, collection_name: str = "documents"):
+    起動を速くするため、各コンポーネントは最初に使われるときに作成する。
+    """
+
+    def __init__(
+        self,
+        docs_dir: Path,
+        collection_name: str = "documents",
+        document_store: Optional[DocumentStore] = None,
+        model: Optional[Any] = None
+    ):
         """
         Args:
             docs_dir: 文書が格納されているディレクトリ
             collection_name: コレクション名
+            document_store: 使用する文書ストア（省略時は設定から作成）
+            model: 回答生成モデル（省略時はGemini）
         """
         self.docs_dir = docs_dir
-        self.document_store = DocumentStore(collection_name)
-        self.retriever = Retriever(self.document_store)
-        self.generator = Generator(self.retriever)
+        self.collection_name = collection_name
+        self._model = model
+        # 同じ質問の同時リクエストは検索と回答生成を1回にまとめる
+        self.single_flight = SingleFlight()
+        if document_store is not None:
+            self.document_store = document_store
+
+    @cached_property
+    def document_store(self) -> DocumentStore:
+        """文書ストア"""
+        return DocumentStore(self.collection_name)
+
+    @cached_property
+    def retriever(self) -> Retriever:
+        """検索器"""
+        return Retriever(self.document_store)
+
+    @cached_property
+    def generator(self) -> Generator:
+        """回答生成器"""
+        response_cache = None
+        if RESPONSE_CACHE_MAX_ENTRIES > 0:
+            response_cache = ResponseCache(
+                max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                ttl=RESPONSE_CACHE_TTL,
+                similarity_threshold=RESPONSE_CACHE_SIMILARITY
+            )
+        # モデルが渡された場合（テストなど）はGemini側のキャッシュは作らない
+        context_cache = create_context_cache(provider_cache=self._model is None)
+        return Generator(
+            self.retriever,
+            model=self._model,
+            response_cache=response_cache,
+            context_cache=context_cache
+        )
 
-    def initialize(self, metadata: Optional[dict] = None) -> None:
+    def initialize(self, metadata: Optional[dict] = None) -> Dict[str, int]:
         """
         文書の読み込みとベクトルストアへの登録を実行
 
+        前回から変更のあったファイルだけが処理される。
+
         Args:
             metadata: 追加するメタデータ（オプション）
+
+        Returns:
+            Dict[str, int]: 取り込み結果の統計情報
         """
-        self.document_store.add_documents(
-            directory=self.docs_dir,
-            metadata=metadata
-        )
+        with stage("ingest"):
+            return self.document_store.add_documents(
+                directory=self.docs_dir,
+                metadata=metadata
+            )
 
-    def run(self, query: str) -> Dict:
+    def run(self, query: str, trace: bool = False) -> Dict:
         """
         質問に対する回答を生成
 
+        同じ質問（正規化後）の回答を生成中であれば、新たに生成せずその結果を共有する。
+
         Args:
             query: ユーザーの質問
+            trace: Trueのとき段階ごとの所要時間とカウンター（trace）を回答に含める
+                （他のリクエストの結果を共有した場合、段階はそのリクエストの側に記録される）
 
         Returns:
             Dict: 回答と参考文書の情報を含む辞書
         """
-        return self.generator.generate_response(query)
+        if trace:
+            with tracing() as request_trace:
+                response = self.run(query)
+            return {**response, "trace": request_trace.to_dict()}
+
+        with stage("query"):
+            response = self.single_flight.do(
+                ResponseCache.normalize_query(query),
+                self.generator.generate_response,
+                query
+            )
+        return dict(response)
+
+    def run_batch(
+        self,
+        queries: List[str],
+        max_workers: int = BATCH_MAX_WORKERS
+    ) -> Dict[str, Any]:
+        """
+        複数の質問に対する回答をまとめて生成
+
+        Args:
+            queries: ユーザーの質問のリスト
+            max_workers: 同時に実行する回答生成の最大数
+
+        Returns:
+            Dict[str, Any]: 質問と同じ順序の結果（results）と処理件数・秒あたりの処理数（stats）。
+                各結果はquery、およびanswerとsourcesまたはerrorを含む
+        """
+        started_at = time.perf_counter()
+        results = [
+            {"query": query, **result}
+            for query, result in zip(queries, self.generator.generate_batch(queries, max_workers))
+        ]
+        elapsed = time.perf_counter() - started_at
+        failed = sum(1 for result in results if "error" in result)
+        return {
+            "results": results,
+            "stats": {
+                "queries": len(queries),
+                "succeeded": len(queries) - failed,
+                "failed": failed,
+                "elapsed": elapsed,
+                "queries_per_second": len(queries) / elapsed if elapsed > 0 else 0.0,
+            },
+        }
+
+    def run_stream(self, query: str) -> ResponseStream:
+        """
+        質問に対する回答を少しずつ生成
+
+        Args:
+            query: ユーザーの質問
+
+        Returns:
+            ResponseStream: 回答の差分テキストを返すイテレータ
+        """
+        return self.generator.stream_response(query)
+
+    def chat_session(self) -> ChatSession:
+        """
+        履歴と検索済みのチャンクを引き継いで追加の質問に答える会話セッションを作成
+
+        Returns:
+            ChatSession: 会話セッション（会話ごとに1つ作成する）
+        """
+        return ChatSession(self.generator)
+
+    def close(self) -> None:
+        """作成したプロンプトの固定部分のキャッシュを削除（登録した文書は残す）"""
+        generator = self.__dict__.get("generator")
+        if generator is not None and generator.context_cache is not None:
+            generator.context_cache.close()
 
     def clear(self) -> None:
-        """コレクションを削除"""
-        self.document_store.clear() 
\ No newline at end of file
+        """コレクション（ベクトル・マニフェスト・BM25インデックス）とプロンプトの固定部分のキャッシュを削除"""
+        self.document_store.clear()
+        self.close() 
\ No newline at end of file
@@ -0,0 +1,133 @@
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import chromadb
+import numpy as np
+
+
+class ChromaBackend:
+    """ChromaDBのPersistentClientを使用するベクトルインデックスバックエンド"""
+
+    # 埋め込みを渡さない場合はChroma側の埋め込み関数が使われる
+    requires_embeddings = False
+
+    def __init__(
+        self,
+        collection_name: str,
+        persist_directory: Union[str, Path],
+        embedding_model: Optional[str] = None
+    ):
+        """
+        Args:
+            collection_name: コレクション名
+            persist_directory: 永続化ディレクトリ
+            embedding_model: 埋め込みモデル名（コレクションのメタデータに記録し、不一致を検出する）
+
+        Raises:
+            ValueError: 既存のコレクションが別のモデルで埋め込まれている場合
+        """
+        self.persist_directory = Path(persist_directory)
+        self.persist_directory.mkdir(parents=True, exist_ok=True)
+        self.client = chromadb.PersistentClient(path=str(self.persist_directory))
+        metadata = None
+        if embedding_model:
+            metadata = {"embedding_model": embedding_model, "hnsw:space": "cosine"}
+        self.collection = self.client.get_or_create_collection(
+            name=collection_name,
+            metadata=metadata
+        )
+        if embedding_model:
+            self._check_embedding_model(embedding_model)
+
+    def _check_embedding_model(self, embedding_model: str) -> None:
+        """コレクションに記録された埋め込みモデルと一致するか確認"""
+        recorded = (self.collection.metadata or {}).get("embedding_model")
+        if recorded == embedding_model:
+            return
+        if recorded is None and self.collection.count() == 0:
+            self.collection.modify(metadata={"embedding_model": embedding_model})
+            return
+        raise ValueError(
+            f"Collection '{self.collection.name}' was embedded with "
+            f"'{recorded or 'chroma default'}', not '{embedding_model}'. "
+            "Clear the collection and ingest the documents again."
+        )
+
+    def upsert(
+        self,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        embeddings: Optional[Sequence[Sequence[float]]] = None
+    ) -> None:
+        """テキストを登録（同じIDがある場合は上書き）"""
+        self.collection.upsert(
+            ids=ids,
+            documents=texts,
+            metadatas=metadatas,
+            # Chromaにはリストで渡す（NumPy配列のまま渡すとバージョンによって受け付けない）
+            embeddings=None if embeddings is None else np.asarray(embeddings, dtype=np.float32).tolist()
+        )
+
+    def delete(self, ids: List[str]) -> None:
+        """指定したIDのテキストを削除"""
+        self.collection.delete(ids=ids)
+
+    def query(
+        self,
+        n_results: int,
+        query_texts: Optional[List[str]] = None,
+        query_embeddings: Optional[Sequence[Sequence[float]]] = None,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        類似検索を実行
+
+        Returns:
+            List[List[Dict[str, Any]]]: クエリごとの検索結果（text, metadata, id, distance）
+        """
+        if query_embeddings is not None:
+            results = self.collection.query(
+                query_embeddings=np.asarray(query_embeddings, dtype=np.float32).tolist(),
+                n_results=n_results,
+                where=where
+            )
+        else:
+            results = self.collection.query(
+                query_texts=query_texts,
+                n_results=n_results,
+                where=where
+            )
+        return [
+            [
+                {"text": doc, "metadata": meta, "id": id_, "distance": distance}
+                for doc, meta, id_, distance in zip(docs, metas, ids, distances)
+            ]
+            for docs, metas, ids, distances in zip(
+                results["documents"],
+                results["metadatas"],
+                results["ids"],
+                results["distances"]
+            )
+        ]
+
+    def get(self, ids: List[str]) -> List[Dict[str, Any]]:
+        """指定したIDのテキストとメタデータを取得（存在しないIDは含まれない）"""
+        if not ids:
+            return []
+        results = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        return [
+            {"text": doc, "metadata": meta, "id": id_}
+            for doc, meta, id_ in zip(results["documents"], results["metadatas"], results["ids"])
+        ]
+
+    def count(self) -> int:
+        """登録件数を返す"""
+        return self.collection.count()
+
+    def flush(self) -> None:
+        """更新をディスクへ書き出す（PersistentClientは更新時に書き出すため何もしない）"""
+
+    def drop(self) -> None:
+        """コレクションを削除"""
+        self.client.delete_collection(self.collection.name)
@@ -0,0 +1,106 @@
+from typing import Optional
+
+import numpy as np
+
+
+class IVFIndex:
+    """
+    転置ファイル（IVF）方式の近似最近傍インデックス
+
+    正規化済みベクトルを球面k-meansでnlist個のクラスタに分け、
+    クエリに近いnprobe個のクラスタに属する行だけを候補として返す。
+    nprobeを大きくするほど再現率が上がり、検索は遅くなる。
+    """
+
+    def __init__(self, nlist: int, nprobe: int = 8, n_iter: int = 10, seed: int = 0):
+        """
+        Args:
+            nlist: クラスタ数
+            nprobe: 検索時に探索するクラスタ数
+            n_iter: k-meansの反復回数
+            seed: 乱数シード
+        """
+        if nlist <= 0:
+            raise ValueError("nlist must be positive")
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self.labels = np.zeros(0, dtype=np.int32)
+        self._order: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, vectors: np.ndarray, max_samples: int = 100_000) -> None:
+        """
+        クラスタ中心を学習し、全ベクトルを割り当てる
+
+        Args:
+            vectors: 正規化済みベクトル（行列）
+            max_samples: 学習に使う最大サンプル数
+        """
+        rng = np.random.default_rng(self.seed)
+        n = len(vectors)
+        nlist = min(self.nlist, n)
+        sample = vectors
+        if n > max_samples:
+            sample = vectors[rng.choice(n, max_samples, replace=False)]
+        sample = np.asarray(sample, dtype=np.float32)
+
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.n_iter):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            for cluster in range(nlist):
+                members = sample[assignments == cluster]
+                if len(members):
+                    centroids[cluster] = members.sum(axis=0)
+                else:
+                    # 空クラスタはランダムなサンプルで初期化し直す
+                    centroids[cluster] = sample[rng.integers(len(sample))]
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            centroids /= np.maximum(norms, 1e-12)
+
+        self.centroids = centroids
+        self.labels = self.assign(vectors)
+        self.invalidate()
+
+    def assign(self, vectors: np.ndarray, block_size: int = 65_536) -> np.ndarray:
+        """各ベクトルに最も近いクラスタ番号を返す"""
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), block_size):
+            block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+            labels[start:start + block_size] = np.argmax(block @ self.centroids.T, axis=1)
+        return labels
+
+    def invalidate(self) -> None:
+        """ラベルの変更後に転置リストを作り直すよう印を付ける"""
+        self._order = None
+        self._offsets = None
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """
+        クエリに近いクラスタに属する行番号を返す
+
+        Args:
+            query: 正規化済みクエリベクトル
+            nprobe: 探索するクラスタ数（省略時は初期化時の値）
+
+        Returns:
+            np.ndarray: 候補の行番号
+        """
+        if self._order is None:
+            self._order = np.argsort(self.labels, kind="stable")
+            counts = np.bincount(self.labels, minlength=len(self.centroids))
+            self._offsets = np.concatenate(([0], np.cumsum(counts)))
+
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        scores = self.centroids @ query
+        probes = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        return np.concatenate([
+            self._order[self._offsets[cluster]:self._offsets[cluster + 1]]
+            for cluster in probes
+        ])
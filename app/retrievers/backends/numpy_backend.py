@@ -0,0 +1,625 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from app.retrievers.backends.ivf_index import IVFIndex
+
+# 保存形式のバージョン（meta.jsonに記録する）
+_FORMAT_VERSION = 2
+_DTYPES = ("float32", "float16", "int8")
+# スコア計算時にfloat32へ戻す行数
+_BLOCK_SIZE = 65_536
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    正規化済みの埋め込みを保存用の型に変換
+
+    int8の場合は行ごとに最大絶対値が127になるよう対称にスケーリングする。
+
+    Args:
+        vectors: float32の埋め込み行列
+        dtype: "float32", "float16"または"int8"
+
+    Returns:
+        Tuple[np.ndarray, Optional[np.ndarray]]: 変換した行列と行ごとのスケール（int8以外はNone）
+    """
+    if dtype == "int8":
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+        quantized = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+    return vectors.astype(dtype), None
+
+
+def dequantize(matrix: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+    """保存用の型の行列をfloat32に戻す"""
+    vectors = np.asarray(matrix, dtype=np.float32)
+    return vectors * scales[:, None] if scales is not None else vectors
+
+
+class NumpyBackend:
+    """
+    NumPyによるプロセス内ベクトルインデックスバックエンド
+
+    埋め込みはfloat32・float16・int8（行ごとのスケール付き）のいずれかの行列として
+    保存し、読み込み時はメモリマップする。テキストとメタデータは1つのファイルに
+    連結してオフセット表から必要な行だけを読む。検索は正規化済みベクトルの内積
+    （コサイン類似度）をブロックごとにfloat32へ戻しながら計算し、件数が多い場合は
+    IVFによる近似検索に切り替えられる。
+
+    更新は容量に余裕を持たせた行列に追記するため、1回の登録の計算量は登録件数に
+    比例する。ディスクへの書き出しは更新のたびには行わず、flush()でまとめて行う。
+    """
+
+    requires_embeddings = True
+
+    def __init__(
+        self,
+        collection_name: str,
+        persist_directory: Union[str, Path],
+        index_type: str = "flat",
+        nlist: int = 0,
+        nprobe: int = 8,
+        ivf_min_size: int = 10_000,
+        autosave: bool = True,
+        embedding_model: Optional[str] = None,
+        dtype: str = "float32"
+    ):
+        """
+        Args:
+            collection_name: コレクション名
+            persist_directory: 永続化ディレクトリ
+            index_type: "flat"（厳密検索）または"ivf"（近似検索）
+            nlist: IVFのクラスタ数（0で件数の平方根）
+            nprobe: IVFで探索するクラスタ数
+            ivf_min_size: IVFを使い始める最小件数（未満の場合は厳密検索）
+            autosave: flush()でディスクへ書き出すかどうか（Falseの場合はpersist()でのみ書き出す）
+            embedding_model: 埋め込みモデル名（保存データに記録し、不一致を検出する）
+            dtype: 埋め込みを保存する型（"float32", "float16"または"int8"）
+
+        Raises:
+            ValueError: 既存のデータが別のモデルで埋め込まれている場合
+        """
+        if index_type not in ("flat", "ivf"):
+            raise ValueError(f"Unsupported index type: {index_type}")
+        if dtype not in _DTYPES:
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        self.directory = Path(persist_directory) / f"{collection_name}.numpy"
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.ivf_min_size = ivf_min_size
+        self.autosave = autosave
+        self.dtype = dtype
+
+        self.ids: List[str] = []
+        self.embeddings: Optional[np.ndarray] = None
+        self.scales: Optional[np.ndarray] = None
+        # embeddings・scalesは追記用の行列の先頭部分（メモリマップから読み込んだ直後はNone）
+        self._buffer: Optional[np.ndarray] = None
+        self._scale_buffer: Optional[np.ndarray] = None
+        # flush()で書き出していない更新があるか
+        self._dirty = False
+        # テキストとメタデータは更新やフィルターが必要になるまでファイルから行単位で読む
+        self._texts: Optional[List[str]] = []
+        self._metadatas: Optional[List[Dict[str, Any]]] = []
+        self._record_data: Optional[np.ndarray] = None
+        self._record_offsets: Optional[np.ndarray] = None
+        self._positions: Dict[str, int] = {}
+        self._columns: Dict[str, np.ndarray] = {}
+        self._ivf: Optional[IVFIndex] = None
+        self._ivf_trained_size = 0
+        self.embedding_model = embedding_model
+        # 検索と更新が別スレッドから同時に呼ばれても整合性を保つ
+        self._lock = threading.RLock()
+        self.load()
+
+    # ---- 永続化 ----
+
+    def load(self) -> None:
+        """ディスクから読み込む（埋め込み行列とテキストはメモリマップする）"""
+        with self._lock:
+            meta_path = self.directory / "meta.json"
+            migrate = False
+            if meta_path.exists():
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                self._check_model(meta.get("embedding_model"), meta["count"])
+                stored_dtype = meta["dtype"]
+                if meta["count"]:
+                    self.ids = [id_.decode("utf-8") for id_ in np.load(self.directory / "ids.npy").tolist()]
+                    self.embeddings = np.load(self.directory / "vectors.npy", mmap_mode="r")
+                    if stored_dtype == "int8":
+                        self.scales = np.load(self.directory / "scales.npy")
+                    self._record_offsets = np.load(self.directory / "offsets.npy")
+                    self._record_data = np.memmap(self.directory / "records.bin", dtype=np.uint8, mode="r")
+                    self._texts = None
+                    self._metadatas = None
+            elif (self.directory / "records.json").exists():
+                # 旧形式（JSONとfloat32の行列）からの移行
+                with open(self.directory / "records.json", 'r', encoding='utf-8') as f:
+                    records = json.load(f)
+                self._check_model(records.get("embedding_model"), len(records["ids"]))
+                stored_dtype = "float32"
+                migrate = True
+                self.ids = records["ids"]
+                self._texts = records["texts"]
+                self._metadatas = records["metadatas"]
+                if self.ids:
+                    # 新しい形式で書き出すためメモリ上に読み込む
+                    self.embeddings = np.load(self.directory / "embeddings.npy")
+            else:
+                return
+            self._positions = {id_: i for i, id_ in enumerate(self.ids)}
+
+            ivf_path = self.directory / "ivf.npz"
+            if self.index_type == "ivf" and ivf_path.exists():
+                data = np.load(ivf_path)
+                self._ivf = IVFIndex(nlist=len(data["centroids"]), nprobe=self.nprobe)
+                self._ivf.centroids = data["centroids"]
+                self._ivf.labels = data["labels"]
+                self._ivf_trained_size = int(data["trained_size"])
+
+            if self.embeddings is not None and stored_dtype != self.dtype:
+                # 保存時と異なる型が指定された場合は変換して書き直す
+                self._load_records()
+                self.embeddings, self.scales = quantize(
+                    dequantize(self.embeddings, self.scales), self.dtype
+                )
+                migrate = True
+            if migrate and self.autosave:
+                self.persist()
+
+    def _check_model(self, recorded: Optional[str], count: int) -> None:
+        if self.embedding_model and recorded and count and recorded != self.embedding_model:
+            raise ValueError(
+                f"Collection '{self.directory.name}' was embedded with '{recorded}', "
+                f"not '{self.embedding_model}'. Clear the collection and ingest the documents again."
+            )
+        self.embedding_model = self.embedding_model or recorded
+
+    def persist(self) -> None:
+        """ディスクへ書き出す（一時ファイル経由で置き換え、最後にmeta.jsonを更新する）"""
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            count = len(self.ids)
+            if count:
+                if not isinstance(self.embeddings, np.memmap):
+                    self._save_array("vectors.npy", self.embeddings)
+                    if self.scales is not None:
+                        self._save_array("scales.npy", self.scales)
+                if self._texts is not None:
+                    self._save_records()
+                self._save_array(
+                    "ids.npy", np.array([id_.encode("utf-8") for id_ in self.ids], dtype=bytes)
+                )
+
+            if self._ivf is not None and self._ivf.is_trained:
+                tmp_path = self.directory / "ivf.tmp.npz"
+                np.savez(
+                    tmp_path,
+                    centroids=self._ivf.centroids,
+                    labels=self._ivf.labels,
+                    trained_size=self._ivf_trained_size
+                )
+                os.replace(tmp_path, self.directory / "ivf.npz")
+
+            tmp_path = self.directory / "meta.json.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(
+                    {
+                        "format": _FORMAT_VERSION,
+                        "embedding_model": self.embedding_model,
+                        "dtype": self.dtype,
+                        "dimension": int(self.embeddings.shape[1]) if count else None,
+                        "count": count,
+                    },
+                    f
+                )
+            os.replace(tmp_path, self.directory / "meta.json")
+            for name in ("records.json", "embeddings.npy"):
+                path = self.directory / name
+                if path.exists():
+                    path.unlink()
+            self._dirty = False
+
+    def flush(self) -> None:
+        """前回の書き出し以降の更新をディスクへ書き出す（autosave=Falseの場合は何もしない）"""
+        with self._lock:
+            if self._dirty and self.autosave:
+                self.persist()
+
+    def _save_array(self, name: str, array: np.ndarray) -> None:
+        tmp_path = self.directory / f"{name}.tmp.npy"
+        np.save(tmp_path, array)
+        os.replace(tmp_path, self.directory / name)
+
+    def _save_records(self) -> None:
+        """テキストとメタデータをJSONの連結とオフセット表として書き出す"""
+        offsets = np.zeros(len(self.ids) + 1, dtype=np.int64)
+        tmp_path = self.directory / "records.bin.tmp"
+        with open(tmp_path, 'wb') as f:
+            for i, (text, metadata) in enumerate(zip(self._texts, self._metadatas)):
+                record = json.dumps([text, metadata], ensure_ascii=False).encode("utf-8")
+                f.write(record)
+                offsets[i + 1] = offsets[i] + len(record)
+        os.replace(tmp_path, self.directory / "records.bin")
+        self._save_array("offsets.npy", offsets)
+
+    def _record(self, row: int) -> Tuple[str, Dict[str, Any]]:
+        """1行分のテキストとメタデータを返す"""
+        if self._texts is not None:
+            return self._texts[row], self._metadatas[row]
+        start, end = self._record_offsets[row], self._record_offsets[row + 1]
+        text, metadata = json.loads(self._record_data[start:end].tobytes().decode("utf-8"))
+        return text, metadata
+
+    def _load_records(self) -> None:
+        """全行のテキストとメタデータをメモリ上に展開（更新・フィルター時に使う）"""
+        if self._texts is not None:
+            return
+        records = [self._record(row) for row in range(len(self.ids))]
+        self._texts = [text for text, _ in records]
+        self._metadatas = [metadata for _, metadata in records]
+        self._record_data = None
+        self._record_offsets = None
+
+    @property
+    def texts(self) -> List[str]:
+        with self._lock:
+            self._load_records()
+            return self._texts
+
+    @property
+    def metadatas(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._load_records()
+            return self._metadatas
+
+    # ---- 更新 ----
+
+    def upsert(
+        self,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        embeddings: Optional[Sequence[Sequence[float]]] = None
+    ) -> None:
+        """テキストと埋め込みを登録（同じIDがある場合は上書き）"""
+        with self._lock:
+            if embeddings is None:
+                raise ValueError("NumpyBackend requires precomputed embeddings")
+            if len(set(ids)) != len(ids):
+                raise ValueError("Duplicate ids in upsert")
+            vectors = self._normalize(np.asarray(embeddings, dtype=np.float32))
+            if self.embeddings is not None and vectors.shape[1] != self.embeddings.shape[1]:
+                raise ValueError(
+                    f"Embedding dimension mismatch: {vectors.shape[1]} != {self.embeddings.shape[1]}"
+                )
+            encoded, encoded_scales = quantize(vectors, self.dtype)
+            self._load_records()
+
+            old_size = len(self.ids)
+            new_rows = []
+            updated_rows = []
+            updated_sources = []
+            for i, (id_, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+                position = self._positions.get(id_)
+                if position is None:
+                    self._positions[id_] = len(self.ids)
+                    self.ids.append(id_)
+                    self._texts.append(text)
+                    self._metadatas.append(metadata)
+                    new_rows.append(i)
+                else:
+                    self._texts[position] = text
+                    self._metadatas[position] = metadata
+                    updated_rows.append(position)
+                    updated_sources.append(i)
+
+            size = len(self.ids)
+            self._reserve(size, encoded.shape[1])
+            if updated_rows:
+                self._buffer[updated_rows] = encoded[updated_sources]
+                if encoded_scales is not None:
+                    self._scale_buffer[updated_rows] = encoded_scales[updated_sources]
+            if new_rows:
+                self._buffer[old_size:size] = encoded[new_rows]
+                if encoded_scales is not None:
+                    self._scale_buffer[old_size:size] = encoded_scales[new_rows]
+            self._set_size(size)
+            self._columns.clear()
+            matrix = self.embeddings
+
+            if self._ivf is not None and self._ivf.is_trained:
+                if updated_rows:
+                    self._ivf.labels[updated_rows] = self._ivf.assign(self._decode(updated_rows))
+                if new_rows:
+                    new_labels = self._ivf.assign(self._decode(np.arange(len(matrix) - len(new_rows), len(matrix))))
+                    self._ivf.labels = np.concatenate([self._ivf.labels, new_labels])
+                self._ivf.invalidate()
+            self._maybe_train_ivf()
+            self._dirty = True
+
+    def delete(self, ids: List[str]) -> None:
+        """指定したIDのテキストを削除（削除した最初の行より後ろの行だけを詰める）"""
+        with self._lock:
+            positions = [self._positions.pop(id_) for id_ in set(ids) if id_ in self._positions]
+            if not positions:
+                return
+            self._load_records()
+            size = len(self.ids)
+            first = min(positions)
+            keep = np.ones(size, dtype=bool)
+            keep[positions] = False
+            # firstより前の行はすべて残るため、残る行のうちfirst以降だけを移動する
+            moved = np.flatnonzero(keep[first:]) + first
+            new_size = first + len(moved)
+
+            self._reserve(size, self.embeddings.shape[1])
+            self._buffer[first:new_size] = self._buffer[moved]
+            if self._scale_buffer is not None:
+                self._scale_buffer[first:new_size] = self._scale_buffer[moved]
+            for name in ("ids", "_texts", "_metadatas"):
+                values = getattr(self, name)
+                values[first:] = [values[i] for i in moved]
+            for row in range(first, new_size):
+                self._positions[self.ids[row]] = row
+            self._set_size(new_size)
+            self._columns.clear()
+            if self._ivf is not None:
+                self._ivf.labels = self._ivf.labels[keep]
+                self._ivf.invalidate()
+            self._dirty = True
+
+    def _reserve(self, rows: int, dimension: int) -> None:
+        """
+        追記用の行列の容量をrows行以上にする
+
+        容量が足りない場合（メモリマップから読み込んだ直後を含む）は倍の容量の行列を
+        確保して既存の行を複製するため、追記の計算量は平均して追記した行数に比例する。
+        """
+        if self._buffer is not None and len(self._buffer) >= rows:
+            return
+        size = 0 if self.embeddings is None else len(self.embeddings)
+        capacity = max(rows, 2 * size, 1024)
+        dtype = np.int8 if self.dtype == "int8" else np.dtype(self.dtype)
+        buffer = np.empty((capacity, dimension), dtype=dtype)
+        if size:
+            buffer[:size] = self.embeddings
+        self._buffer = buffer
+        if self.dtype == "int8":
+            scale_buffer = np.empty(capacity, dtype=np.float32)
+            if size:
+                scale_buffer[:size] = self.scales
+            self._scale_buffer = scale_buffer
+
+    def _set_size(self, size: int) -> None:
+        """embeddings・scalesを追記用の行列の先頭size行にする"""
+        self.embeddings = self._buffer[:size] if size else None
+        if self._scale_buffer is not None:
+            self.scales = self._scale_buffer[:size] if size else None
+
+    def _maybe_train_ivf(self) -> None:
+        """件数がしきい値を超えた、または学習時から大きく増えた場合にIVFを学習し直す"""
+        if self.index_type != "ivf" or self.embeddings is None:
+            return
+        n = len(self.embeddings)
+        if n < self.ivf_min_size:
+            return
+        if self._ivf is not None and n <= self._ivf_trained_size * 4:
+            return
+        nlist = self.nlist or max(1, int(np.sqrt(n)))
+        self._ivf = IVFIndex(nlist=nlist, nprobe=self.nprobe)
+        self._ivf.train(self._decode())
+        self._ivf_trained_size = n
+
+    def _decode(self, rows: Optional[Union[Sequence[int], np.ndarray]] = None) -> np.ndarray:
+        """指定した行（省略時は全行）の埋め込みをfloat32で返す"""
+        if rows is None:
+            return dequantize(self.embeddings, self.scales)
+        return dequantize(
+            self.embeddings[rows],
+            None if self.scales is None else self.scales[rows]
+        )
+
+    # ---- 検索 ----
+
+    def query(
+        self,
+        n_results: int,
+        query_texts: Optional[List[str]] = None,
+        query_embeddings: Optional[Sequence[Sequence[float]]] = None,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        類似検索を実行
+
+        Returns:
+            List[List[Dict[str, Any]]]: クエリごとの検索結果（text, metadata, id, distance）
+        """
+        with self._lock:
+            if query_embeddings is None:
+                raise ValueError("NumpyBackend requires query embeddings")
+            queries = self._normalize(np.asarray(query_embeddings, dtype=np.float32).reshape(
+                len(query_embeddings), -1
+            ))
+            if self.embeddings is None or n_results <= 0:
+                return [[] for _ in queries]
+
+            mask = self._filter_mask(where) if where else None
+            use_ivf = self._ivf is not None and self._ivf.is_trained
+            results = []
+            if use_ivf:
+                for query in queries:
+                    candidates = self._ivf.candidates(query)
+                    if mask is not None:
+                        candidates = candidates[mask[candidates]]
+                    if len(candidates) < n_results:
+                        # 候補が足りない場合は厳密検索にフォールバック
+                        candidates = np.flatnonzero(mask) if mask is not None else np.arange(len(self.ids))
+                    scores = self._scores(query[None, :], candidates)[:, 0]
+                    top = self._top_k(scores, n_results)
+                    results.append(self._format(candidates[top], scores[top]))
+            else:
+                candidates = np.flatnonzero(mask) if mask is not None else None
+                all_scores = self._scores(queries, candidates)
+                for column in range(len(queries)):
+                    scores = all_scores[:, column]
+                    top = self._top_k(scores, n_results)
+                    rows = top if candidates is None else candidates[top]
+                    results.append(self._format(rows, scores[top]))
+            return results
+
+    def _scores(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        保存行列とクエリの内積を計算
+
+        float16・int8の行列はブロックごとにfloat32へ戻して計算し、int8の場合は
+        行ごとのスケールを掛ける（全行を一度にfloat32へ展開しない）。
+
+        Args:
+            queries: 正規化済みのクエリ行列（クエリ数 x 次元）
+            rows: 対象の行（Noneで全行）
+
+        Returns:
+            np.ndarray: 行数 x クエリ数のスコア行列
+        """
+        n = len(self.embeddings) if rows is None else len(rows)
+        if self.dtype == "float32":
+            matrix = self.embeddings if rows is None else self.embeddings[rows]
+            return matrix @ queries.T
+        scores = np.empty((n, len(queries)), dtype=np.float32)
+        for start in range(0, n, _BLOCK_SIZE):
+            block_rows = slice(start, start + _BLOCK_SIZE) if rows is None else rows[start:start + _BLOCK_SIZE]
+            block = self.embeddings[block_rows].astype(np.float32)
+            block_scores = block @ queries.T
+            if self.scales is not None:
+                block_scores *= self.scales[block_rows][:, None]
+            scores[start:start + len(block)] = block_scores
+        return scores
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """スコアの高い順にk件の位置を返す"""
+        k = min(k, len(scores))
+        if k == 0:
+            return np.zeros(0, dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top], kind="stable")]
+
+    def _format(self, rows: np.ndarray, scores: np.ndarray) -> List[Dict[str, Any]]:
+        results = []
+        for row, score in zip(rows, scores):
+            text, metadata = self._record(row)
+            results.append({
+                "text": text,
+                "metadata": metadata,
+                "id": self.ids[row],
+                "distance": float(1.0 - score),
+            })
+        return results
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    # ---- メタデータフィルター ----
+
+    def _column(self, key: str) -> np.ndarray:
+        """メタデータの1キー分の値を配列として返す（更新までキャッシュする）"""
+        column = self._columns.get(key)
+        if column is None:
+            metadatas = self.metadatas
+            column = np.empty(len(metadatas), dtype=object)
+            column[:] = [metadata.get(key) for metadata in metadatas]
+            self._columns[key] = column
+        return column
+
+    def _filter_mask(self, where: Dict[str, Any]) -> np.ndarray:
+        """Chroma互換のwhere条件を評価し、条件に合う行のマスクを返す"""
+        masks = []
+        for key, condition in where.items():
+            if key == "$and":
+                masks.append(np.logical_and.reduce([self._filter_mask(c) for c in condition]))
+            elif key == "$or":
+                masks.append(np.logical_or.reduce([self._filter_mask(c) for c in condition]))
+            else:
+                masks.append(self._match(self._column(key), condition))
+        return np.logical_and.reduce(masks) if len(masks) > 1 else masks[0]
+
+    @staticmethod
+    def _match(column: np.ndarray, condition: Any) -> np.ndarray:
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        (operator, value), = condition.items()
+        if operator == "$eq":
+            return np.asarray(column == value, dtype=bool)
+        if operator == "$ne":
+            return np.asarray(column != value, dtype=bool)
+
+        predicates: Dict[str, Callable[[Any], bool]] = {
+            "$in": lambda v: v in value,
+            "$nin": lambda v: v not in value,
+            "$gt": lambda v: v is not None and v > value,
+            "$gte": lambda v: v is not None and v >= value,
+            "$lt": lambda v: v is not None and v < value,
+            "$lte": lambda v: v is not None and v <= value,
+        }
+        if operator not in predicates:
+            raise ValueError(f"Unsupported filter operator: {operator}")
+        predicate = predicates[operator]
+        return np.fromiter((predicate(v) for v in column), dtype=bool, count=len(column))
+
+    # ---- その他 ----
+
+    def get(self, ids: List[str]) -> List[Dict[str, Any]]:
+        """指定したIDのテキストとメタデータを取得（存在しないIDは含まれない）"""
+        with self._lock:
+            results = []
+            for id_ in ids:
+                row = self._positions.get(id_)
+                if row is None:
+                    continue
+                text, metadata = self._record(row)
+                results.append({"text": text, "metadata": metadata, "id": id_})
+            return results
+
+    def count(self) -> int:
+        """登録件数を返す"""
+        return len(self.ids)
+
+    def nbytes(self) -> int:
+        """埋め込み行列とスケールが占めるバイト数を返す"""
+        with self._lock:
+            if self.embeddings is None:
+                return 0
+            return self.embeddings.nbytes + (0 if self.scales is None else self.scales.nbytes)
+
+    def drop(self) -> None:
+        """コレクションを削除"""
+        with self._lock:
+            self.ids, self._texts, self._metadatas = [], [], []
+            self.embeddings = None
+            self.scales = None
+            self._buffer = None
+            self._scale_buffer = None
+            self._dirty = False
+            self._record_data = None
+            self._record_offsets = None
+            self._positions = {}
+            self._columns.clear()
+            self._ivf = None
+            self._ivf_trained_size = 0
+            for name in (
+                "meta.json", "vectors.npy", "scales.npy", "ids.npy", "records.bin",
+                "offsets.npy", "ivf.npz", "embeddings.npy", "records.json",
+            ):
+                path = self.directory / name
+                if path.exists():
+                    path.unlink()
@@ -0,0 +1,308 @@
+import math
+import os
+import re
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+# 英数字の語（エラーコードや製品名、識別子）はそのまま1語として扱う
+_WORD_PATTERN = re.compile(r"[a-z0-9_]+(?:[-.:/][a-z0-9_]+)*|[^\sa-z0-9_]+")
+_PUNCTUATION = set("、。，．・「」『』（）()[]{}【】〈〉《》！？!?：；:;,.\"'`~^*+=|\\<>#%&$@-/")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    BM25用にテキストをトークンに分割
+
+    英数字の並びは1語として、日本語など空白で区切られない文字列は
+    文字bigram（1文字だけの場合はその文字）として扱う。
+
+    Args:
+        text: 分割するテキスト
+
+    Returns:
+        List[str]: トークンのリスト
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+    for match in _WORD_PATTERN.finditer(text):
+        word = match.group()
+        if word[0].isascii() and (word[0].isalnum() or word[0] == "_"):
+            tokens.append(word)
+            continue
+        chars = "".join(c for c in word if c not in _PUNCTUATION)
+        if len(chars) == 1:
+            tokens.append(chars)
+        else:
+            tokens.extend(chars[i:i + 2] for i in range(len(chars) - 1))
+    return tokens
+
+
+class BM25Index:
+    """
+    BM25でスコアリングするローカルの転置インデックス
+
+    転置リストは語ごとに連続したNumPy配列（CSR形式）で持ち、検索は語ごとの
+    転置リストをまとめてベクトル演算でスコアリングする。追加した文書は小さな
+    差分の転置リストに積み、削除した文書は無効として印を付け、一定量を超えたら
+    CSR形式へまとめ直す。保存時はCSR形式の配列をnpz形式で書き出す。
+    """
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        k1: float = 1.2,
+        b: float = 0.75,
+        max_df_ratio: float = 1.0,
+        merge_threshold: int = 65_536
+    ):
+        """
+        Args:
+            path: 保存先のパス（Noneの場合は保存しない）
+            k1: 語の出現回数の飽和を調整するパラメータ
+            b: 文書長による正規化の強さ
+            max_df_ratio: 検索時に読み飛ばす語の文書頻度の割合（これを超える割合の文書に現れる語は、
+                より珍しい語がクエリにある場合スコアに加えない。1.0ですべての語を使う）
+            merge_threshold: 差分の転置リストをまとめ直す最小の件数
+                （CSR形式の件数の1/4を超えた場合もまとめ直す）
+        """
+        self.path = Path(path) if path is not None else None
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+        self.merge_threshold = merge_threshold
+        self._lock = threading.RLock()
+        self._reset()
+        self.load()
+
+    def _reset(self) -> None:
+        # 文書は追加順のスロットで管理し、削除したスロットは次にまとめ直すまで無効にしておく
+        self.ids: List[Optional[str]] = []
+        self.doc_lengths = array("I")
+        self._alive = array("B")
+        self._slots: Dict[str, int] = {}
+        self._vocab: Dict[str, int] = {}
+        self._total_length = 0
+        # CSR形式の転置リスト（語IDごとにoffsets[id]:offsets[id + 1]の範囲）
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._posting_docs = np.zeros(0, dtype=np.uint32)
+        self._posting_counts = np.zeros(0, dtype=np.uint32)
+        # まとめ直す前に追加された語IDごとの（スロット, 出現回数）
+        self._delta: Dict[int, Tuple[array, array]] = {}
+        self._delta_size = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def add(self, ids: List[str], texts: List[str]) -> None:
+        """
+        文書を登録（同じIDがある場合は置き換える）
+
+        Args:
+            ids: 文書IDのリスト
+            texts: 文書のテキストのリスト
+        """
+        with self._lock:
+            self.remove([id_ for id_ in ids if id_ in self._slots])
+            for id_, text in zip(ids, texts):
+                tokens = tokenize(text)
+                slot = len(self.ids)
+                self.ids.append(id_)
+                self.doc_lengths.append(len(tokens))
+                self._alive.append(1)
+                self._slots[id_] = slot
+                self._total_length += len(tokens)
+                counts = Counter(tokens)
+                for token, count in counts.items():
+                    term_id = self._vocab.get(token)
+                    if term_id is None:
+                        term_id = self._vocab[token] = len(self._vocab)
+                    postings = self._delta.get(term_id)
+                    if postings is None:
+                        postings = self._delta[term_id] = (array("I"), array("I"))
+                    postings[0].append(slot)
+                    postings[1].append(count)
+                self._delta_size += len(counts)
+            if self._delta_size > max(self.merge_threshold, len(self._posting_docs) // 4):
+                self._merge()
+
+    def remove(self, ids: List[str]) -> None:
+        """
+        文書を削除
+
+        Args:
+            ids: 削除する文書IDのリスト
+        """
+        with self._lock:
+            for id_ in ids:
+                slot = self._slots.pop(id_, None)
+                if slot is None:
+                    continue
+                self._total_length -= self.doc_lengths[slot]
+                self.ids[slot] = None
+                self.doc_lengths[slot] = 0
+                self._alive[slot] = 0
+            removed = len(self.ids) - len(self._slots)
+            if removed > max(1024, len(self._slots) // 4):
+                self._merge()
+
+    def _merge(self) -> None:
+        """差分の転置リストをCSR形式にまとめ、削除した文書を除いてスロットを詰める"""
+        alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+        base_terms = np.repeat(
+            np.arange(len(self._offsets) - 1, dtype=np.uint32), np.diff(self._offsets)
+        )
+        delta = list(self._delta.items())
+        delta_terms = np.repeat(
+            np.array([term_id for term_id, _ in delta], dtype=np.uint32),
+            [len(docs) for _, (docs, _) in delta]
+        )
+        terms = np.concatenate([base_terms, delta_terms])
+        docs = np.concatenate(
+            [self._posting_docs] + [np.frombuffer(docs, dtype=np.uint32) for _, (docs, _) in delta]
+        )
+        counts = np.concatenate(
+            [self._posting_counts] + [np.frombuffer(counts, dtype=np.uint32) for _, (_, counts) in delta]
+        )
+        keep = alive[docs]
+        terms, docs, counts = terms[keep], docs[keep], counts[keep]
+
+        live_slots = np.flatnonzero(alive)
+        new_slot = np.zeros(len(alive), dtype=np.uint32)
+        new_slot[live_slots] = np.arange(len(live_slots), dtype=np.uint32)
+        docs = new_slot[docs]
+        order = np.lexsort((docs, terms))
+
+        lengths = np.frombuffer(self.doc_lengths, dtype=np.uint32)[live_slots]
+        self.ids = [self.ids[slot] for slot in live_slots.tolist()]
+        self.doc_lengths = array("I", lengths.tobytes())
+        self._alive = array("B", bytes([1]) * len(self.ids))
+        self._slots = {id_: slot for slot, id_ in enumerate(self.ids)}
+        self._offsets = np.zeros(len(self._vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(self._vocab)), out=self._offsets[1:])
+        self._posting_docs = docs[order]
+        self._posting_counts = counts[order]
+        self._delta = {}
+        self._delta_size = 0
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """
+        BM25スコアの高い文書を検索
+
+        Args:
+            query: 検索クエリ
+            k: 取得する結果の数
+
+        Returns:
+            List[Tuple[str, float]]: スコアの高い順の（文書ID, スコア）のリスト
+        """
+        with self._lock:
+            n_docs = len(self._slots)
+            if n_docs == 0 or k <= 0:
+                return []
+            # 加算の順序を一定にするため語の順に処理する
+            term_ids = [
+                self._vocab[token] for token in sorted(set(tokenize(query))) if token in self._vocab
+            ]
+            if not term_ids:
+                return []
+            alive = np.frombuffer(self._alive, dtype=np.uint8).view(bool)
+            n_base_terms = len(self._offsets) - 1
+            postings = []
+            for term_id in term_ids:
+                if term_id < n_base_terms:
+                    start, end = self._offsets[term_id], self._offsets[term_id + 1]
+                    docs, counts = self._posting_docs[start:end], self._posting_counts[start:end]
+                else:
+                    docs, counts = self._posting_docs[:0], self._posting_counts[:0]
+                if term_id in self._delta:
+                    delta_docs, delta_counts = self._delta[term_id]
+                    docs = np.concatenate([docs, np.frombuffer(delta_docs, dtype=np.uint32)])
+                    counts = np.concatenate([counts, np.frombuffer(delta_counts, dtype=np.uint32)])
+                if len(self._slots) < len(self.ids):
+                    live = alive[docs]
+                    docs, counts = docs[live], counts[live]
+                if len(docs):
+                    postings.append((docs, counts))
+            # ほぼすべての文書に現れる語（助詞などを含むバイグラム）はIDFが0に近く、
+            # 転置リストが長いだけなので、より珍しい語がある場合は読み飛ばす
+            rare = [posting for posting in postings if len(posting[0]) <= self.max_df_ratio * n_docs]
+            postings = rare or postings
+            if not postings:
+                return []
+
+            # 文書長による正規化は語によらないため、文書ごとに一度だけ計算する
+            average_length = self._total_length / n_docs or 1.0
+            lengths = np.frombuffer(self.doc_lengths, dtype=np.uint32)
+            norm = self.k1 * (1.0 - self.b) + (self.k1 * self.b / average_length) * lengths
+            all_docs, all_scores = [], []
+            for docs, counts in postings:
+                df = len(docs)
+                idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+                counts = counts.astype(np.float64)
+                all_docs.append(docs)
+                all_scores.append(idf * (self.k1 + 1.0) * counts / (counts + norm[docs]))
+
+            scores = np.bincount(
+                np.concatenate(all_docs), weights=np.concatenate(all_scores), minlength=len(self.ids)
+            )
+            candidates = np.flatnonzero(scores)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            # スコアの高い順（同点は登録順）
+            top = candidates[np.lexsort((candidates, -scores[candidates]))]
+            return [(self.ids[slot], float(scores[slot])) for slot in top.tolist()]
+
+    def save(self) -> None:
+        """インデックスをnpz形式で保存（差分をまとめ、転置リストが空の語は除いて書き出す）"""
+        with self._lock:
+            if self.path is None:
+                return
+            self._merge()
+            sizes = np.diff(self._offsets)
+            used = sizes > 0
+            terms = sorted(self._vocab, key=self._vocab.get)
+            offsets = np.zeros(int(used.sum()) + 1, dtype=np.int64)
+            np.cumsum(sizes[used], out=offsets[1:])
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + ".tmp.npz")
+            np.savez_compressed(
+                tmp_path,
+                ids=np.array(self.ids, dtype=str),
+                doc_lengths=np.frombuffer(self.doc_lengths, dtype=np.uint32),
+                terms=np.array([term for term, keep in zip(terms, used.tolist()) if keep], dtype=str),
+                offsets=offsets,
+                posting_docs=self._posting_docs,
+                posting_counts=self._posting_counts,
+            )
+            os.replace(tmp_path, self.path)
+
+    def load(self) -> None:
+        """保存されたインデックスを読み込む"""
+        with self._lock:
+            if self.path is None or not self.path.exists():
+                return
+            data = np.load(self.path)
+            self._reset()
+            self.ids = data["ids"].tolist()
+            self.doc_lengths = array("I", data["doc_lengths"].astype(np.uint32).tobytes())
+            self._alive = array("B", bytes([1]) * len(self.ids))
+            self._slots = {id_: slot for slot, id_ in enumerate(self.ids)}
+            self._total_length = int(data["doc_lengths"].sum())
+            self._vocab = {term: term_id for term_id, term in enumerate(data["terms"].tolist())}
+            self._offsets = data["offsets"].astype(np.int64)
+            self._posting_docs = data["posting_docs"].astype(np.uint32)
+            self._posting_counts = data["posting_counts"].astype(np.uint32)
+
+    def clear(self) -> None:
+        """インデックスを空にし、保存ファイルを削除"""
+        with self._lock:
+            self._reset()
+            if self.path is not None and self.path.exists():
+                self.path.unlink()
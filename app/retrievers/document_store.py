@@ -1,59 +1,254 @@
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional, Sequence
 
+from app.config import (
+    CHROMA_PERSIST_DIRECTORY,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    EMBEDDING_CACHE_PATH,
+    HYBRID_MAX_DF_RATIO,
+    HYBRID_SEARCH,
+    INGEST_BATCH_SIZE,
+    INGEST_WORKERS,
+    PDF_CACHE_MAX_FILES,
+    PDF_CACHE_PATH,
+)
+from app.embedders.embedding_cache import EmbeddingCache
 from app.embedders.gemini_embedder import GeminiEmbedder
 from app.loaders.document_loader import DocumentLoader
+from app.loaders.parallel_loader import ParallelDocumentProcessor
+from app.loaders.pdf_extractor import PdfExtractor
+from app.loaders.pdf_page_cache import PdfPageCache
+from app.retrievers.bm25_index import BM25Index
+from app.retrievers.manifest import IngestManifest
 from app.retrievers.vector_store import VectorStore
 from app.splitters.text_splitter import TextSplitter
+from app.utils.metrics import count, timed_iter
 
 
 class DocumentStore:
     """文書のベクトル登録と検索を管理するクラス"""
 
-    def __init__(self, collection_name: str = "documents"):
+    def __init__(
+        self,
+        collection_name: str = "documents",
+        embedder: Optional[GeminiEmbedder] = None,
+        vector_store: Optional[VectorStore] = None,
+        pdf_extractor: Optional[PdfExtractor] = None,
+        manifest: Optional[IngestManifest] = None,
+        lexical_index: Optional[BM25Index] = None,
+        ingest_workers: Optional[int] = None
+    ):
         """
         Args:
             collection_name: コレクション名
+            embedder: 埋め込み生成に使うEmbedder（省略時はキャッシュ付きのGeminiEmbedder）
+            vector_store: ベクトルストア（省略時は設定に従って生成）
+            pdf_extractor: PDFのテキスト抽出器（省略時は設定のキャッシュを使って生成）
+            manifest: 登録済みファイルのマニフェスト（省略時はCHROMA_PERSIST_DIRECTORYに作成）
+            lexical_index: ハイブリッド検索用のBM25インデックス
+                （省略時はHYBRID_SEARCHが有効ならCHROMA_PERSIST_DIRECTORYに作成）
+            ingest_workers: 文書の読み込みに使うワーカープロセス数（省略時は設定のINGEST_WORKERS）
         """
-        self.embedder = GeminiEmbedder()
-        self.vector_store = VectorStore(collection_name)
+        if embedder is None:
+            cache = None
+            if EMBEDDING_CACHE_PATH:
+                cache = EmbeddingCache(EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+            embedder = GeminiEmbedder(cache=cache)
+        self.embedder = embedder
+        if vector_store is None:
+            vector_store = VectorStore(collection_name, embedder=self.embedder)
+        self.vector_store = vector_store
         self.splitter = TextSplitter()
+        if manifest is None:
+            manifest = IngestManifest(
+                Path(CHROMA_PERSIST_DIRECTORY) / f"{collection_name}.manifest.json"
+            )
+        self.manifest = manifest
+        # ハイブリッド検索用のBM25インデックス（ベクトルストアと同時に更新する）
+        if lexical_index is None and HYBRID_SEARCH:
+            lexical_index = BM25Index(
+                Path(CHROMA_PERSIST_DIRECTORY) / f"{collection_name}.bm25.npz",
+                max_df_ratio=HYBRID_MAX_DF_RATIO
+            )
+        self.lexical_index = lexical_index
+        # PDFはページ範囲ごとに並列に抽出し、抽出したテキストをキャッシュする
+        if pdf_extractor is None:
+            pdf_extractor = PdfExtractor(
+                cache=PdfPageCache(PDF_CACHE_PATH, max_files=PDF_CACHE_MAX_FILES) if PDF_CACHE_PATH else None
+            )
+        self.pdf_extractor = pdf_extractor
+        self.ingest_workers = INGEST_WORKERS if ingest_workers is None else ingest_workers
+        self.ingest_batch_size = INGEST_BATCH_SIZE
 
     def add_documents(
         self,
         directory: Path,
         metadata: Optional[dict] = None
-    ) -> None:
+    ) -> Dict[str, int]:
         """
         ディレクトリ内の文書を読み込み、ベクトルストアに登録
 
+        前回の取り込み結果をマニフェストと比較し、新規・変更されたファイルだけを
+        読み込み・分割・登録する。変更・削除されたファイルのチャンクは削除する。
+        読み込みと分割はプロセスプールで並列に行い、完了したファイルから
+        一定数のチャンクごとにまとめてベクトルストアへ登録する。
+
         Args:
             directory: 文書が格納されているディレクトリ
             metadata: 追加するメタデータ（オプション）
+
+        Returns:
+            Dict[str, int]: 追加・更新・削除・未変更のファイル数と追加・削除したチャンク数、
+                PDFから抽出した・キャッシュから読んだページ数
         """
-        # 文書の読み込み
-        loader = DocumentLoader()
-        texts = loader.load_documents(directory)
+        directory = Path(directory)
+        stats = {
+            "added": 0,
+            "updated": 0,
+            "deleted": 0,
+            "unchanged": 0,
+            "chunks_added": 0,
+            "chunks_deleted": 0,
+            "pdf_pages_extracted": 0,
+            "pdf_pages_cached": 0,
+        }
+
+        # メタデータが変わった場合はすべてのファイルを登録し直す
+        metadata_key = IngestManifest.hash_metadata(metadata)
+        force = self.manifest.metadata_key != metadata_key
+        # BM25インデックスを導入する前に取り込み済みの場合は、インデックスを作るため登録し直す
+        if (
+            self.lexical_index is not None and self.lexical_index.path is not None
+            and not self.lexical_index.path.exists() and self.manifest.files
+        ):
+            force = True
+        self.manifest.metadata_key = metadata_key
+
+        # 新規・変更されたファイルの抽出
+        changed = {}
+        seen = set()
+        for file_path in DocumentLoader.find_documents(directory):
+            file_key = str(file_path.resolve())
+            seen.add(file_key)
+            stat = file_path.stat()
+            entry = self.manifest.get(file_key)
+
+            # mtimeとサイズが同じなら内容を読まずに未変更とみなす
+            if (
+                not force and entry is not None
+                and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size
+            ):
+                stats["unchanged"] += 1
+                continue
 
-        # テキストの分割
-        chunks = self.splitter.split_texts(texts)
+            content_hash = IngestManifest.hash_file(file_path)
+            if not force and entry is not None and entry["sha256"] == content_hash:
+                entry["mtime"] = stat.st_mtime
+                stats["unchanged"] += 1
+                continue
 
-        # メタデータの準備
-        if metadata is None:
-            metadata = {}
-        metadatas = [metadata.copy() for _ in chunks]
+            changed[file_path] = {
+                "file_key": file_key,
+                "entry": entry,
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+                "sha256": content_hash,
+            }
 
-        # ベクトルストアへの登録
+        # 読み込み・分割とベクトルストアへの登録
+        # ファイルが1つだけの場合はプロセスプールを起動しない（PDFはページ単位で並列化できるため除く）
+        parallel = len(changed) > 1 or any(path.suffix.lower() == '.pdf' for path in changed)
+        processor = ParallelDocumentProcessor(
+            chunk_size=self.splitter.chunk_size,
+            chunk_overlap=self.splitter.chunk_overlap,
+            max_workers=self.ingest_workers if parallel else 0,
+            pdf_extractor=self.pdf_extractor
+        )
+        batch = []
+        batch_chunks = 0
+        file_hashes = {file_path: item["sha256"] for file_path, item in changed.items()}
+        for file_path, chunks in timed_iter("load_split", processor.process(list(changed), file_hashes)):
+            item = changed[file_path]
+            count("files_loaded_total")
+            count("bytes_loaded_total", item["size"])
+            count("chunks_total", len(chunks))
+            timing = self.pdf_extractor.timings.get(str(file_path))
+            if timing is not None:
+                stats["pdf_pages_extracted"] += timing["pages"] - timing["cached_pages"]
+                stats["pdf_pages_cached"] += timing["cached_pages"]
+            item["ids"], item["chunks"], item["metadatas"] = [], [], []
+            for offset, chunk, section in chunks:
+                item["ids"].append(IngestManifest.chunk_id(item["file_key"], offset, chunk))
+                item["chunks"].append(chunk)
+                item["metadatas"].append({
+                    "source": file_path.relative_to(directory).as_posix(),
+                    "file_path": item["file_key"],
+                    "start_index": offset,
+                    **section,
+                    **(metadata or {}),
+                })
+            batch.append(item)
+            batch_chunks += len(chunks)
+            if batch_chunks >= self.ingest_batch_size:
+                self._flush(batch, stats)
+                batch = []
+                batch_chunks = 0
+        self._flush(batch, stats)
+
+        # 削除されたファイルのチャンクを削除
+        for file_key in self.manifest.keys_under(directory):
+            if file_key not in seen:
+                entry = self.manifest.remove(file_key)
+                self.vector_store.delete_texts(entry["chunk_ids"])
+                if self.lexical_index is not None:
+                    self.lexical_index.remove(entry["chunk_ids"])
+                stats["chunks_deleted"] += len(entry["chunk_ids"])
+                stats["deleted"] += 1
+
+        # ベクトルストアの書き出しは取り込みの最後に1回だけ行う（マニフェストより先に保存する）
+        self.vector_store.flush()
+        self.manifest.save()
+        if self.lexical_index is not None:
+            self.lexical_index.save()
+        return stats
+
+    def _flush(self, batch: List[dict], stats: Dict[str, int]) -> None:
+        """分割済みファイルのチャンクをまとめてベクトルストアに反映し、マニフェストを更新"""
+        if not batch:
+            return
+
+        # 古いチャンクを削除してから新しいチャンクを登録
+        stale_ids = []
+        for item in batch:
+            if item["entry"] is not None:
+                stale_ids.extend(sorted(set(item["entry"]["chunk_ids"]) - set(item["ids"])))
+        self.vector_store.delete_texts(stale_ids)
+        stats["chunks_deleted"] += len(stale_ids)
+
+        texts = [chunk for item in batch for chunk in item["chunks"]]
+        ids = [id_ for item in batch for id_ in item["ids"]]
         self.vector_store.add_texts(
-            texts=chunks,
-            metadatas=metadatas
+            texts=texts,
+            metadatas=[meta for item in batch for meta in item["metadatas"]],
+            ids=ids
         )
+        if self.lexical_index is not None:
+            self.lexical_index.remove(stale_ids)
+            self.lexical_index.add(ids, texts)
+
+        for item in batch:
+            stats["chunks_added"] += len(item["chunks"])
+            stats["updated" if item["entry"] is not None else "added"] += 1
+            self.manifest.set(
+                item["file_key"], item["mtime"], item["size"], item["sha256"], item["ids"]
+            )
 
     def search(
         self,
         query: str,
         k: int = 5,
-        filter: Optional[dict] = None
+        filter: Optional[dict] = None,
+        query_embedding: Optional[Sequence[float]] = None
     ) -> List[dict]:
         """
         クエリに類似した文書を検索
@@ -62,6 +257,7 @@ class DocumentStore:
             query: 検索クエリ
             k: 取得する結果の数
             filter: 検索フィルター（オプション）
+            query_embedding: 計算済みのクエリ埋め込み（オプション）
 
         Returns:
             List[dict]: 検索結果のリスト
@@ -69,9 +265,13 @@ class DocumentStore:
         return self.vector_store.similarity_search(
             query=query,
             k=k,
-            filter=filter
+            filter=filter,
+            query_embedding=query_embedding
         )
 
     def clear(self) -> None:
-        """コレクションを削除"""
-        self.vector_store.delete_collection() 
\ No newline at end of file
+        """コレクションとマニフェスト、BM25インデックスを削除"""
+        self.vector_store.delete_collection()
+        self.manifest.delete()
+        if self.lexical_index is not None:
+            self.lexical_index.clear() 
\ No newline at end of file
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+
+class IngestManifest:
+    """
+    取り込み済みファイルの状態を記録するマニフェスト
+
+    ファイルごとにmtime・サイズ・内容ハッシュと登録したチャンクIDを保持し、
+    次回の取り込みで新規・変更・削除されたファイルだけを処理できるようにする。
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Args:
+            path: マニフェストファイル（JSON）のパス
+        """
+        self.path = Path(path)
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.metadata_key: Optional[str] = None
+        self.load()
+
+    def load(self) -> None:
+        """マニフェストファイルを読み込む（存在しない場合は空）"""
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("version") != self.VERSION:
+            return
+        self.files = data.get("files", {})
+        self.metadata_key = data.get("metadata_key")
+
+    def save(self) -> None:
+        """マニフェストファイルを書き出す（一時ファイル経由で置き換える）"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(
+                {
+                    "version": self.VERSION,
+                    "metadata_key": self.metadata_key,
+                    "files": self.files,
+                },
+                f,
+                ensure_ascii=False
+            )
+        os.replace(tmp_path, self.path)
+
+    def get(self, file_key: str) -> Optional[Dict[str, Any]]:
+        """ファイルの記録を取得"""
+        return self.files.get(file_key)
+
+    def set(
+        self,
+        file_key: str,
+        mtime: float,
+        size: int,
+        content_hash: str,
+        chunk_ids: List[str]
+    ) -> None:
+        """ファイルの記録を登録・更新"""
+        self.files[file_key] = {
+            "mtime": mtime,
+            "size": size,
+            "sha256": content_hash,
+            "chunk_ids": chunk_ids,
+        }
+
+    def remove(self, file_key: str) -> Optional[Dict[str, Any]]:
+        """ファイルの記録を削除し、削除した記録を返す"""
+        return self.files.pop(file_key, None)
+
+    def keys_under(self, directory: Union[str, Path]) -> List[str]:
+        """指定ディレクトリ配下のファイルの記録キーを列挙"""
+        prefix = str(Path(directory).resolve()) + os.sep
+        return [key for key in self.files if key.startswith(prefix)]
+
+    def delete(self) -> None:
+        """マニフェストファイルを削除"""
+        self.files = {}
+        self.metadata_key = None
+        if self.path.exists():
+            self.path.unlink()
+
+    @staticmethod
+    def hash_file(file_path: Union[str, Path]) -> str:
+        """ファイル内容のSHA-256ハッシュを計算"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def hash_metadata(metadata: Optional[dict]) -> str:
+        """付与するメタデータのハッシュを計算"""
+        encoded = json.dumps(metadata or {}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def chunk_id(file_key: str, offset: int, chunk: str) -> str:
+        """(ファイル, チャンク位置, チャンク内容)から安定したチャンクIDを生成"""
+        file_hash = hashlib.sha1(file_key.encode('utf-8')).hexdigest()[:16]
+        chunk_hash = hashlib.sha1(chunk.encode('utf-8')).hexdigest()[:16]
+        return f"{file_hash}:{offset}:{chunk_hash}"
@@ -0,0 +1,187 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.retrievers.bm25_index import tokenize
+
+Scorer = Callable[[str, List[str]], List[float]]
+
+
+def _token_weight(token: str) -> float:
+    """識別子らしいトークンほど重くする（数字を含む英数字 > 英単語 > 文字bigram）"""
+    if token.isascii():
+        return 3.0 if any(c.isdigit() for c in token) else 2.0
+    return 1.0
+
+
+def lexical_overlap_score(query: str, texts: List[str]) -> List[float]:
+    """
+    質問のトークンがテキストに含まれる割合でスコアを付ける軽量なスコア関数
+
+    エラーコードや製品名などの英数字のトークンは文字bigramより重く数える。
+
+    Args:
+        query: 質問
+        texts: スコアを付けるテキストのリスト
+
+    Returns:
+        List[float]: 0〜1のスコアのリスト
+    """
+    query_tokens = set(tokenize(query))
+    total = sum(_token_weight(token) for token in query_tokens)
+    if total == 0:
+        return [0.0 for _ in texts]
+    scores = []
+    for text in texts:
+        text_tokens = set(tokenize(text))
+        scores.append(sum(_token_weight(t) for t in query_tokens if t in text_tokens) / total)
+    return scores
+
+
+class Reranker:
+    """
+    検索候補を並べ替えるクラス
+
+    候補をバッチに分けてスコア関数で採点し直し、スコアは（質問のハッシュ, チャンクID）
+    ごとにキャッシュする。rank_weightを指定した場合は、スコアを検索時の順位と重み付きで
+    足し合わせて並べ替える。採点にかけた時間が上限を超えた場合は、検索時の順位のまま返す。
+
+    時間の上限は各バッチの採点を始める前に確認する緩い上限で、採点中のバッチは中断しない。
+    そのため上限を超える時間は最大で1バッチ分の採点時間になり、batch_sizeを小さくするほど
+    上限に近づく。
+    """
+
+    def __init__(
+        self,
+        scorer: Scorer = lexical_overlap_score,
+        batch_size: int = 16,
+        latency_budget: Optional[float] = 0.5,
+        cache_size: int = 10000,
+        rank_weight: float = 0.0,
+        clock: Callable[[], float] = time.perf_counter
+    ):
+        """
+        Args:
+            scorer: 質問とテキストのリストを受け取り、スコアのリストを返す関数
+            batch_size: 1回の採点にまとめる候補数
+            latency_budget: 採点にかけてよい秒数（Noneで無制限）。各バッチの採点前に確認するため、
+                最大で1バッチ分の採点時間だけ超えることがある
+            cache_size: キャッシュするスコアの最大数
+            rank_weight: 検索時の順位の重み（0〜1、0でスコアのみで並べ替える）。
+                順位は1位を1、最下位付近を0とする値に変換し、
+                (1 - rank_weight) * スコア + rank_weight * 順位の値で並べ替える
+            clock: 時刻を返す関数
+        """
+        self.scorer = scorer
+        self.batch_size = batch_size
+        self.latency_budget = latency_budget
+        self.cache_size = cache_size
+        self.rank_weight = rank_weight
+        self._clock = clock
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.cache_hits = 0
+        self.scored = 0
+        self.fallbacks = 0
+
+    def rerank(
+        self,
+        query: str,
+        docs: List[Dict[str, Any]],
+        top_k: int
+    ) -> List[Dict[str, Any]]:
+        """
+        候補を採点し直してスコアの高い順にtop_k件を返す
+
+        Args:
+            query: 質問
+            docs: 検索順位の高い順の候補
+            top_k: 返す件数
+
+        Returns:
+            List[Dict[str, Any]]: 並べ替えた候補（rerank_scoreに順位と合わせたスコアを含む）。
+                時間の上限を超えた場合は検索時の順位の上位top_k件
+        """
+        started_at = self._clock()
+        query_hash = hashlib.sha1(query.encode("utf-8")).hexdigest()
+        keys = [(query_hash, self._doc_key(doc)) for doc in docs]
+
+        scores: List[Optional[float]] = [None] * len(docs)
+        with self._lock:
+            self.calls += 1
+            for i, key in enumerate(keys):
+                score = self._cache.get(key)
+                if score is not None:
+                    self._cache.move_to_end(key)
+                    scores[i] = score
+                    self.cache_hits += 1
+
+        missing = [i for i, score in enumerate(scores) if score is None]
+        for start in range(0, len(missing), self.batch_size):
+            if (
+                self.latency_budget is not None
+                and self._clock() - started_at > self.latency_budget
+            ):
+                # 上限を超えたら次のバッチに進まず検索時の順位を使う（採点済みのスコアはキャッシュに残る）
+                with self._lock:
+                    self.fallbacks += 1
+                return docs[:top_k]
+            batch = missing[start:start + self.batch_size]
+            batch_scores = self.scorer(query, [docs[i]["text"] for i in batch])
+            with self._lock:
+                for i, score in zip(batch, batch_scores):
+                    scores[i] = float(score)
+                    self._cache[keys[i]] = float(score)
+                    self._cache.move_to_end(keys[i])
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+                self.scored += len(batch)
+
+        if self.rank_weight:
+            scores = [
+                (1.0 - self.rank_weight) * score + self.rank_weight * (1.0 - i / len(docs))
+                for i, score in enumerate(scores)
+            ]
+        # 同点の場合は検索時の順位を保つ
+        order = sorted(range(len(docs)), key=lambda i: -scores[i])[:top_k]
+        return [{**docs[i], "rerank_score": scores[i]} for i in order]
+
+    def stats(self) -> Dict[str, int]:
+        """呼び出し回数・キャッシュヒット数・採点した候補数・フォールバック回数を返す"""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "cache_hits": self.cache_hits,
+                "scored": self.scored,
+                "fallbacks": self.fallbacks,
+                "cache_entries": len(self._cache),
+            }
+
+    @staticmethod
+    def _doc_key(doc: Dict[str, Any]) -> str:
+        """キャッシュキーに使うチャンクID（IDがない場合は本文のハッシュ）"""
+        id_ = doc.get("id")
+        if id_ is not None:
+            return str(id_)
+        return hashlib.sha1(doc["text"].encode("utf-8")).hexdigest()
+
+
+def create_reranker(name: str, **kwargs: Any) -> Optional[Reranker]:
+    """
+    設定に応じたRerankerを生成
+
+    Args:
+        name: "lexical"または"none"
+        **kwargs: Rerankerに渡す引数
+
+    Returns:
+        Optional[Reranker]: Reranker（"none"の場合はNone）
+    """
+    if name == "none":
+        return None
+    if name == "lexical":
+        return Reranker(lexical_overlap_score, **kwargs)
+    raise ValueError(f"Unsupported reranker: {name}")
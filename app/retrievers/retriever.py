@@ -1,34 +1,248 @@
-from typing import List, Dict, Any
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
-from app.config import MAX_RETRIEVAL_DOCS
+import numpy as np
+
+from app.config import (
+    HYBRID_CANDIDATES,
+    HYBRID_LEXICAL_WEIGHT,
+    HYBRID_RRF_K,
+    HYBRID_VECTOR_WEIGHT,
+    MAX_RETRIEVAL_DOCS,
+    RERANK_BATCH_SIZE,
+    RERANK_CACHE_SIZE,
+    RERANK_CANDIDATES,
+    RERANK_LATENCY_BUDGET,
+    RERANK_RANK_WEIGHT,
+    RERANKER,
+)
 from app.retrievers.document_store import DocumentStore
+from app.retrievers.reranker import Reranker, create_reranker
+from app.utils.metrics import stage
 
 
 class Retriever:
-    """質問に対するベクトル検索を実装するクラス"""
+    """
+    質問に対する文書検索を実装するクラス
+
+    文書ストアがBM25インデックスを持つ場合は、ベクトル検索とBM25の結果を
+    Reciprocal Rank Fusionで統合する（ハイブリッド検索）。
+    Rerankerが設定されている場合は、多めに取得した候補を並べ替えて上位だけを返す。
+    """
 
-    def __init__(self, document_store: DocumentStore):
+    def __init__(
+        self,
+        document_store: DocumentStore,
+        vector_weight: float = HYBRID_VECTOR_WEIGHT,
+        lexical_weight: float = HYBRID_LEXICAL_WEIGHT,
+        rrf_k: int = HYBRID_RRF_K,
+        candidates: int = HYBRID_CANDIDATES,
+        reranker: Optional[Reranker] = None,
+        rerank_candidates: int = RERANK_CANDIDATES
+    ):
         """
         Args:
             document_store: 文書ストアのインスタンス
+            vector_weight: 統合時のベクトル検索の重み（0でBM25のみ）
+            lexical_weight: 統合時のBM25の重み（0でベクトル検索のみ）
+            rrf_k: Reciprocal Rank Fusionの順位の平滑化定数
+            candidates: 統合前にそれぞれの検索で取得する候補数
+            reranker: 候補の並べ替えに使うReranker（省略時は設定から生成）
+            rerank_candidates: 並べ替えのために取得する候補数
         """
         self.document_store = document_store
+        self.vector_weight = vector_weight
+        self.lexical_weight = lexical_weight
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        if reranker is None:
+            reranker = create_reranker(
+                RERANKER,
+                batch_size=RERANK_BATCH_SIZE,
+                latency_budget=RERANK_LATENCY_BUDGET or None,
+                cache_size=RERANK_CACHE_SIZE,
+                rank_weight=RERANK_RANK_WEIGHT
+            )
+        self.reranker = reranker
+        self.rerank_candidates = rerank_candidates
 
-    def retrieve(self, query: str, n_results: int = 5) -> List[Dict[str, Any]]:
+    def retrieve(
+        self,
+        query: str,
+        n_results: int = MAX_RETRIEVAL_DOCS,
+        query_embedding: Optional[Sequence[float]] = None
+    ) -> List[Dict[str, Any]]:
         """
         クエリに関連する文書を検索
 
+        Rerankerが設定されている場合は、多めに取得した候補を並べ替えて上位を返す。
+
         Args:
             query: 検索クエリ
             n_results: 取得する結果の数
+            query_embedding: 計算済みのクエリ埋め込み（オプション）
 
         Returns:
             List[Dict[str, Any]]: 検索結果のリスト
         """
-        return self.document_store.vector_store.search(
-            query=query,
-            n_results=n_results
+        if self.reranker is None:
+            return self._search(query, n_results, query_embedding)
+        candidates = self._search(query, max(n_results, self.rerank_candidates), query_embedding)
+        with stage("rerank"):
+            return self.reranker.rerank(query, candidates, n_results)
+
+    def retrieve_batch(
+        self,
+        queries: List[str],
+        n_results: int = MAX_RETRIEVAL_DOCS,
+        query_embeddings: Optional[Sequence[Sequence[float]]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        複数のクエリに関連する文書をまとめて検索
+
+        ベクトル検索はすべてのクエリを1回の検索でまとめて実行する。
+
+        Args:
+            queries: 検索クエリのリスト
+            n_results: クエリごとに取得する結果の数
+            query_embeddings: 計算済みのクエリ埋め込み（オプション）
+
+        Returns:
+            List[List[Dict[str, Any]]]: クエリと同じ順序の検索結果のリスト
+        """
+        if self.reranker is None:
+            return self._search_batch(queries, n_results, query_embeddings)
+        candidates_list = self._search_batch(
+            queries, max(n_results, self.rerank_candidates), query_embeddings
         )
+        with stage("rerank"):
+            return [
+                self.reranker.rerank(query, candidates, n_results)
+                for query, candidates in zip(queries, candidates_list)
+            ]
+
+    def _search(
+        self,
+        query: str,
+        n_results: int,
+        query_embedding: Optional[Sequence[float]]
+    ) -> List[Dict[str, Any]]:
+        """ベクトル検索（BM25インデックスがあればハイブリッド検索）を実行"""
+        lexical_index = getattr(self.document_store, "lexical_index", None)
+        if lexical_index is None or self.lexical_weight <= 0:
+            return self.document_store.vector_store.search(
+                query=query,
+                n_results=n_results,
+                query_embedding=query_embedding
+            )
+
+        n_candidates = max(n_results, self.candidates)
+        vector_results = []
+        if self.vector_weight > 0:
+            vector_results = self.document_store.vector_store.search(
+                query=query,
+                n_results=n_candidates,
+                query_embedding=query_embedding
+            )
+        with stage("lexical_query"):
+            lexical_results = lexical_index.search(query, n_candidates)
+        return self._fuse(vector_results, lexical_results, n_results)
+
+    def _search_batch(
+        self,
+        queries: List[str],
+        n_results: int,
+        query_embeddings: Optional[Sequence[Sequence[float]]]
+    ) -> List[List[Dict[str, Any]]]:
+        """_searchの複数クエリ版（ベクトル検索は1回にまとめる）"""
+        vector_store = self.document_store.vector_store
+        lexical_index = getattr(self.document_store, "lexical_index", None)
+        if lexical_index is None or self.lexical_weight <= 0:
+            return vector_store.search_batch(
+                queries,
+                n_results=n_results,
+                query_embeddings=query_embeddings
+            )
+
+        n_candidates = max(n_results, self.candidates)
+        vector_results = [[] for _ in queries]
+        if self.vector_weight > 0:
+            vector_results = vector_store.search_batch(
+                queries,
+                n_results=n_candidates,
+                query_embeddings=query_embeddings
+            )
+        with stage("lexical_query"):
+            lexical_results = [lexical_index.search(query, n_candidates) for query in queries]
+        return [
+            self._fuse(vector, lexical, n_results)
+            for vector, lexical in zip(vector_results, lexical_results)
+        ]
+
+    def _fuse(
+        self,
+        vector_results: List[Dict[str, Any]],
+        lexical_results: List[Tuple[str, float]],
+        n_results: int
+    ) -> List[Dict[str, Any]]:
+        """
+        ベクトル検索とBM25の結果をReciprocal Rank Fusionで統合
+
+        各結果の順位rに対して weight / (rrf_k + r) を合計したスコアの高い順に並べる。
+
+        Args:
+            vector_results: ベクトル検索の結果
+            lexical_results: BM25の（文書ID, スコア）のリスト
+            n_results: 取得する結果の数
+
+        Returns:
+            List[Dict[str, Any]]: 統合した検索結果（scoreに統合スコアを含む）
+        """
+        scores: Dict[str, float] = {}
+        for rank, doc in enumerate(vector_results, 1):
+            scores[doc["id"]] = scores.get(doc["id"], 0.0) + self.vector_weight / (self.rrf_k + rank)
+        for rank, (id_, _) in enumerate(lexical_results, 1):
+            scores[id_] = scores.get(id_, 0.0) + self.lexical_weight / (self.rrf_k + rank)
+        top_ids = sorted(scores, key=lambda id_: -scores[id_])[:n_results]
+
+        # BM25でのみ見つかった文書はベクトルストアから本文とメタデータを取得する
+        docs = {doc["id"]: doc for doc in vector_results}
+        missing = [id_ for id_ in top_ids if id_ not in docs]
+        if missing:
+            for doc in self.document_store.vector_store.get_texts(missing):
+                docs[doc["id"]] = doc
+        return [
+            {**docs[id_], "score": scores[id_]}
+            for id_ in top_ids if id_ in docs
+        ]
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """
+        検索に使うのと同じEmbedderでクエリの埋め込みを生成
+
+        Args:
+            query: 検索クエリ
+
+        Returns:
+            np.ndarray: 埋め込みベクトル
+        """
+        return self.document_store.vector_store.embedder.embed_query(query)
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        複数のクエリの埋め込みをまとめて生成
+
+        Args:
+            queries: 検索クエリのリスト
+
+        Returns:
+            np.ndarray: 入力と同じ順序の埋め込みベクトルの行列
+        """
+        return self.document_store.vector_store.embedder.embed_queries(queries)
+
+    @property
+    def collection_version(self) -> int:
+        """コレクションのバージョン（登録・削除のたびに変わる）"""
+        return self.document_store.vector_store.version
 
     def format_context(self, documents: List[dict]) -> str:
         """
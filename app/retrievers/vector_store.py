@@ -1,29 +1,88 @@
-from pathlib import Path
-from typing import List, Optional, Dict, Any
+import uuid
+from typing import Any, Dict, List, Optional, Sequence
 
-import chromadb
+from app.config import (
+    CHROMA_PERSIST_DIRECTORY,
+    IVF_NLIST,
+    IVF_NPROBE,
+    VECTOR_BACKEND,
+    VECTOR_DTYPE,
+    VECTOR_INDEX_TYPE,
+)
+from app.utils.metrics import stage
 
-from app.config import CHROMA_PERSIST_DIRECTORY
+
+def create_backend(
+    collection_name: str,
+    backend: str = VECTOR_BACKEND,
+    embedding_model: Optional[str] = None
+) -> Any:
+    """
+    設定に応じたベクトルインデックスバックエンドを生成
+
+    Args:
+        collection_name: コレクション名
+        backend: "chroma"または"numpy"
+        embedding_model: 埋め込みモデル名（コレクションに記録される）
+
+    Returns:
+        Any: バックエンドのインスタンス
+    """
+    if backend == "chroma":
+        from app.retrievers.backends.chroma_backend import ChromaBackend
+        return ChromaBackend(collection_name, CHROMA_PERSIST_DIRECTORY, embedding_model)
+    if backend == "numpy":
+        from app.retrievers.backends.numpy_backend import NumpyBackend
+        return NumpyBackend(
+            collection_name,
+            CHROMA_PERSIST_DIRECTORY,
+            index_type=VECTOR_INDEX_TYPE,
+            nlist=IVF_NLIST,
+            nprobe=IVF_NPROBE,
+            dtype=VECTOR_DTYPE,
+            embedding_model=embedding_model
+        )
+    raise ValueError(f"Unsupported vector backend: {backend}")
 
 
 class VectorStore:
-    """ChromaDBを使用したベクトルストアの管理クラス"""
+    """
+    ベクトルストアの管理クラス（バックエンドはChromaDBまたはNumPy）
 
-    def __init__(self, collection_name: str = "documents"):
+    登録と検索の埋め込みはすべて同じEmbedderで計算し、バックエンドには
+    計算済みの埋め込みを渡す。
+    """
+
+    def __init__(
+        self,
+        collection_name: str = "documents",
+        backend: Optional[Any] = None,
+        embedder: Optional[Any] = None
+    ):
         """
         Args:
             collection_name: コレクション名
+            backend: ベクトルインデックスのバックエンド（省略時は設定から生成）
+            embedder: 登録・検索に使うEmbedder（省略時はGeminiEmbedder）
         """
-        self.persist_directory = Path(".chroma")
-        self.persist_directory.mkdir(parents=True, exist_ok=True)
-        self.client = chromadb.PersistentClient(path=str(self.persist_directory))
-        self.collection = self.client.get_or_create_collection(name=collection_name)
+        if embedder is None:
+            from app.embedders.gemini_embedder import GeminiEmbedder
+            embedder = GeminiEmbedder()
+        self.collection_name = collection_name
+        self.embedder = embedder
+        # 登録・削除のたびに増える値。キャッシュの無効化判定に使う
+        self.version = 0
+        self.backend = backend if backend is not None else create_backend(
+            collection_name,
+            embedding_model=embedder.model_name
+        )
 
     def add_texts(
         self,
         texts: List[str],
         metadatas: List[Dict[str, Any]] = None,
-        ids: List[str] = None
+        ids: List[str] = None,
+        embeddings: Optional[Sequence[Sequence[float]]] = None
     ) -> None:
         """
         テキストとその埋め込みをベクトルストアに追加
@@ -31,8 +90,12 @@ class VectorStore:
         Args:
             texts: 追加するテキストのリスト
             metadatas: メタデータのリスト（オプション）
-            ids: ドキュメントIDのリスト（オプション）
+            ids: ドキュメントIDのリスト（オプション）。同じIDが既にある場合は上書きされる
+            embeddings: 計算済みの埋め込み（オプション）
         """
+        if not texts:
+            return
+
         if metadatas is None:
             metadatas = [{"source": f"document_{i}", "type": "markdown"} for i in range(len(texts))]
         elif len(metadatas) == 0:
@@ -43,21 +106,29 @@ class VectorStore:
                 {"source": f"document_{i}", "type": "markdown", **meta} if not meta else meta
                 for i, meta in enumerate(metadatas)
             ]
-        
+
         if ids is None:
-            ids = [f"doc_{i}" for i in range(len(texts))]
-        
-        self.collection.add(
-            documents=texts,
-            metadatas=metadatas,
-            ids=ids
-        )
+            # 連番だと呼び出しごとにIDが衝突するため、一意なIDを割り当てる
+            ids = [f"doc_{uuid.uuid4().hex}" for _ in texts]
+
+        if embeddings is None:
+            embeddings = self.embedder.embed_texts(texts)
+
+        with stage("vector_upsert"):
+            self.backend.upsert(
+                ids=ids,
+                texts=texts,
+                metadatas=metadatas,
+                embeddings=embeddings
+            )
+        self.version += 1
 
     def search(
         self,
         query: str,
         n_results: int = 5,
-        filter: Dict[str, Any] = None
+        filter: Dict[str, Any] = None,
+        query_embedding: Optional[Sequence[float]] = None
     ) -> List[Dict[str, Any]]:
         """
         クエリに類似したテキストを検索
@@ -66,29 +137,112 @@ class VectorStore:
             query: 検索クエリ
             n_results: 取得する結果の数
             filter: 検索フィルター（オプション）
+            query_embedding: 計算済みのクエリ埋め込み（オプション）
 
         Returns:
             List[Dict[str, Any]]: 検索結果のリスト（テキストとメタデータを含む）
         """
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=n_results,
-            where=filter
-        )
-        
-        return [
-            {
-                "text": doc,
-                "metadata": meta,
-                "id": id_
-            }
-            for doc, meta, id_ in zip(
-                results["documents"][0],
-                results["metadatas"][0],
-                results["ids"][0]
+        if query_embedding is None:
+            query_embedding = self.embedder.embed_query(query)
+
+        with stage("vector_query"):
+            results = self.backend.query(
+                n_results=n_results,
+                query_embeddings=[query_embedding],
+                where=filter
             )
-        ]
+        return results[0]
+
+    def search_batch(
+        self,
+        queries: List[str],
+        n_results: int = 5,
+        filter: Dict[str, Any] = None,
+        query_embeddings: Optional[Sequence[Sequence[float]]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        複数のクエリをまとめて検索
+
+        クエリの埋め込みはバッチで生成し、バックエンドへは1回の検索で問い合わせる。
+
+        Args:
+            queries: 検索クエリのリスト
+            n_results: クエリごとに取得する結果の数
+            filter: 検索フィルター（オプション）
+            query_embeddings: 計算済みのクエリ埋め込み（オプション）
+
+        Returns:
+            List[List[Dict[str, Any]]]: クエリと同じ順序の検索結果のリスト
+        """
+        if not queries:
+            return []
+        if query_embeddings is None:
+            query_embeddings = self.embedder.embed_queries(queries)
+
+        with stage("vector_query"):
+            return self.backend.query(
+                n_results=n_results,
+                query_embeddings=query_embeddings,
+                where=filter
+            )
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 5,
+        filter: Dict[str, Any] = None,
+        query_embedding: Optional[Sequence[float]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        クエリに類似したテキストを検索（searchの別名）
+
+        Args:
+            query: 検索クエリ
+            k: 取得する結果の数
+            filter: 検索フィルター（オプション）
+            query_embedding: 計算済みのクエリ埋め込み（オプション）
+
+        Returns:
+            List[Dict[str, Any]]: 検索結果のリスト
+        """
+        return self.search(query=query, n_results=k, filter=filter, query_embedding=query_embedding)
+
+    def get_texts(self, ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        指定したIDのテキストとメタデータを取得
+
+        Args:
+            ids: ドキュメントIDのリスト
+
+        Returns:
+            List[Dict[str, Any]]: 見つかったテキストとメタデータ（text, metadata, id）
+        """
+        return self.backend.get(ids)
+
+    def delete_texts(self, ids: List[str]) -> None:
+        """
+        指定したIDのテキストをベクトルストアから削除
+
+        Args:
+            ids: 削除するドキュメントIDのリスト
+        """
+        if ids:
+            self.backend.delete(ids)
+            self.version += 1
+
+    def count(self) -> int:
+        """登録件数を返す"""
+        return self.backend.count()
+
+    def flush(self) -> None:
+        """
+        登録・削除した内容をディスクへ書き出す
+
+        バックエンドによっては登録・削除のたびには書き出さないため、一連の更新の最後に呼ぶ。
+        """
+        self.backend.flush()
 
     def delete_collection(self) -> None:
         """コレクションを削除"""
-        self.client.delete_collection(self.collection.name) 
\ No newline at end of file
+        self.backend.drop()
+        self.version += 1
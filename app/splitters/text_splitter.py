@@ -1,29 +1,59 @@
-from typing import List
+from typing import Callable, Dict, List, Optional, Tuple
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from app.config import CHUNK_LENGTH_UNIT, CHUNK_OVERLAP, CHUNK_SIZE
+from app.utils.text import estimate_tokens
 
-from app.config import CHUNK_SIZE, CHUNK_OVERLAP
+# PDFのページ区切り（DocumentLoaderがページの間に入れる）
+PAGE_BREAK = "\f"
+
+# 文の区切りとみなす文字（句点・感嘆符・疑問符・改行・改ページ）
+_SENTENCE_ENDS = ("。", "！", "？", "!", "?", "\n", PAGE_BREAK)
+# 文の区切りの直後に続く閉じ括弧（区切りに含める）
+_CLOSING = frozenset("」』）)")
+# 文が上限より長い場合の区切り（読点・空白）
+_CLAUSE_ENDS = ("、", "，", ",", " ", "　", "\t")
+# この文字列の改行の直後（Markdownの見出し行の先頭）では必ずチャンクを区切る
+_HEADING_MARK = "\n#"
+
+LENGTH_FUNCTIONS: Dict[str, Callable[[str], int]] = {
+    "chars": len,
+    "tokens": estimate_tokens,
+}
 
 
 class TextSplitter:
-    """テキストをチャンクに分割するクラス"""
+    """
+    テキストをチャンクに分割するクラス
+
+    チャンクの先頭から上限の長さまでの範囲で最後の文の区切り（句点・改行など）を探し、
+    そこまでを1つのチャンクにする。文の区切りがない場合は読点・空白、それもない場合は
+    上限の位置で切る。Markdownの見出しとPDFの改ページの前では必ず区切り、それ以外は
+    直前のチャンクの末尾の文をオーバーラップとして次のチャンクに含める。
+    区切りはチャンクの範囲内だけで探すため、テキストはほぼ1回の走査で分割される。
+    """
 
     def __init__(
         self,
         chunk_size: int = CHUNK_SIZE,
-        chunk_overlap: int = CHUNK_OVERLAP
+        chunk_overlap: int = CHUNK_OVERLAP,
+        length_function: Optional[Callable[[str], int]] = None
     ):
         """
         Args:
-            chunk_size: チャンクの最大サイズ（トークン数）
-            chunk_overlap: チャンク間のオーバーラップ（トークン数）
-        """
-        self.splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            length_function=len,
-            separators=["\n\n", "\n", "。", "、", " ", ""]
-        )
+            chunk_size: チャンクの最大サイズ（length_functionで数えた長さ）
+            chunk_overlap: チャンク間のオーバーラップ（length_functionで数えた長さ）
+            length_function: テキストの長さを数える関数（省略時は設定のCHUNK_LENGTH_UNITに従う）
+
+        Raises:
+            ValueError: オーバーラップがチャンクの最大サイズ以上の場合
+        """
+        if chunk_overlap >= chunk_size:
+            raise ValueError(
+                f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})"
+            )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.length_function = length_function or LENGTH_FUNCTIONS[CHUNK_LENGTH_UNIT]
 
     def split_text(self, text: str) -> List[str]:
         """
@@ -35,7 +65,46 @@ class TextSplitter:
         Returns:
             List[str]: 分割されたチャンクのリスト
         """
-        return self.splitter.split_text(text)
+        return [chunk for _, chunk in self.split_text_with_offsets(text)]
+
+    def split_text_with_offsets(self, text: str) -> List[Tuple[int, str]]:
+        """
+        テキストをチャンクに分割し、各チャンクの元テキスト中の開始位置を返す
+
+        Args:
+            text: 分割するテキスト
+
+        Returns:
+            List[Tuple[int, str]]: (開始位置, チャンク)のリスト
+        """
+        chunks: List[Tuple[int, str]] = []
+        start = 0
+        previous_end = 0
+        while start < len(text):
+            limit = self._limit(text, start)
+            hard_break = self._hard_break(text, start, limit)
+            if hard_break is not None:
+                end = hard_break
+            elif limit == len(text):
+                end = limit
+            else:
+                end = (
+                    self._last_boundary(text, start, limit, _SENTENCE_ENDS)
+                    or self._last_boundary(text, start, limit, _CLAUSE_ENDS)
+                    or limit
+                )
+            if end <= previous_end:
+                # オーバーラップの後に続く文が上限に収まらない場合は、オーバーラップなしでやり直す
+                start = previous_end
+                continue
+
+            self._emit(text, start, end, chunks)
+            previous_end = end
+            if hard_break is not None or end == len(text):
+                start = end
+            else:
+                start = self._overlap_start(text, start, end)
+        return chunks
 
     def split_texts(self, texts: List[str]) -> List[str]:
         """
@@ -50,4 +119,125 @@ class TextSplitter:
         chunks = []
         for text in texts:
             chunks.extend(self.split_text(text))
-        return chunks 
\ No newline at end of file
+        return chunks
+
+    def _limit(self, text: str, start: int) -> int:
+        """startから上限の長さに収まる最も遠い位置（最低1文字）"""
+        if self.length_function is len:
+            return min(start + self.chunk_size, len(text))
+        # 長さが上限を超えるまで範囲を倍にしてから探索する
+        high = min(start + self.chunk_size, len(text))
+        while self.length_function(text[start:high]) <= self.chunk_size:
+            if high == len(text):
+                return high
+            high = min(start + (high - start) * 2, len(text))
+        end = self._largest_within(
+            lambda position: self.length_function(text[start:position]),
+            self.chunk_size,
+            start,
+            high
+        )
+        return max(end, start + 1)
+
+    @staticmethod
+    def _largest_within(
+        length_at: Callable[[int], int],
+        budget: int,
+        low: int,
+        high: int
+    ) -> int:
+        """
+        length_at(x) <= budget となる最大のxを探す（length_atは単調増加、lowは条件を満たし、
+        highは満たさない前提）
+
+        長さが位置にほぼ比例することを使って補間で推定し、区間が半分以下に縮まなかった
+        場合は二分探索に切り替える。
+        """
+        length_low, length_high = length_at(low), length_at(high)
+        use_midpoint = False
+        while high - low > 1:
+            if use_midpoint:
+                guess = (low + high) // 2
+            else:
+                guess = low + (budget - length_low) * (high - low) // max(length_high - length_low, 1)
+                guess = min(max(guess, low + 1), high - 1)
+            width = high - low
+            length = length_at(guess)
+            if length <= budget:
+                low, length_low = guess, length
+            else:
+                high, length_high = guess, length
+            use_midpoint = (high - low) * 2 > width
+        return low
+
+    @staticmethod
+    def _hard_break(text: str, start: int, limit: int) -> Optional[int]:
+        """startより後、limitまでにある改ページの直後・見出し行の先頭のうち最初の位置"""
+        positions = []
+        for mark in (PAGE_BREAK, _HEADING_MARK):
+            found = text.find(mark, start, limit)
+            if found >= 0 and start < found + 1 < len(text):
+                positions.append(found + 1)
+        return min(positions) if positions else None
+
+    @staticmethod
+    def _last_boundary(text: str, start: int, limit: int, separators: Tuple[str, ...]) -> int:
+        """
+        startより後、limitまでで最後の区切りの位置（区切り文字と閉じ括弧の直後）
+
+        Returns:
+            int: 区切りの位置（見つからない場合は0）
+        """
+        found = max(text.rfind(separator, start, limit) for separator in separators)
+        if found < 0:
+            return 0
+        end = found + 1
+        while end < limit and text[end] in _CLOSING:
+            end += 1
+        return end
+
+    def _overlap_start(self, text: str, start: int, end: int) -> int:
+        """
+        次のチャンクの開始位置を求める
+
+        チャンクの末尾のうちオーバーラップの長さに収まる範囲で、最初の文の区切りの
+        直後から始める（区切りがない場合はオーバーラップしない）。
+        """
+        if self.length_function is len:
+            low = end - self.chunk_overlap
+        elif self.length_function(text[start + 1:end]) <= self.chunk_overlap:
+            low = start + 1
+        else:
+            # 末尾からの文字数について、オーバーラップの長さに収まる最大値を探す
+            size = self._largest_within(
+                lambda size: self.length_function(text[end - size:end]),
+                self.chunk_overlap,
+                0,
+                end - start - 1
+            )
+            low = end - size
+        low = max(low, start + 1)
+        if low >= end:
+            return end
+        # lowがちょうど文の先頭の場合はそこから始める
+        if text[low - 1] in _SENTENCE_ENDS and text[low] not in _CLOSING:
+            return low
+        found = [
+            position
+            for position in (text.find(separator, low, end) for separator in _SENTENCE_ENDS)
+            if position >= 0
+        ]
+        if not found:
+            return end
+        next_start = min(found) + 1
+        while next_start < end and text[next_start] in _CLOSING:
+            next_start += 1
+        return next_start
+
+    @staticmethod
+    def _emit(text: str, start: int, end: int, chunks: List[Tuple[int, str]]) -> None:
+        """前後の空白を除いたチャンクを開始位置とともに追加"""
+        chunk = text[start:end]
+        stripped = chunk.strip()
+        if stripped:
+            chunks.append((start + len(chunk) - len(chunk.lstrip()), stripped))
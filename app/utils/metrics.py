@@ -0,0 +1,348 @@
+import contextvars
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# 出力する分位数
+QUANTILES = (0.5, 0.95, 0.99)
+
+# 系列のキー（メトリクス名, ラベルの組）
+SeriesKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Histogram:
+    """
+    レイテンシなどの値の分布を記録するヒストグラム
+
+    HDR Histogramと同様に値を対数間隔のバケットに数え、分位数を相対誤差
+    precision以内で求める。記録する値の数によらずメモリ使用量は一定。
+    """
+
+    def __init__(self, precision: float = 0.01, min_value: float = 1e-6):
+        """
+        Args:
+            precision: 分位数の相対誤差の上限
+            min_value: 区別する最小の値（これ以下の値は同じバケットに数える）
+        """
+        if precision <= 0:
+            raise ValueError("precision must be positive")
+        self.precision = precision
+        self.min_value = min_value
+        self._log_base = math.log1p(precision)
+        self._buckets: Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def record(self, value: float) -> None:
+        """値を記録"""
+        if value <= self.min_value:
+            index = 0
+        else:
+            index = int(math.ceil(math.log(value / self.min_value) / self._log_base))
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """
+        分位数を求める
+
+        Args:
+            q: 0から1の分位
+
+        Returns:
+            float: 分位数（記録がない場合は0）
+        """
+        if self.count == 0:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                # バケットの上端（記録された範囲に収める）
+                upper = self.min_value * math.exp(index * self._log_base)
+                return min(max(upper, self.min), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        """件数・合計・最小・最大と分位数"""
+        result = {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else 0.0,
+            "max": self.max,
+        }
+        for q in QUANTILES:
+            result[f"p{int(q * 100)}"] = self.quantile(q)
+        return result
+
+
+class Trace:
+    """
+    1リクエスト分の処理の記録
+
+    段階ごとの所要時間とカウンターを記録し、回答と一緒に返す。
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages: List[Dict[str, Any]] = []
+        self.counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, seconds: float, labels: Dict[str, str]) -> None:
+        with self._lock:
+            self.stages.append({"stage": name, "seconds": seconds, **labels})
+
+    def add_count(self, name: str, value: float, labels: Dict[str, str]) -> None:
+        key = _format_series((name, _label_tuple(labels)))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSONに変換できる辞書"""
+        with self._lock:
+            return {
+                "total_seconds": time.perf_counter() - self.started_at,
+                "stages": list(self.stages),
+                "counters": dict(self.counters),
+            }
+
+
+# 現在のリクエストのTrace（トレースしていない場合はNone）
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar(
+    "current_trace", default=None
+)
+
+
+class Metrics:
+    """
+    段階ごとの所要時間のヒストグラムとカウンターを集計するクラス
+
+    Prometheusのテキスト形式とJSONで出力できる。スレッドセーフ。
+    """
+
+    def __init__(self, namespace: str = "rag"):
+        """
+        Args:
+            namespace: Prometheus形式で出力するときのメトリクス名の接頭辞
+        """
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._counters: Dict[SeriesKey, float] = {}
+        self._histograms: Dict[SeriesKey, Histogram] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """
+        カウンターを増やす
+
+        Args:
+            name: メトリクス名（"_total"で終わる名前）
+            value: 増やす値
+            labels: ラベル
+        """
+        key = (name, _label_tuple(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """
+        ヒストグラムに値を記録
+
+        Args:
+            name: メトリクス名
+            value: 記録する値
+            labels: ラベル
+        """
+        key = (name, _label_tuple(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.record(value)
+
+    def counter(self, name: str, **labels: str) -> float:
+        """カウンターの現在値"""
+        with self._lock:
+            return self._counters.get((name, _label_tuple(labels)), 0)
+
+    def histogram(self, name: str, **labels: str) -> Optional[Dict[str, float]]:
+        """ヒストグラムの集計値（記録がない場合はNone）"""
+        with self._lock:
+            histogram = self._histograms.get((name, _label_tuple(labels)))
+            return histogram.summary() if histogram is not None else None
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        すべてのメトリクスの現在値
+
+        Returns:
+            Dict[str, Dict[str, Any]]: counters（系列名→値）とhistograms（系列名→集計値）
+        """
+        with self._lock:
+            return {
+                "counters": {
+                    _format_series(key): value for key, value in sorted(self._counters.items())
+                },
+                "histograms": {
+                    _format_series(key): histogram.summary()
+                    for key, histogram in sorted(self._histograms.items())
+                },
+            }
+
+    def to_json(self) -> str:
+        """すべてのメトリクスをJSONで出力"""
+        return json.dumps(self.snapshot(), indent=2, ensure_ascii=False)
+
+    def to_prometheus(self) -> str:
+        """
+        すべてのメトリクスをPrometheusのテキスト形式で出力
+
+        ヒストグラムはsummary型（分位数・合計・件数）として出力する。
+        """
+        lines: List[str] = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, histogram.summary()) for key, histogram in self._histograms.items()
+            )
+        previous = None
+        for (name, labels), value in counters:
+            full_name = f"{self.namespace}_{name}"
+            if name != previous:
+                lines.append(f"# TYPE {full_name} counter")
+                previous = name
+            lines.append(f"{_format_series((full_name, labels))} {_format_value(value)}")
+        previous = None
+        for (name, labels), summary in histograms:
+            full_name = f"{self.namespace}_{name}"
+            if name != previous:
+                lines.append(f"# TYPE {full_name} summary")
+                previous = name
+            for q in QUANTILES:
+                series = _format_series((full_name, labels + (("quantile", str(q)),)))
+                lines.append(f"{series} {_format_value(summary[f'p{int(q * 100)}'])}")
+            lines.append(f"{_format_series((full_name + '_sum', labels))} {_format_value(summary['sum'])}")
+            lines.append(f"{_format_series((full_name + '_count', labels))} {summary['count']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        """すべてのメトリクスを消去"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+# アプリケーション全体で共有するメトリクス
+REGISTRY = Metrics()
+
+
+@contextmanager
+def stage(name: str, **labels: str) -> Iterator[None]:
+    """
+    処理の段階の所要時間を計測する
+
+    REGISTRYのstage_duration_secondsと、トレース中であればそのTraceに記録する。
+
+    Args:
+        name: 段階の名前（"embed_query"、"vector_query"、"generate"など）
+        labels: 追加のラベル
+    """
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started_at, **labels)
+
+
+def record_stage(name: str, seconds: float, **labels: str) -> None:
+    """計測済みの段階の所要時間を記録"""
+    REGISTRY.observe("stage_duration_seconds", seconds, stage=name, **labels)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_stage(name, seconds, labels)
+
+
+def count(name: str, value: float = 1, **labels: str) -> None:
+    """
+    カウンターを増やす（REGISTRYと、トレース中であればそのTraceに記録）
+
+    Args:
+        name: メトリクス名（"_total"で終わる名前）
+        value: 増やす値
+        labels: ラベル
+    """
+    REGISTRY.inc(name, value, **labels)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_count(name, value, labels)
+
+
+def timed_iter(name: str, iterable: Iterable[T], **labels: str) -> Iterator[T]:
+    """
+    イテレータが次の要素を返すまでの時間の合計を1つの段階として記録する
+
+    要素を受け取った側の処理時間は含めない。
+    """
+    iterator = iter(iterable)
+    elapsed = 0.0
+    try:
+        while True:
+            started_at = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - started_at
+                return
+            elapsed += time.perf_counter() - started_at
+            yield item
+    finally:
+        record_stage(name, elapsed, **labels)
+
+
+@contextmanager
+def tracing() -> Iterator[Trace]:
+    """
+    このブロック内（同じスレッド・コンテキスト）で記録した段階とカウンターをTraceに集める
+
+    Yields:
+        Trace: 記録先のTrace
+    """
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def _label_tuple(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_series(key: SeriesKey) -> str:
+    """系列をPrometheus形式の名前（name{label="value"}）にする"""
+    name, labels = key
+    if not labels:
+        return name
+    escaped = ",".join(f'{label}="{_escape_label(value)}"' for label, value in labels)
+    return f"{name}{{{escaped}}}"
+
+
+def _escape_label(value: str) -> str:
+    """ラベルの値のバックスラッシュ・二重引用符・改行をエスケープ"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
@@ -0,0 +1,108 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    """実行中の1回分の呼び出し"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    同じキーの同時呼び出しをまとめるクラス
+
+    あるキーの処理が実行中に同じキーで呼び出された場合は、新たに実行せず
+    実行中の処理の完了を待って同じ結果（または例外）を返す。
+    キーごとに呼び出し回数・実行回数・共有した回数を記録する。
+    """
+
+    def __init__(self, max_tracked_keys: int = 1000):
+        """
+        Args:
+            max_tracked_keys: 統計を保持するキーの最大数（古いものから削除）
+        """
+        self.max_tracked_keys = max_tracked_keys
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._metrics: "OrderedDict[Hashable, Dict[str, int]]" = OrderedDict()
+        self._totals = {"calls": 0, "executions": 0, "shared": 0, "errors": 0}
+
+    def do(self, key: Hashable, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        keyについて実行中の処理がなければfuncを実行し、あればその結果を待って返す
+
+        Args:
+            key: 呼び出しをまとめるためのキー
+            func: 実行する関数
+            *args: funcに渡す位置引数
+            **kwargs: funcに渡すキーワード引数
+
+        Returns:
+            Any: funcの戻り値（同時に呼び出した全員に同じオブジェクトが返る）
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            self._record(key, "calls")
+            self._record(key, "executions" if leader else "shared")
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self._record(key, "errors")
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        """実行中のキーの数を返す"""
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self, include_keys: bool = True) -> Dict[str, Any]:
+        """
+        統計情報を返す
+
+        Args:
+            include_keys: キーごとの集計を含めるかどうか
+
+        Returns:
+            Dict[str, Any]: 全体の集計（calls, executions, shared, errors）と
+                キーごとの集計（keys）。sharedが節約できた呼び出し回数
+        """
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._totals)
+            if include_keys:
+                stats["keys"] = {key: dict(metrics) for key, metrics in self._metrics.items()}
+            return stats
+
+    def _record(self, key: Hashable, name: str) -> None:
+        metrics = self._metrics.get(key)
+        if metrics is None:
+            metrics = {"calls": 0, "executions": 0, "shared": 0, "errors": 0}
+            self._metrics[key] = metrics
+            while len(self._metrics) > self.max_tracked_keys:
+                self._metrics.popitem(last=False)
+        else:
+            self._metrics.move_to_end(key)
+        metrics[name] += 1
+        self._totals[name] += 1
@@ -0,0 +1,40 @@
+import math
+import re
+import unicodedata
+
+# 1文字1トークンとして数える文字（かな・漢字・全角記号など）の連続
+_WIDE_RUN = re.compile("[\u3000-\U0010ffff]+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    質問の表記ゆれを吸収する
+
+    全角・半角、大文字・小文字、空白、末尾の句読点の違いを同じ文字列にする。
+    回答キャッシュやクエリ埋め込みのキャッシュのキーに使う。
+
+    Args:
+        query: ユーザーの質問
+
+    Returns:
+        str: 正規化した質問
+    """
+    text = unicodedata.normalize("NFKC", query).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("?!。．.？！ ")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    テキストのトークン数を概算
+
+    日本語（かな・漢字など）は1文字1トークン、それ以外はおよそ4文字1トークンとして数える。
+
+    Args:
+        text: 対象のテキスト
+
+    Returns:
+        int: 推定トークン数
+    """
+    wide = sum(map(len, _WIDE_RUN.findall(text)))
+    return wide + math.ceil((len(text) - wide) / 4)
@@ -0,0 +1,111 @@
+"""
+埋め込みの量子化による再現率とサイズのレポート
+
+クラスタ構造を持つ合成ベクトルをfloat32・float16・int8のNumpyBackendに登録し、
+float32の厳密検索に対するrecall@kとディスク上のサイズ、検索時間を表示する。
+
+    python benchmarks/quantization_report.py --count 100000 --dim 768 --json
+"""
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import click
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from app.retrievers.backends.numpy_backend import NumpyBackend  # noqa: E402
+
+DTYPES = ("float32", "float16", "int8")
+
+
+def synthetic_vectors(count: int, dim: int, seed: int = 0) -> np.ndarray:
+    """クラスタ構造を持つ合成ベクトルを生成"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, count // 100), dim))
+    labels = rng.integers(len(centers), size=count)
+    return (centers[labels] + rng.normal(scale=0.5, size=(count, dim))).astype(np.float32)
+
+
+def directory_size(path: Path) -> int:
+    """ディレクトリ内のファイルサイズの合計（バイト）"""
+    return sum(f.stat().st_size for f in path.iterdir() if f.is_file())
+
+
+def report(count: int, dim: int, queries: int, k: int) -> Dict[str, Dict[str, float]]:
+    """
+    各型で登録・検索し、再現率とサイズを計測
+
+    Args:
+        count: 登録するベクトル数
+        dim: 次元数
+        queries: 検索するクエリ数
+        k: recall@kのk
+
+    Returns:
+        Dict[str, Dict[str, float]]: 型ごとの結果
+    """
+    vectors = synthetic_vectors(count, dim)
+    rng = np.random.default_rng(1)
+    query_vectors = vectors[rng.choice(count, size=queries, replace=False)]
+    query_vectors = query_vectors + rng.normal(scale=0.1, size=query_vectors.shape).astype(np.float32)
+    ids = [f"id{i}" for i in range(count)]
+    texts = [f"text {i}" for i in range(count)]
+    metadatas = [{"n": i} for i in range(count)]
+
+    results = {}
+    exact: List[set] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for dtype in DTYPES:
+            backend = NumpyBackend(dtype, tmp, autosave=False, dtype=dtype)
+            backend.upsert(ids, texts, metadatas, vectors)
+            backend.persist()
+            # メモリマップで開き直して計測する
+            backend = NumpyBackend(dtype, tmp, dtype=dtype)
+
+            start = time.perf_counter()
+            found = backend.query(n_results=k, query_embeddings=query_vectors)
+            elapsed = time.perf_counter() - start
+
+            found_ids = [{r["id"] for r in rows} for rows in found]
+            if dtype == "float32":
+                exact = found_ids
+            recall = float(np.mean([len(e & f) / k for e, f in zip(exact, found_ids)]))
+            results[dtype] = {
+                f"recall@{k}": recall,
+                "vector_bytes": backend.nbytes(),
+                "disk_bytes": directory_size(backend.directory),
+                "query_ms": elapsed / queries * 1000,
+            }
+    return results
+
+
+@click.command()
+@click.option('--count', default=20000, help='登録するベクトル数')
+@click.option('--dim', default=768, help='次元数')
+@click.option('--queries', default=100, help='検索するクエリ数')
+@click.option('--k', default=10, help='recall@kのk')
+@click.option('--json', 'as_json', is_flag=True, help='結果をJSONで出力する')
+def main(count: int, dim: int, queries: int, k: int, as_json: bool):
+    """量子化した埋め込みの再現率とサイズを比較する"""
+    results = report(count, dim, queries, k)
+    if as_json:
+        click.echo(json.dumps(results, indent=2))
+        return
+    base = results["float32"]["vector_bytes"]
+    for dtype, result in results.items():
+        click.echo(
+            f"{dtype:<8} recall@{k} {result[f'recall@{k}']:.3f}  "
+            f"vectors {result['vector_bytes'] / 2**20:8.1f} MiB ({result['vector_bytes'] / base:.0%})  "
+            f"disk {result['disk_bytes'] / 2**20:8.1f} MiB  "
+            f"query {result['query_ms']:.2f} ms"
+        )
+
+
+if __name__ == '__main__':
+    main()
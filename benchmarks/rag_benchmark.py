@@ -0,0 +1,409 @@
+"""
+取り込み・検索・回答生成のオフラインベンチマーク
+
+Gemini APIの代わりに決定的なローカルの埋め込みバックエンドと回答生成モデル
+（遅延を指定可能）を使い、合成コーパスに対して次の3つを計測する。
+
+- ingest: 合成Markdown文書をDocumentStore.add_documentsで取り込む（チャンク/秒、MB/秒）
+- retrieve: 指定件数のチャンクを登録したストアに対するRetriever.retrieveのレイテンシ
+- pipeline: 同じストアに対するPipeline.runのレイテンシ
+
+それぞれスループット・レイテンシの分位数・ピークメモリ（tracemalloc）を出力する。
+結果をJSONで保存し、以前の結果と比較して悪化を検出できる。
+
+    python benchmarks/rag_benchmark.py --chunks 1000 --chunks 100000 --output results.json
+    python benchmarks/rag_benchmark.py --compare results.json --threshold 0.1
+"""
+import itertools
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import click
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from app.embedders.fake_backend import FakeEmbeddingBackend  # noqa: E402
+from app.embedders.gemini_embedder import GeminiEmbedder  # noqa: E402
+from app.generators.fake_model import FakeGenerativeModel  # noqa: E402
+from app.loaders.pdf_extractor import PdfExtractor  # noqa: E402
+from app.loaders.pdf_page_cache import PdfPageCache  # noqa: E402
+from app.pipeline import Pipeline  # noqa: E402
+from app.retrievers.backends.numpy_backend import NumpyBackend  # noqa: E402
+from app.retrievers.bm25_index import BM25Index  # noqa: E402
+from app.retrievers.document_store import DocumentStore  # noqa: E402
+from app.retrievers.manifest import IngestManifest  # noqa: E402
+from app.retrievers.retriever import Retriever  # noqa: E402
+from app.retrievers.vector_store import VectorStore  # noqa: E402
+
+TOPICS = [
+    "有給休暇", "経費精算", "リモートワーク", "セキュリティ", "パスワード", "会議室",
+    "出張", "研修", "評価制度", "福利厚生", "障害対応", "バックアップ",
+]
+PHRASES = [
+    "の申請はポータルから行います。",
+    "について不明な点は総務部に問い合わせてください。",
+    "の手順は年に一度見直されます。",
+    "に関する規定は第3章に記載されています。",
+    "の上限は部署ごとに異なります。",
+    "を変更した場合は記録を残してください。",
+]
+_KANA = "アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモヤユヨラリルレロワン"
+
+# 以前の結果と比較する指標と、値が大きいほど良いかどうか
+COMPARED_METRICS = {
+    "chunks_per_second": True,
+    "mb_per_second": True,
+    "queries_per_second": True,
+    "p50": False,
+    "p95": False,
+    "p99": False,
+    "peak_memory_mb": False,
+}
+
+
+class SyntheticText:
+    """
+    合成の文書と質問を生成するクラス
+
+    カタカナの語彙から出現頻度がZipf分布に従うように語を選ぶため、
+    実際の文書と同様に一部の語はよく現れ、多くの語はまれにしか現れない。
+    """
+
+    def __init__(self, seed: int, vocabulary_size: int = 5000):
+        self.rng = random.Random(seed)
+        self.words = [
+            "".join(self.rng.choice(_KANA) for _ in range(self.rng.randint(2, 5)))
+            for _ in range(vocabulary_size)
+        ]
+        self.cum_weights = list(itertools.accumulate(1.0 / rank for rank in range(1, vocabulary_size + 1)))
+
+    def _words(self, k: int) -> List[str]:
+        return self.rng.choices(self.words, cum_weights=self.cum_weights, k=k)
+
+    def chunk(self, index: int, sentences: int = 8) -> Tuple[str, str]:
+        """1チャンク分の見出しと本文を生成"""
+        topic = TOPICS[index % len(TOPICS)]
+        words = self._words(sentences * 2)
+        body = "".join(
+            f"{words[2 * i]}と{words[2 * i + 1]}{self.rng.choice(PHRASES)}" if i
+            else f"{topic}{self.rng.choice(PHRASES)}"
+            for i in range(sentences)
+        )
+        return f"{topic} {index}", body
+
+    def queries(self, n: int) -> List[str]:
+        """重複しない合成の質問を生成（回答キャッシュに当たらないよう番号を含める）"""
+        return [
+            f"{word}の{self.rng.choice(TOPICS)}について教えてください（{i}）"
+            for i, word in enumerate(self._words(n))
+        ]
+
+
+def write_corpus(directory: Path, n_chunks: int, seed: int, chunks_per_file: int = 100) -> int:
+    """
+    見出しごとに1チャンクになる合成Markdown文書を書き出す
+
+    Returns:
+        int: 書き出したバイト数
+    """
+    text = SyntheticText(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    total = 0
+    for start in range(0, n_chunks, chunks_per_file):
+        sections = []
+        for index in range(start, min(start + chunks_per_file, n_chunks)):
+            heading, body = text.chunk(index)
+            sections.append(f"## {heading}\n\n{body}\n")
+        data = "\n".join(sections).encode("utf-8")
+        (directory / f"doc_{start // chunks_per_file:05d}.md").write_bytes(data)
+        total += len(data)
+    return total
+
+
+def local_store(
+    directory: Path,
+    embed_latency: float,
+    dimension: int,
+    workers: Optional[int] = None
+) -> DocumentStore:
+    """ネットワークやカレントディレクトリのキャッシュを使わないDocumentStoreを作成"""
+    embedder = GeminiEmbedder(
+        backend=FakeEmbeddingBackend(dimension=dimension, latency=embed_latency),
+        requests_per_minute=None
+    )
+    backend = NumpyBackend("bench", directory, autosave=False)
+    return DocumentStore(
+        "bench",
+        embedder=embedder,
+        vector_store=VectorStore("bench", backend=backend, embedder=embedder),
+        pdf_extractor=PdfExtractor(cache=PdfPageCache()),
+        manifest=IngestManifest(directory / "bench.manifest.json"),
+        lexical_index=BM25Index(directory / "bench.bm25.npz"),
+        ingest_workers=workers
+    )
+
+
+def preload_store(store: DocumentStore, n_chunks: int, dimension: int, seed: int) -> None:
+    """
+    合成チャンクを埋め込みの計算なしでストアに登録する
+
+    大きなコーパスでも準備に時間がかからないよう、埋め込みは乱数の単位ベクトルを使う
+    （検索結果の内容ではなく、件数に対する検索時間を測るため）。
+    """
+    text = SyntheticText(seed)
+    vectors = np.random.default_rng(seed).standard_normal((n_chunks, dimension), dtype=np.float32)
+    batch = 50_000
+    for start in range(0, n_chunks, batch):
+        end = min(start + batch, n_chunks)
+        ids = [f"chunk_{i}" for i in range(start, end)]
+        texts = []
+        metadatas = []
+        for index in range(start, end):
+            heading, body = text.chunk(index)
+            texts.append(f"## {heading}\n\n{body}")
+            metadatas.append({"source": f"doc_{index // 100:05d}.md", "start_index": 0})
+        store.vector_store.add_texts(texts, metadatas, ids, embeddings=vectors[start:end])
+        store.lexical_index.add(ids, texts)
+
+
+def latency_summary(timings: List[float]) -> Dict[str, float]:
+    """レイテンシのリストから分位数と1秒あたりの処理数を求める"""
+    values = np.asarray(timings)
+    return {
+        "count": len(timings),
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "queries_per_second": len(timings) / float(values.sum()),
+    }
+
+
+def peak_memory_mb(func: Callable[[], Any]) -> float:
+    """
+    funcの実行中のピークメモリ（MB）をtracemallocで計測
+
+    tracemallocは割り当てのたびに記録して処理が遅くなるため、時間の計測とは別に実行する。
+    """
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 2**20
+
+
+def bench_ingest(
+    n_chunks: int,
+    embed_latency: float,
+    dimension: int,
+    workers: int,
+    seed: int,
+    measure_memory: bool
+) -> Dict[str, Any]:
+    """合成文書の取り込みを計測（ピークメモリは別のストアへの取り込みで計測）"""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        size = write_corpus(tmp_path / "docs", n_chunks, seed)
+
+        def ingest(name: str) -> Dict[str, int]:
+            store = local_store(tmp_path / name, embed_latency, dimension, workers)
+            return store.add_documents(tmp_path / "docs")
+
+        started_at = time.perf_counter()
+        stats = ingest("timed")
+        elapsed = time.perf_counter() - started_at
+        result = {
+            "chunks": stats["chunks_added"],
+            "seconds": elapsed,
+            "chunks_per_second": stats["chunks_added"] / elapsed,
+            "mb_per_second": size / 2**20 / elapsed,
+        }
+        if measure_memory:
+            result["peak_memory_mb"] = peak_memory_mb(lambda: ingest("memory"))
+        return result
+
+
+def bench_queries(
+    n_chunks: int,
+    n_queries: int,
+    embed_latency: float,
+    generate_latency: float,
+    dimension: int,
+    seed: int,
+    measure_memory: bool
+) -> Dict[str, Dict[str, Any]]:
+    """n_chunks件を登録したストアに対する検索と回答生成を計測"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = local_store(Path(tmp), embed_latency, dimension)
+        started_at = time.perf_counter()
+        preload_store(store, n_chunks, dimension, seed)
+        preload_seconds = time.perf_counter() - started_at
+        retriever = Retriever(store)
+        pipeline = Pipeline(
+            docs_dir=Path(tmp),
+            collection_name="bench",
+            document_store=store,
+            model=FakeGenerativeModel(latency=generate_latency)
+        )
+        # 初回のみの準備（IVFの学習・列のキャッシュなど）を計測から除く
+        retriever.retrieve("ウォームアップ")
+        pipeline.run("ウォームアップ")
+
+        text = SyntheticText(seed + 1)
+        results = {}
+        for name, func in (("retrieve", retriever.retrieve), ("pipeline", pipeline.run)):
+            timings = []
+            for query in text.queries(n_queries):
+                query_started_at = time.perf_counter()
+                func(query)
+                timings.append(time.perf_counter() - query_started_at)
+            results[name] = latency_summary(timings)
+            if measure_memory:
+                # 一部の質問だけで計測する（ピークは質問数にほとんど依存しない）
+                queries = text.queries(min(n_queries, 20))
+                results[name]["peak_memory_mb"] = peak_memory_mb(
+                    lambda: [func(query) for query in queries]
+                )
+        results["retrieve"]["preload_seconds"] = preload_seconds
+        results["retrieve"]["vector_store_mb"] = store.vector_store.backend.nbytes() / 2**20
+        return results
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    以前の結果と比較し、threshold（割合）を超えて悪化した指標を返す
+
+    Returns:
+        List[str]: 悪化した指標の説明
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            value, old = result.get(metric), previous.get(metric)
+            if value is None or not old:
+                continue
+            change = (value - old) / old
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(f"{name}.{metric}: {old:.6g} -> {value:.6g} ({change:+.1%})")
+    return regressions
+
+
+def git_commit() -> str:
+    """現在のコミットID（取得できない場合は空文字列）"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+@click.command()
+@click.option('--chunks', 'chunk_counts', multiple=True, type=int, default=(1000, 10000),
+              help='検索・回答生成を計測するコーパスのチャンク数（複数指定可）')
+@click.option('--ingest-chunks', default=1000, help='取り込みを計測する合成文書のチャンク数（0で計測しない）')
+@click.option('--queries', default=200, help='計測する質問の数')
+@click.option('--embed-latency', default=0.0, help='埋め込みAPI呼び出し1回あたりの模擬遅延（秒）')
+@click.option('--generate-latency', default=0.0, help='回答生成1回あたりの模擬遅延（秒）')
+@click.option('--dim', default=64, help='埋め込みの次元数')
+@click.option('--workers', default=0, help='取り込みのワーカープロセス数（0で同一プロセス）')
+@click.option('--seed', default=0, help='合成データの乱数シード')
+@click.option('--memory/--no-memory', 'measure_memory', default=True, help='ピークメモリを計測する')
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help='結果を書き出すJSONファイル')
+@click.option('--compare', 'baseline_path', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='比較する以前の結果のJSONファイル')
+@click.option('--threshold', default=0.1, help='悪化とみなす変化の割合')
+@click.option('--json', 'as_json', is_flag=True, help='結果をJSONで出力する')
+def main(
+    chunk_counts: Tuple[int, ...],
+    ingest_chunks: int,
+    queries: int,
+    embed_latency: float,
+    generate_latency: float,
+    dim: int,
+    workers: int,
+    seed: int,
+    measure_memory: bool,
+    output: str,
+    baseline_path: str,
+    threshold: float,
+    as_json: bool
+):
+    """取り込み・検索・回答生成の性能を計測する"""
+    results: Dict[str, Dict[str, Any]] = {}
+    if ingest_chunks:
+        results[f"ingest/{ingest_chunks}"] = bench_ingest(
+            ingest_chunks, embed_latency, dim, workers, seed, measure_memory
+        )
+    for n_chunks in chunk_counts:
+        for name, result in bench_queries(
+            n_chunks, queries, embed_latency, generate_latency, dim, seed, measure_memory
+        ).items():
+            results[f"{name}/{n_chunks}"] = result
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {
+                "chunks": list(chunk_counts),
+                "ingest_chunks": ingest_chunks,
+                "queries": queries,
+                "embed_latency": embed_latency,
+                "generate_latency": generate_latency,
+                "dim": dim,
+                "workers": workers,
+                "seed": seed,
+            },
+        },
+        "results": results,
+    }
+    if output:
+        Path(output).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    if as_json:
+        click.echo(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        for name, result in results.items():
+            if "p50" in result:
+                detail = (
+                    f"p50 {result['p50'] * 1000:8.2f}ms  p95 {result['p95'] * 1000:8.2f}ms  "
+                    f"p99 {result['p99'] * 1000:8.2f}ms  {result['queries_per_second']:8.1f} q/s"
+                )
+            else:
+                detail = f"{result['chunks_per_second']:8.1f} chunks/s  {result['mb_per_second']:6.2f} MB/s"
+            if "peak_memory_mb" in result:
+                detail += f"  peak {result['peak_memory_mb']:7.1f} MB"
+            click.echo(f"{name:<18} {detail}")
+
+    if baseline_path:
+        baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+        if baseline.get("meta", {}).get("params") != report["meta"]["params"]:
+            click.echo("警告: 比較する結果とパラメータが異なります", err=True)
+        regressions = compare(report, baseline, threshold)
+        for regression in regressions:
+            click.echo(f"REGRESSION {regression}", err=True)
+        if regressions:
+            sys.exit(1)
+        click.echo(f"{baseline_path} と比較して{threshold:.0%}を超える悪化はありません")
+
+
+if __name__ == '__main__':
+    main()
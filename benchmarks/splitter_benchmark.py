@@ -0,0 +1,113 @@
+"""
+テキスト分割のスループットのベンチマーク
+
+見出し・段落・句点を含む日本語の合成文書を分割し、MB/秒を表示する。
+langchainがインストールされている場合は、以前の実装と同じ設定の
+RecursiveCharacterTextSplitterとも比較する。
+
+    python benchmarks/splitter_benchmark.py --size-mb 5 --json
+"""
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import click
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from app.splitters.text_splitter import LENGTH_FUNCTIONS, TextSplitter  # noqa: E402
+
+SENTENCES = [
+    "このシステムは社内の文書を検索して質問に回答します。",
+    "設定ファイルのchunk_sizeを変更すると分割の粒度が変わります！",
+    "エラーコードE1024が表示された場合は管理者に連絡してください。",
+    "なぜ応答が遅くなるのでしょうか？",
+    "詳細は「運用マニュアル」の第3章を参照してください。",
+    "Retry-Afterヘッダーの秒数だけ待ってから再試行します、",
+]
+
+
+def synthetic_document(size: int, seed: int = 0) -> str:
+    """見出しと段落からなるおよそsize文字の合成Markdown文書を生成"""
+    rng = random.Random(seed)
+    parts: List[str] = []
+    length = 0
+    section = 0
+    while length < size:
+        section += 1
+        heading = f"## セクション{section}\n"
+        paragraphs = []
+        for _ in range(rng.randint(2, 5)):
+            paragraphs.append("".join(rng.choice(SENTENCES) for _ in range(rng.randint(3, 12))))
+        part = heading + "\n\n".join(paragraphs) + "\n\n"
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)
+
+
+def measure(split: Callable[[str], List[str]], text: str, repeat: int) -> Dict[str, float]:
+    """
+    分割を繰り返し実行してスループットを計測
+
+    Args:
+        split: テキストを受け取りチャンクのリストを返す関数
+        text: 分割するテキスト
+        repeat: 繰り返し回数
+
+    Returns:
+        Dict[str, float]: 最短時間・MB/秒・チャンク数
+    """
+    megabytes = len(text.encode("utf-8")) / 2**20
+    timings = []
+    chunks: List[str] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = split(text)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    return {"seconds": best, "mb_per_second": megabytes / best, "chunks": len(chunks)}
+
+
+@click.command()
+@click.option('--size-mb', default=2.0, help='合成文書のサイズ（MB、UTF-8換算のおおよその値）')
+@click.option('--chunk-size', default=1000, help='チャンクの最大サイズ')
+@click.option('--chunk-overlap', default=200, help='チャンク間のオーバーラップ')
+@click.option('--repeat', default=3, help='各実装の実行回数')
+@click.option('--json', 'as_json', is_flag=True, help='結果をJSONで出力する')
+def main(size_mb: float, chunk_size: int, chunk_overlap: int, repeat: int, as_json: bool):
+    """テキスト分割のスループットを計測する"""
+    # 日本語は1文字あたりUTF-8でおよそ3バイト
+    text = synthetic_document(int(size_mb * 2**20 / 3))
+    splitters: Dict[str, Callable[[str], List[str]]] = {
+        f"native ({unit})": TextSplitter(chunk_size, chunk_overlap, length_function).split_text
+        for unit, length_function in LENGTH_FUNCTIONS.items()
+    }
+    try:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+    except ImportError:
+        pass
+    else:
+        splitters["langchain recursive"] = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+            separators=["\n\n", "\n", "。", "、", " ", ""]
+        ).split_text
+
+    results = {name: measure(split, text, repeat) for name, split in splitters.items()}
+    if as_json:
+        click.echo(json.dumps(results, indent=2, ensure_ascii=False))
+        return
+    for name, result in results.items():
+        click.echo(
+            f"{name:<22} {result['mb_per_second']:7.2f} MB/s  "
+            f"{result['seconds']:.3f}s  {result['chunks']} chunks"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+起動時間のベンチマーク
+
+`import app.pipeline` と `python cli/chat.py --help` を別プロセスで繰り返し実行し、
+最小値と中央値を表示する。
+
+    python benchmarks/startup_benchmark.py --repeat 10 --json
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import click
+
+ROOT = Path(__file__).resolve().parent.parent
+
+COMMANDS = {
+    "import app.pipeline": [sys.executable, "-c", "import app.pipeline"],
+    "python cli/chat.py --help": [sys.executable, str(ROOT / "cli" / "chat.py"), "--help"],
+    # 比較用: インタプリタ自体の起動時間
+    "python -c pass": [sys.executable, "-c", "pass"],
+}
+
+
+def measure(command: List[str], repeat: int) -> Dict[str, float]:
+    """
+    コマンドを繰り返し実行して所要時間を計測
+
+    Args:
+        command: 実行するコマンド
+        repeat: 繰り返し回数
+
+    Returns:
+        Dict[str, float]: 最小値・中央値・最大値（秒）
+    """
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "max": max(timings),
+    }
+
+
+@click.command()
+@click.option('--repeat', default=5, help='各コマンドの実行回数')
+@click.option('--json', 'as_json', is_flag=True, help='結果をJSONで出力する')
+def main(repeat: int, as_json: bool):
+    """起動時間を計測する"""
+    results = {name: measure(command, repeat) for name, command in COMMANDS.items()}
+    if as_json:
+        click.echo(json.dumps(results, indent=2))
+        return
+    for name, result in results.items():
+        click.echo(
+            f"{name:<30} min {result['min']:.3f}s  "
+            f"median {result['median']:.3f}s  max {result['max']:.3f}s"
+        )
+
+
+if __name__ == '__main__':
+    main()
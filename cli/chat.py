@@ -3,9 +3,12 @@ from pathlib import Path
 
 import click
 from rich.console import Console
+from rich.live import Live
 from rich.markdown import Markdown
 
+from app.generators.chat_session import ChatSession
 from app.pipeline import Pipeline
+from app.utils.metrics import REGISTRY
 
 
 @click.command()
@@ -20,7 +23,24 @@ from app.pipeline import Pipeline
     default='documents',
     help='コレクション名'
 )
-def main(docs_dir: str, collection_name: str):
+@click.option(
+    '--stream/--no-stream',
+    default=True,
+    help='回答を生成しながら少しずつ表示する'
+)
+@click.option(
+    '--metrics-json',
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help='終了時に段階ごとの所要時間とカウンターをJSONで書き出すファイル'
+)
+@click.option(
+    '--clear',
+    is_flag=True,
+    default=False,
+    help='終了時にコレクションを削除する（次回の起動ではすべての文書を登録し直す）'
+)
+def main(docs_dir: str, collection_name: str, stream: bool, metrics_json: str, clear: bool):
     """RAGチャットボットのCLIインターフェース"""
     console = Console()
     
@@ -40,10 +60,15 @@ def main(docs_dir: str, collection_name: str):
         console.print("[yellow]文書を読み込んでいます...[/yellow]")
         pipeline.initialize()
         console.print("[green]文書の読み込みが完了しました[/green]")
+        show_slow_pdfs(console, pipeline)
+
+        # 追加の質問では前の質問と検索結果を引き継ぐ
+        session = pipeline.chat_session()
         
         # 対話ループ
         console.print("\n[bold blue]RAGチャットボット[/bold blue]")
-        console.print("終了するには 'exit' または 'quit' と入力してください\n")
+        console.print("終了するには 'exit' または 'quit' と入力してください")
+        console.print("新しい会話を始めるには 'reset' と入力してください\n")
         
         while True:
             # 質問の入力
@@ -51,15 +76,22 @@ def main(docs_dir: str, collection_name: str):
             
             if query.lower() in ['exit', 'quit']:
                 break
+            if query.lower() == 'reset':
+                session.reset()
+                console.print("[dim]会話をリセットしました[/dim]\n")
+                continue
             
             try:
-                # 回答の生成
-                response = pipeline.run(query)
-                
-                # 回答の表示
-                console.print("\n[bold]回答:[/bold]")
-                console.print(Markdown(response["answer"]))
-                
+                if stream:
+                    response = show_streaming_answer(console, session, query)
+                else:
+                    # 回答の生成
+                    response = session.ask(query)
+
+                    # 回答の表示
+                    console.print("\n[bold]回答:[/bold]")
+                    console.print(Markdown(response["answer"]))
+
                 # 参考文書の表示
                 if response["sources"]:
                     console.print("\n[bold]参考文書:[/bold]")
@@ -71,8 +103,46 @@ def main(docs_dir: str, collection_name: str):
                 console.print(f"[red]エラー: {str(e)}[/red]")
     
     finally:
-        # コレクションの削除
-        pipeline.clear()
+        # 後片付けで例外が発生してもメトリクスは残るよう先に書き出す
+        if metrics_json:
+            Path(metrics_json).write_text(REGISTRY.to_json(), encoding="utf-8")
+            console.print(f"[dim]メトリクスを書き出しました: {metrics_json}[/dim]")
+        # 登録した文書は次回の起動で差分だけを更新できるよう残す
+        if clear:
+            pipeline.clear()
+        else:
+            pipeline.close()
+
+
+def show_slow_pdfs(console: Console, pipeline: Pipeline, n: int = 3) -> None:
+    """テキストの抽出に時間がかかったPDFを表示する"""
+    for file_path, timing in pipeline.document_store.pdf_extractor.slowest(n):
+        if timing["seconds"] == 0:
+            break
+        console.print(
+            f"[dim]PDF抽出 {timing['seconds']:.2f}秒 ({timing['pages']}ページ): {file_path}[/dim]"
+        )
+
+
+def show_streaming_answer(console: Console, session: ChatSession, query: str) -> dict:
+    """回答を生成しながら表示し、最初のトークンまでの時間と合計時間を表示する"""
+    response_stream = session.ask_stream(query)
+
+    console.print("\n[bold]回答:[/bold]")
+    parts = []
+    with Live(Markdown(""), console=console, refresh_per_second=12) as live:
+        for delta in response_stream:
+            parts.append(delta)
+            live.update(Markdown("".join(parts)))
+
+    message = (
+        f"最初のトークンまで {response_stream.time_to_first_token or 0:.2f}秒 / "
+        f"合計 {response_stream.total_latency or 0:.2f}秒"
+    )
+    if response_stream.context_stats:
+        message += f" / 削減したトークン数 {response_stream.context_stats['tokens_saved']}"
+    console.print(f"[dim]{message}[/dim]")
+    return response_stream.to_dict()
 
 
 if __name__ == '__main__':
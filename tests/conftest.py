@@ -0,0 +1,36 @@
+import pytest
+
+from app.embedders.fake_backend import FakeEmbeddingBackend
+from app.embedders.gemini_embedder import GeminiEmbedder
+from app.loaders.pdf_extractor import PdfExtractor
+from app.loaders.pdf_page_cache import PdfPageCache
+from app.retrievers.backends.numpy_backend import NumpyBackend
+from app.retrievers.bm25_index import BM25Index
+from app.retrievers.document_store import DocumentStore
+from app.retrievers.manifest import IngestManifest
+from app.retrievers.vector_store import VectorStore
+
+
+@pytest.fixture
+def make_local_store(tmp_path):
+    """
+    ネットワークやカレントディレクトリのキャッシュを使わないDocumentStoreを作成する関数
+
+    マニフェスト・BM25インデックス・ベクトルはtmp_pathに保存し、同じ名前で作成した
+    DocumentStoreはそれらを共有する。
+    """
+    def make(name="test_local", vector_store=None, ingest_workers=0):
+        embedder = GeminiEmbedder(backend=FakeEmbeddingBackend(), requests_per_minute=None)
+        if vector_store is None:
+            vector_store = VectorStore(name, backend=NumpyBackend(name, tmp_path), embedder=embedder)
+        return DocumentStore(
+            name,
+            embedder=embedder,
+            vector_store=vector_store,
+            pdf_extractor=PdfExtractor(cache=PdfPageCache()),
+            manifest=IngestManifest(tmp_path / f"{name}.manifest.json"),
+            lexical_index=BM25Index(tmp_path / f"{name}.bm25.npz"),
+            ingest_workers=ingest_workers
+        )
+
+    return make
@@ -5,6 +5,7 @@ from unittest.mock import patch
 import pytest
 from click.testing import CliRunner
 
+from app.generators.response_stream import ResponseStream
 from cli.chat import main
 
 
@@ -59,8 +60,8 @@ def test_cli_with_sample_docs(tmp_path):
     
     with patch.dict(os.environ, {'GOOGLE_API_KEY': 'dummy_key'}):
         # モックの設定
-        with patch('app.pipeline.Pipeline.run') as mock_run:
-            mock_run.return_value = {
+        with patch('app.generators.chat_session.ChatSession.ask') as mock_ask:
+            mock_ask.return_value = {
                 "answer": "これはテスト回答です。",
                 "sources": "文書 1: test_docs"
             }
@@ -68,11 +69,61 @@ def test_cli_with_sample_docs(tmp_path):
             # 対話モードのテスト
             result = runner.invoke(
                 main,
-                ['--docs-dir', str(docs_dir)],
+                ['--docs-dir', str(docs_dir), '--no-stream'],
                 input='テスト質問\nexit\n'
             )
             
             assert result.exit_code == 0
             assert "文書の読み込みが完了しました" in result.output
             assert "テスト回答" in result.output
-            assert "文書 1: test_docs" in result.output 
\ No newline at end of file
+            assert "文書 1: test_docs" in result.output 
+
+
+def test_cli_streaming_answer(tmp_path):
+    """回答を少しずつ表示するモードのテスト"""
+    runner = CliRunner()
+
+    with patch.dict(os.environ, {'GOOGLE_API_KEY': 'dummy_key'}):
+        with patch('cli.chat.Pipeline') as mock_pipeline:
+            session = mock_pipeline.return_value.chat_session.return_value
+            session.ask_stream.return_value = ResponseStream(
+                ["これは", "ストリーミング", "回答です。"],
+                "文書 1: test_docs"
+            )
+
+            result = runner.invoke(
+                main,
+                ['--docs-dir', str(tmp_path)],
+                input='テスト質問\nexit\n'
+            )
+
+            assert result.exit_code == 0
+            assert "これはストリーミング回答です。" in result.output
+            assert "文書 1: test_docs" in result.output
+            assert "最初のトークンまで" in result.output
+            session.ask.assert_not_called()
+
+
+
+def test_cli_keeps_collection_unless_clear(tmp_path):
+    """終了時にコレクションを残し、--clearを指定した場合だけ削除することをテスト"""
+    runner = CliRunner()
+    metrics_path = tmp_path / "metrics.json"
+
+    with patch.dict(os.environ, {'GOOGLE_API_KEY': 'dummy_key'}):
+        with patch('cli.chat.Pipeline') as mock_pipeline:
+            result = runner.invoke(main, ['--docs-dir', str(tmp_path)], input='exit\n')
+            assert result.exit_code == 0
+            mock_pipeline.return_value.clear.assert_not_called()
+            mock_pipeline.return_value.close.assert_called_once()
+
+            # 後片付けに失敗してもメトリクスは書き出される
+            mock_pipeline.return_value.clear.side_effect = RuntimeError("削除に失敗しました")
+            result = runner.invoke(
+                main,
+                ['--docs-dir', str(tmp_path), '--clear', '--metrics-json', str(metrics_path)],
+                input='exit\n'
+            )
+            assert isinstance(result.exception, RuntimeError)
+            mock_pipeline.return_value.clear.assert_called_once()
+            assert metrics_path.exists()
@@ -1,7 +1,13 @@
+import numpy as np
 import pytest
 from pathlib import Path
 
+from app.embedders.batch_engine import BatchEmbeddingEngine
+from app.embedders.embedding_cache import EmbeddingCache
+from app.embedders.fake_backend import FakeEmbeddingBackend, FakeQuotaError
 from app.embedders.gemini_embedder import GeminiEmbedder
+from app.embedders.query_embedding_cache import QueryEmbeddingCache
+from app.embedders.rate_limiter import TokenBucket
 from app.retrievers.document_store import DocumentStore
 from app.retrievers.vector_store import VectorStore
 
@@ -15,8 +21,9 @@ def test_gemini_embedder():
     embedding = embedder.embed_text(text)
     
     # 埋め込みベクトルの形式を確認
-    assert isinstance(embedding, list)
-    assert all(isinstance(x, float) for x in embedding)
+    assert isinstance(embedding, np.ndarray)
+    assert embedding.dtype == np.float32
+    assert embedding.ndim == 1
     assert len(embedding) > 0
     
     # 複数テキストの埋め込み
@@ -28,8 +35,8 @@ def test_gemini_embedder():
     
     # 埋め込みベクトルの形式を確認
     assert len(embeddings) == len(texts)
-    assert all(isinstance(emb, list) for emb in embeddings)
-    assert all(len(emb) == len(embedding) for emb in embeddings)
+    assert isinstance(embeddings, np.ndarray)
+    assert embeddings.shape == (len(texts), len(embedding))
 
 
 def test_vector_store():
@@ -100,4 +107,156 @@ def test_document_store(tmp_path):
     assert all("metadata" in doc for doc in results)
     
     # コレクションの削除
-    store.clear() 
\ No newline at end of file
+    store.clear() 
+
+
+def test_embedder_batches_in_input_order():
+    """バッチ並列埋め込みが入力順に結果を返すことをテスト"""
+    backend = FakeEmbeddingBackend(dimension=16, latency=0.01)
+    embedder = GeminiEmbedder(
+        backend=backend,
+        batch_size=3,
+        max_workers=4,
+        requests_per_minute=None
+    )
+
+    texts = [f"テキスト{i}" for i in range(10)]
+    embeddings = embedder.embed_texts(texts)
+
+    # 10件が3件ずつ4バッチにまとめられている
+    assert backend.call_count == 4
+    assert sorted(backend.batch_sizes) == [1, 3, 3, 3]
+
+    # 順序が入力と一致している
+    expected = [backend.embed_batch([text])[0] for text in texts]
+    assert isinstance(embeddings, np.ndarray)
+    assert embeddings.dtype == np.float32
+    np.testing.assert_allclose(embeddings, expected, atol=1e-6)
+
+
+def test_embedder_retries_on_quota_error():
+    """クォータ超過エラー時に再試行することをテスト"""
+    backend = FakeEmbeddingBackend(fail_first=2)
+    sleeps = []
+    engine = BatchEmbeddingEngine(backend, batch_size=10, sleep=sleeps.append)
+
+    embeddings = engine.embed(["a", "b"])
+
+    assert len(embeddings) == 2
+    assert backend.call_count == 3
+    assert len(sleeps) == 2
+    assert sleeps[1] > sleeps[0] / 2  # 指数バックオフ
+
+
+def test_embedder_gives_up_after_max_retries():
+    """再試行回数の上限を超えた場合にエラーを送出することをテスト"""
+    backend = FakeEmbeddingBackend(fail_first=10)
+    engine = BatchEmbeddingEngine(backend, max_retries=2, sleep=lambda _: None)
+
+    with pytest.raises(FakeQuotaError):
+        engine.embed(["a"])
+    assert backend.call_count == 3
+
+
+def test_token_bucket():
+    """トークンバケットのレート制限をテスト"""
+    now = [0.0]
+    sleeps = []
+
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(rate=2.0, capacity=2, clock=lambda: now[0], sleep=fake_sleep)
+
+    # 容量分は待たずに取得できる
+    bucket.acquire()
+    bucket.acquire()
+    assert sleeps == []
+
+    # 3つ目は補充を待つ
+    bucket.acquire()
+    assert sleeps == [pytest.approx(0.5)]
+
+
+def test_embedding_cache_skips_cached_texts(tmp_path):
+    """キャッシュ済みのテキストでAPIが呼ばれないことをテスト"""
+    cache_path = tmp_path / "embeddings.sqlite3"
+    backend = FakeEmbeddingBackend(dimension=8)
+    embedder = GeminiEmbedder(backend=backend, cache=EmbeddingCache(cache_path))
+
+    first = embedder.embed_texts(["a", "b", "a"])
+    assert backend.batch_sizes == [2]  # 重複テキストは1回だけ埋め込む
+
+    # 再起動後も永続化されたキャッシュが使われる
+    backend = FakeEmbeddingBackend(dimension=8)
+    embedder = GeminiEmbedder(backend=backend, cache=EmbeddingCache(cache_path))
+    second = embedder.embed_texts(["a", "b", "c"])
+
+    assert backend.batch_sizes == [1]
+    for cached, original in zip(second[:2], first[:2]):
+        assert cached == pytest.approx(original, abs=1e-6)
+    assert embedder.cache.stats()["hits"] == 2
+    assert embedder.cache.stats()["misses"] == 1
+
+
+def test_embedding_cache_key_includes_model():
+    """モデル名が異なる場合は別のキャッシュエントリになることをテスト"""
+    cache = EmbeddingCache()
+    cache.put_many("model-a", ["text"], [[1.0, 2.0]])
+
+    assert cache.get_many("model-a", ["text"])[0].tolist() == [1.0, 2.0]
+    assert cache.get_many("model-b", ["text"]) == [None]
+
+
+def test_embedding_cache_lru_eviction():
+    """上限を超えた場合に最も古いエントリが削除されることをテスト"""
+    cache = EmbeddingCache(max_entries=2)
+    cache.put_many("m", ["a"], [[1.0]])
+    cache.put_many("m", ["b"], [[2.0]])
+    cache.get_many("m", ["a"])  # aを最近使用したことにする
+    cache.put_many("m", ["c"], [[3.0]])
+
+    assert len(cache) == 2
+    assert cache.get_many("m", ["a", "b", "c"]) == [[1.0], None, [3.0]]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_query_embedding_cache_normalizes_and_evicts():
+    """表記ゆれのあるクエリが同じエントリになり、上限を超えると古いものが削除されることをテスト"""
+    cache = QueryEmbeddingCache(max_entries=2)
+    stored = cache.put("m", "東京の天気は？", [1.0, 2.0])
+
+    assert not stored.flags.writeable
+    assert cache.get("m", "  東京の天気は?") is stored
+    assert cache.get("other-model", "東京の天気は？") is None
+
+    cache.put("m", "b", [3.0])
+    cache.get("m", "東京の天気は")  # 最近使用したことにする
+    cache.put("m", "c", [4.0])
+
+    assert len(cache) == 2
+    assert cache.get("m", "b") is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_repeated_query_is_embedded_once():
+    """同じ質問を繰り返し検索してもクエリの埋め込みは1回だけ計算されることをテスト"""
+    backend = FakeEmbeddingBackend(dimension=8)
+    embedder = GeminiEmbedder(backend=backend, requests_per_minute=None, query_cache_size=8)
+
+    first = embedder.embed_query("東京の天気")
+    assert embedder.embed_query("東京の天気 ") is first
+    batch = embedder.embed_queries(["東京の天気", "大阪の天気", "大阪の天気"])
+
+    assert backend.batch_sizes == [1, 1]  # 2回目以降はキャッシュから返す
+    np.testing.assert_array_equal(batch[0], first)
+    np.testing.assert_array_equal(batch[1], batch[2])
+    assert embedder.query_cache.stats()["hits"] == 2
+
+    # キャッシュを無効にした場合は毎回埋め込む
+    backend = FakeEmbeddingBackend(dimension=8)
+    embedder = GeminiEmbedder(backend=backend, requests_per_minute=None, query_cache_size=0)
+    embedder.embed_query("東京の天気")
+    embedder.embed_query("東京の天気")
+    assert backend.call_count == 2
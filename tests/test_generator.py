@@ -2,8 +2,10 @@ import pytest
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
+from app.generators.fake_model import FakeGenerativeModel
 from app.generators.generator import Generator
 from app.generators.prompt_template import PromptTemplate
+from app.generators.response_cache import ResponseCache
 from app.retrievers.document_store import DocumentStore
 from app.retrievers.retriever import Retriever
 
@@ -95,4 +97,441 @@ def test_generator_with_empty_context():
     assert isinstance(response, dict)
     assert "answer" in response
     assert "sources" in response
-    assert response["sources"] == "" 
\ No newline at end of file
+    assert response["sources"] == "" 
+
+
+def test_response_cache_layers():
+    """完全一致層と意味的類似層のヒットをテスト"""
+    cache = ResponseCache(similarity_threshold=0.9)
+    response = {"answer": "回答", "sources": "文書 1: a"}
+    cache.put("有給休暇は何日？", ["c1", "c2"], response, query_embedding=[1.0, 0.0], version=1)
+
+    # 正規化した質問とチャンクIDが一致すれば完全一致層でヒット
+    assert cache.get_exact(" 有給休暇は何日? ", ["c1", "c2"], version=1) == response
+    assert cache.get_exact("有給休暇は何日？", ["c1", "c3"], version=1) is None
+
+    # 埋め込みが近ければ意味的類似層でヒット
+    assert cache.get_semantic([0.99, 0.05], version=1) == response
+    assert cache.get_semantic([0.0, 1.0], version=1) is None
+
+    stats = cache.stats()
+    assert stats["exact_hits"] == 1
+    assert stats["semantic_hits"] == 1
+    assert stats["misses"] == 1
+
+    # コレクションのバージョンが変わると無効化される
+    assert cache.get_semantic([1.0, 0.0], version=2) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_response_cache_ttl_and_lru():
+    """TTLによる失効とLRUによる削除をテスト"""
+    now = [0.0]
+    cache = ResponseCache(max_entries=2, ttl=10, clock=lambda: now[0])
+    cache.put("q1", [], {"answer": "1"})
+    cache.put("q2", [], {"answer": "2"})
+    cache.get_exact("q1", [])  # q1を最近使用したことにする
+    cache.put("q3", [], {"answer": "3"})
+
+    assert cache.get_exact("q2", []) is None
+    assert cache.get_exact("q1", []) == {"answer": "1"}
+
+    now[0] = 11.0
+    assert cache.get_exact("q3", []) is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_generator_uses_response_cache(tmp_path, make_local_store):
+    """同じ・類似の質問で回答生成が省略されることをテスト"""
+    doc_dir = tmp_path / "test_docs"
+    doc_dir.mkdir()
+    (doc_dir / "test.md").write_text("# 休暇\n\n有給休暇は年20日です。")
+
+    store = make_local_store()
+    store.add_documents(doc_dir, metadata={"source": "test_docs"})
+    model = FakeGenerativeModel(answer="20日です。")
+    generator = Generator(Retriever(store), model=model, response_cache=ResponseCache())
+
+    first = generator.generate_response("有給休暇は何日ですか？")
+    assert first == {"answer": "20日です。", "sources": "文書 1: test_docs"}
+    second = generator.generate_response("有給休暇は何日ですか")
+    assert second == first
+    assert model.call_count == 1
+
+    # 文書が更新されるとキャッシュは無効化される
+    (doc_dir / "test.md").write_text("# 休暇\n\n有給休暇は年25日です。")
+    store.add_documents(doc_dir, metadata={"source": "test_docs"})
+    generator.generate_response("有給休暇は何日ですか？")
+    assert model.call_count == 2
+
+
+def test_generator_stream_response(tmp_path, make_local_store):
+    """回答のストリーミング生成と所要時間の計測をテスト"""
+    doc_dir = tmp_path / "test_docs"
+    doc_dir.mkdir()
+    (doc_dir / "test.md").write_text("# 休暇\n\n有給休暇は年20日です。")
+
+    store = make_local_store()
+    store.add_documents(doc_dir, metadata={"source": "test_docs"})
+    model = FakeGenerativeModel(answer="有給休暇は年20日です。", chunk_size=3)
+    generator = Generator(Retriever(store), model=model, response_cache=ResponseCache())
+
+    stream = generator.stream_response("有給休暇は何日ですか？")
+    deltas = list(stream)
+
+    assert len(deltas) > 1
+    assert "".join(deltas) == "有給休暇は年20日です。"
+    assert stream.answer == "有給休暇は年20日です。"
+    assert stream.sources == "文書 1: test_docs"
+    assert 0 <= stream.time_to_first_token <= stream.total_latency
+
+    # ストリーミングで生成した回答もキャッシュされる
+    assert generator.generate_response("有給休暇は何日ですか？")["answer"] == stream.answer
+    assert model.call_count == 1
+
+
+
+@patch('google.generativeai.list_models')
+@patch('google.generativeai.GenerativeModel')
+def test_generator_creates_model_lazily(mock_model, mock_list_models, monkeypatch):
+    """Generatorの初期化ではモデル一覧の取得やクライアントの作成を行わないことをテスト"""
+    monkeypatch.setenv("GOOGLE_API_KEY", "dummy")
+    mock_model.return_value.generate_content.return_value = MagicMock(text="回答")
+    mock_retriever = MagicMock()
+    mock_retriever.retrieve.return_value = []
+    mock_retriever.format_context.return_value = ""
+
+    generator = Generator(mock_retriever, model_name="gemini-test")
+    assert not mock_model.called
+
+    response = generator.generate_response("テスト質問")
+    assert response["answer"] == "回答"
+    mock_model.assert_called_once_with("gemini-test")
+    assert not mock_list_models.called
+
+
+def test_generator_requires_api_key(monkeypatch):
+    """APIキーがない場合はモデルを渡さないGeneratorの作成が失敗することをテスト"""
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    monkeypatch.setattr("app.config.GOOGLE_API_KEY", None)
+
+    with pytest.raises(ValueError):
+        Generator(MagicMock())
+    # モデルを渡せばAPIキーは不要
+    Generator(MagicMock(), model=FakeGenerativeModel())
+
+
+def test_pipeline_run_batch(tmp_path, make_local_store):
+    """まとめて質問した結果が順序どおりに返り、失敗が質問ごとに報告されることをテスト"""
+    from app.pipeline import Pipeline
+
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir()
+    (docs_dir / "test.md").write_text("# テスト文書\n\nこれはバッチ処理のテスト用の文書です。")
+
+    def answer(prompt):
+        query = prompt.rsplit("質問: ", 1)[1].split("\n", 1)[0]
+        if query == "失敗する質問":
+            raise RuntimeError("generation failed")
+        return f"{query}への回答"
+
+    store = make_local_store("test_batch")
+    pipeline = Pipeline(docs_dir, document_store=store, model=FakeGenerativeModel(answer=answer))
+    pipeline.initialize()
+    embedding_backend = store.embedder.backend
+    calls_before = embedding_backend.call_count
+    backend_query = MagicMock(wraps=store.vector_store.backend.query)
+    store.vector_store.backend.query = backend_query
+
+    queries = [f"質問{i}" for i in range(10)] + ["失敗する質問"]
+    output = pipeline.run_batch(queries, max_workers=4)
+
+    results = output["results"]
+    assert [result["query"] for result in results] == queries
+    assert [result["answer"] for result in results[:10]] == [f"質問{i}への回答" for i in range(10)]
+    assert "test.md" in results[0]["sources"]
+    assert results[10]["error"] == "generation failed"
+    # 埋め込みはまとめて1回、ベクトル検索も1回で実行される
+    assert embedding_backend.call_count - calls_before == 1
+    assert backend_query.call_count == 1
+    assert len(backend_query.call_args.kwargs["query_embeddings"]) == len(queries)
+
+    stats = output["stats"]
+    assert stats["queries"] == 11
+    assert stats["succeeded"] == 10
+    assert stats["failed"] == 1
+    assert stats["queries_per_second"] > 0
+
+    # 2回目は回答キャッシュから返る（「質問1」と「質問2」は似ているため意味的類似層は使わない）
+    pipeline.generator.response_cache.similarity_threshold = None
+    again = pipeline.run_batch(queries[:3])
+    assert [result["answer"] for result in again["results"]] == [f"質問{i}への回答" for i in range(3)]
+    assert pipeline.generator.response_cache.stats()["exact_hits"] == 3
+
+
+def test_context_builder_merges_and_deduplicates():
+    """重なったチャンクの結合と、ほぼ同じ内容のチャンクの除去をテスト"""
+    from app.generators.context_builder import ContextBuilder
+    from app.utils.text import estimate_tokens
+    from app.splitters.text_splitter import TextSplitter
+
+    text = "".join(f"これは{i}番目の文です。" for i in range(60))
+    chunks = TextSplitter(chunk_size=100, chunk_overlap=30).split_text_with_offsets(text)
+    docs = [
+        {"text": chunk, "metadata": {"file_path": "/docs/a.md", "start_index": offset}, "id": f"a{i}"}
+        for i, (offset, chunk) in enumerate(chunks[:3])
+    ]
+    duplicate = {
+        "text": docs[0]["text"] + "。", "metadata": {"file_path": "/docs/b.md", "start_index": 0}, "id": "b0"
+    }
+    other = {"text": "まったく別の内容の文書です。", "metadata": {"source": "c.md"}, "id": "c0"}
+
+    context, stats, packed_ids = ContextBuilder(token_budget=0).build(
+        [docs[1], duplicate, docs[0], other, docs[2]]
+    )
+
+    start = chunks[0][0]
+    end = chunks[2][0] + len(chunks[2][1])
+    assert context.split("\n") == [text[start:end], other["text"]]
+    assert stats["chunks"] == 5
+    assert stats["chunks_merged"] == 2
+    assert stats["duplicates_dropped"] == 1
+    assert stats["tokens_saved"] == stats["original_tokens"] - estimate_tokens(context) > 0
+    # 重複として除いたチャンクのIDは含まない
+    assert packed_ids == ["a0", "a1", "a2", "c0"]
+
+
+def test_context_builder_token_budget():
+    """上位の文章からトークン数の上限まで詰めることをテスト"""
+    from app.generators.context_builder import ContextBuilder
+    from app.utils.text import estimate_tokens
+
+    assert estimate_tokens("日本語") == 3
+    assert estimate_tokens("abcdefgh") == 2
+
+    docs = [{"text": f"{i}番目の文書の内容です。" * 3, "metadata": {}, "id": f"d{i}"} for i in range(5)]
+    builder = ContextBuilder(token_budget=70, dedup_threshold=None)
+    context, stats, packed_ids = builder.build(docs)
+    assert context.split("\n") == [docs[0]["text"], docs[1]["text"]]
+    assert packed_ids == ["d0", "d1"]
+    assert stats["passages_dropped"] == 3
+    assert stats["context_tokens"] <= 70
+
+    # 最上位の文書だけで上限を超える場合は切り詰める
+    context, _, _ = ContextBuilder(token_budget=10).build(docs)
+    assert context == docs[0]["text"][:10]
+
+
+def test_generator_reports_tokens_saved(tmp_path):
+    """Generatorが削減したトークン数を記録することをテスト"""
+    mock_retriever = MagicMock()
+    mock_retriever.retrieve.return_value = [
+        {"text": "同じ内容の文書です。" * 5, "metadata": {}, "id": "a"},
+        {"text": "同じ内容の文書です。" * 5, "metadata": {}, "id": "b"},
+    ]
+    model = FakeGenerativeModel()
+    generator = Generator(mock_retriever, model=model)
+
+    generator.generate_response("質問")
+    assert model.prompts[0].count("同じ内容の文書です。") == 5
+    assert generator.last_context_stats["duplicates_dropped"] == 1
+    summary = generator.context_summary()
+    assert summary["queries"] == 1
+    assert summary["tokens_saved"] == generator.last_context_stats["tokens_saved"] > 0
+
+    stream = generator.stream_response("質問")
+    stream.read()
+    assert stream.context_stats["duplicates_dropped"] == 1
+
+
+def test_chat_session_reuses_context_for_follow_up(tmp_path, make_local_store):
+    """同じ話題の追加の質問では検索を省略し、送った文脈を再送しないことをテスト"""
+    from app.generators.chat_session import ChatSession
+
+    doc_dir = tmp_path / "test_docs"
+    doc_dir.mkdir()
+    (doc_dir / "leave.md").write_text("# 休暇\n\n有給休暇は年20日です。")
+    (doc_dir / "housing.md").write_text("# 社宅\n\n社宅の申し込みは総務部で受け付けます。")
+
+    store = make_local_store("test_chat")
+    store.add_documents(doc_dir)
+    model = FakeGenerativeModel(answer="回答です。")
+    retriever = Retriever(store)
+    retrieve = retriever.retrieve
+    retriever.retrieve = MagicMock(side_effect=lambda query, **kwargs: retrieve(query, n_results=1, **kwargs))
+    session = ChatSession(Generator(retriever, model=model), topic_similarity=0.5)
+
+    first = session.ask("有給休暇は何日ですか？")
+    assert first["reused_context"] is False
+    chat = session._chat
+    assert "有給休暇は年20日です。" in chat.history[0]["parts"][0]
+    follow_up = session.ask("有給休暇は何日もらえますか？")
+    assert follow_up["reused_context"] is True
+    assert follow_up["sources"] == first["sources"]
+    assert retriever.retrieve.call_count == 1
+    # 追加の質問では質問だけを送る
+    assert model.prompts[1] == "質問: 有給休暇は何日もらえますか？"
+
+    other = session.ask("社宅の申し込み先を教えてください")
+    assert other["reused_context"] is False
+    assert retriever.retrieve.call_count == 2
+    # まだ送っていないチャンクだけを文脈として送る
+    assert "社宅の申し込みは総務部で受け付けます。" in model.prompts[2]
+    assert "有給休暇は年20日です。" not in model.prompts[2]
+    assert model.chat_count == 1
+
+
+def test_chat_session_resends_context_after_failed_send(tmp_path, make_local_store):
+    """送信に失敗したターンや読み終えていないストリームの文脈が次のターンで送られることをテスト"""
+    from app.generators.chat_session import ChatSession
+
+    doc_dir = tmp_path / "test_docs"
+    doc_dir.mkdir()
+    (doc_dir / "leave.md").write_text("# 休暇\n\n有給休暇は年20日です。")
+    store = make_local_store("test_chat_retry")
+    store.add_documents(doc_dir)
+
+    failures = [RuntimeError("503 Service Unavailable")]
+
+    def answer(message):
+        if failures:
+            raise failures.pop()
+        return "回答です。"
+
+    model = FakeGenerativeModel(answer=answer)
+    session = ChatSession(Generator(Retriever(store), model=model), topic_similarity=0.5)
+    with pytest.raises(RuntimeError):
+        session.ask("有給休暇は何日ですか？")
+    assert session.stats["chunks_sent"] == 0
+
+    # チャットを作り直し、送れなかった文脈を含めて送る
+    session.ask("有給休暇は何日ですか？")
+    assert model.chat_count == 2
+    assert "有給休暇は年20日です。" in session._chat.history[0]["parts"][0]
+
+    # 最後まで読まれなかったストリームの後もチャットを作り直す
+    session.ask_stream("有給休暇は何日もらえますか？")
+    session.ask("有給休暇は何日もらえますか？")
+    assert model.chat_count == 3
+    assert [turn["query"] for turn in session.turns] == ["有給休暇は何日ですか？", "有給休暇は何日もらえますか？"]
+
+
+def test_chat_session_sends_chunks_dropped_by_token_budget():
+    """トークン数の上限で文脈から外れたチャンクを送信済みとせず、次のターンで送ることをテスト"""
+    from app.generators.chat_session import ChatSession
+    from app.generators.context_builder import ContextBuilder
+
+    docs = [{"id": name, "text": f"文書{name}の内容です。" * 3, "metadata": {}} for name in "ABC"]
+    retriever = MagicMock()
+    retriever.collection_version = 1
+    retriever.embed_query.return_value = [1.0, 0.0]
+    retriever.retrieve.return_value = docs
+    model = FakeGenerativeModel()
+    generator = Generator(
+        retriever, model=model, context_builder=ContextBuilder(token_budget=30, dedup_threshold=None)
+    )
+    session = ChatSession(generator, topic_similarity=0.5)
+
+    session.ask("最初の質問")
+    assert "文書Cの内容です。" in session._chat.history[0]["parts"][0]
+    assert "文書Aの内容です。" in model.prompts[0]
+    assert "文書Bの内容です。" not in model.prompts[0]
+    assert session.stats["chunks_sent"] == 1
+
+    # 同じ話題の質問では、上限で送れなかったチャンクを送る
+    session.ask("次の質問")
+    assert retriever.retrieve.call_count == 1
+    assert "文書Bの内容です。" in model.prompts[1]
+    assert model.chat_count == 1
+
+
+def test_chat_session_condenses_history(tmp_path, make_local_store):
+    """履歴が上限を超えると古いやり取りを要約にまとめてチャットを作り直すことをテスト"""
+    from app.generators.chat_session import ChatSession
+
+    store = make_local_store("test_chat_history")
+    model = FakeGenerativeModel(answer=lambda message: message.rsplit("質問: ", 1)[1] + "への回答")
+    session = ChatSession(Generator(Retriever(store), model=model), max_turns=2, topic_similarity=2.0)
+
+    for query in ["一つ目", "二つ目", "三つ目"]:
+        session.ask(query)
+
+    assert [turn["query"] for turn in session.turns] == ["三つ目"]
+    assert session.summary == ["- 質問: 一つ目 / 回答: 一つ目への回答", "- 質問: 二つ目 / 回答: 二つ目への回答"]
+
+    # 次のターンで要約を先頭に置いたチャットを作り直す
+    session.ask("四つ目")
+    assert model.chat_count == 2
+    chat = session._chat
+    assert "これまでの会話の要約:\n- 質問: 一つ目" in chat.history[0]["parts"][0]
+    assert chat.history[2]["parts"] == ["質問: 三つ目"]
+    assert chat.history[-1]["parts"] == ["四つ目への回答"]
+
+
+def test_context_cache_create_refresh_and_expire():
+    """固定部分のキャッシュの作成・再利用・期限の延長・期限切れ後の作り直しをテスト"""
+    from app.generators.context_cache import ContextCache
+    from app.generators.fake_cache_backend import FakeContextCacheBackend
+
+    now = [0.0]
+    model = FakeGenerativeModel()
+    backend = FakeContextCacheBackend(model, clock=lambda: now[0])
+    cache = ContextCache(
+        backend, model_name="gemini-test", system_instruction="丁寧に答えてください。",
+        documents=["就業規則"], ttl=100, refresh_margin=10, min_tokens=0, clock=lambda: now[0]
+    )
+
+    assert cache.get_model() is model
+    created = backend.caches["cachedContents/fake-1"]
+    assert created["system_instruction"] == "丁寧に答えてください。"
+    assert created["contents"] == ["参考資料:\n\n就業規則"]
+
+    now[0] = 50.0
+    assert cache.get_model() is model
+    now[0] = 95.0  # 期限が近いので延長する
+    assert cache.get_model() is model
+    assert backend.refresh_count == 1
+    assert backend.caches["cachedContents/fake-1"]["expire_time"] == 195.0
+
+    now[0] = 500.0  # 期限切れのため作り直す
+    assert cache.get_model() is model
+    assert backend.create_count == 2
+    assert cache.stats()["hits"] == 1
+
+    # 作成に失敗した場合はしばらくキャッシュを使わない
+    failing = ContextCache(
+        FakeContextCacheBackend(model, fail_create=True), system_instruction="指示",
+        ttl=100, refresh_margin=10, min_tokens=0, clock=lambda: now[0]
+    )
+    assert failing.get_model() is None
+    assert failing.get_model() is None
+    assert failing.stats()["failures"] == 1
+    assert failing.inline_prefix == "指示\n\n"
+
+
+def test_generator_uses_context_cache(tmp_path, make_local_store):
+    """固定部分がキャッシュされていれば送らず、キャッシュできなければプロンプトに含めることをテスト"""
+    from app.generators.context_cache import ContextCache
+    from app.generators.fake_cache_backend import FakeContextCacheBackend
+
+    doc_dir = tmp_path / "test_docs"
+    doc_dir.mkdir()
+    (doc_dir / "test.md").write_text("# 休暇\n\n有給休暇は年20日です。")
+    store = make_local_store("test_context_cache")
+    store.add_documents(doc_dir)
+
+    model = FakeGenerativeModel(answer="20日です。")
+    backend = FakeContextCacheBackend(model)
+    cache = ContextCache(backend, system_instruction="社内規程の担当者として答えてください。", min_tokens=0)
+    generator = Generator(Retriever(store), model=model, context_cache=cache)
+
+    assert generator.generate_response("有給休暇は何日ですか？")["answer"] == "20日です。"
+    assert backend.create_count == 1
+    assert "社内規程の担当者" not in model.prompts[0]
+
+    # 固定部分が最小トークン数に満たない場合はキャッシュせず毎回送る
+    cache.min_tokens = 10 ** 6
+    generator.generate_response("有給休暇は何日ですか？")
+    assert model.prompts[1].startswith("社内規程の担当者として答えてください。\n\n")
+    assert backend.create_count == 1
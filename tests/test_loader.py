@@ -0,0 +1,193 @@
+import types
+
+from app.loaders.document_loader import DocumentLoader
+
+
+def test_iter_documents(tmp_path):
+    """文書を1件ずつ遅延して読み込むことをテスト"""
+    doc_dir = tmp_path / "test_docs"
+    doc_dir.mkdir()
+    (doc_dir / "a.md").write_text("# A\n\nAの文書です。")
+    (doc_dir / "b.md").write_text("# B\n\nBの文書です。")
+    (doc_dir / "ignored.txt").write_text("対象外のファイル")
+
+    documents = DocumentLoader.iter_documents(doc_dir)
+    assert isinstance(documents, types.GeneratorType)
+
+    first = next(documents)
+    assert "Aの文書です。" in first["text"]
+    assert first["metadata"] == {"source": str(doc_dir / "a.md"), "type": "markdown"}
+
+    rest = list(documents)
+    assert len(rest) == 1
+    assert "Bの文書です。" in rest[0]["text"]
+
+
+def test_iter_documents_skips_broken_files(tmp_path):
+    """読み込みに失敗したファイルを読み飛ばすことをテスト"""
+    doc_dir = tmp_path / "test_docs"
+    doc_dir.mkdir()
+    (doc_dir / "broken.pdf").write_bytes(b"not a pdf")
+    (doc_dir / "ok.md").write_text("正常な文書です。")
+
+    documents = list(DocumentLoader.iter_documents(doc_dir, per_page=True))
+
+    assert len(documents) == 1
+    assert documents[0]["metadata"]["type"] == "markdown"
+
+
+def make_pdf(path, page_texts):
+    """各ページに1行の英数字のテキストを持つPDFを作成"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for text in page_texts:
+        content = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode("ascii")
+        page_id = len(objects) + 1
+        kids.append(f"{page_id} 0 R")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode("ascii")
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(page_texts)} >>".encode("ascii")
+
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(data)
+    return path
+
+
+def test_pdf_extractor_page_ranges_and_cache(tmp_path):
+    """ページ範囲ごとの並列抽出と、抽出したページのキャッシュをテスト"""
+    from app.loaders.pdf_extractor import PdfExtractor
+    from app.loaders.pdf_page_cache import PdfPageCache
+
+    pdf = make_pdf(tmp_path / "manual.pdf", [f"Page {i} error E10{i}" for i in range(5)])
+    cache = PdfPageCache(tmp_path / "pages.sqlite3")
+    extractor = PdfExtractor(cache=cache, max_workers=2, pages_per_task=2)
+
+    state = extractor.plan(pdf)
+    assert state["page_count"] == 5
+    assert state["ranges"] == [(0, 2), (2, 4), (4, 5)]
+
+    pages = extractor.extract(pdf)
+    assert [page.strip() for page in pages] == [f"Page {i} error E10{i}" for i in range(5)]
+    assert extractor.timings[str(pdf)]["cached_pages"] == 0
+
+    # 2回目はPDFを開かずにキャッシュから返す
+    again = PdfExtractor(cache=PdfPageCache(tmp_path / "pages.sqlite3"), max_workers=0)
+    assert again.plan(pdf)["ranges"] == []
+    assert again.extract(pdf) == pages
+    assert again.timings[str(pdf)] == {"pages": 5, "cached_pages": 5, "seconds": 0.0}
+    assert again.slowest(1)[0][0] == str(pdf)
+
+
+def test_parallel_processor_splits_pdf_by_page_range(tmp_path):
+    """PDFをページ範囲ごとのタスクに分けて抽出し、ページごとにチャンクを区切ることをテスト"""
+    from app.loaders.parallel_loader import ParallelDocumentProcessor
+    from app.loaders.pdf_extractor import PdfExtractor
+
+    pdf = make_pdf(tmp_path / "manual.pdf", [f"Page {i}" for i in range(6)])
+    (tmp_path / "note.md").write_text("# メモ\n\nメモの本文です。")
+    extractor = PdfExtractor(pages_per_task=2)
+
+    for workers in (0, 2):
+        processor = ParallelDocumentProcessor(
+            chunk_size=200, chunk_overlap=20, max_workers=workers, pdf_extractor=extractor
+        )
+        results = dict(processor.process([pdf, tmp_path / "note.md"]))
+
+        assert [chunk for _, chunk, _ in results[pdf]] == [f"Page {i}" for i in range(6)]
+        assert [section for _, _, section in results[pdf]] == [{"page": i} for i in range(1, 7)]
+        assert "メモの本文です。" in results[tmp_path / "note.md"][0][1]
+        assert results[tmp_path / "note.md"][0][2] == {"section": "メモ"}
+
+
+def test_markdown_converter_drops_markup():
+    """Markdownの記法を取り除き、見出しの階層を返すことをテスト"""
+    from app.loaders.markdown_converter import MarkdownConverter
+
+    md_text = (
+        "---\ntitle: 手順書\n---\n"
+        "# 導入\n\n"
+        "**重要**な[リンク](https://example.com)と`snake_case`の説明です。\n\n"
+        "## 手順\n\n"
+        "1. インストールする\n"
+        "- [x] 設定&確認\n\n"
+        "```python\nprint(\"**そのまま**\")\n```\n\n"
+        "| 項目 | 値 |\n|---|---|\n| size | 10 |\n\n"
+        "> 引用の<em>文</em>\n\n"
+        "設定\n---\n\n"
+        "#### 詳細\n本文\n\n"
+        "# 付録\n"
+    )
+
+    text, sections = MarkdownConverter().convert(md_text)
+
+    assert text == (
+        "# 導入\n\n"
+        "重要なリンクとsnake_caseの説明です。\n\n"
+        "## 手順\n\n"
+        "インストールする\n"
+        "設定&確認\n\n"
+        "print(\"**そのまま**\")\n\n"
+        "項目 値\n"
+        "size 10\n\n"
+        "引用の文\n\n"
+        "## 設定\n\n"
+        "#### 詳細\n本文\n\n"
+        "# 付録\n"
+    )
+    assert [section["section"] for _, section in sections] == [
+        "導入", "導入 > 手順", "導入 > 設定", "導入 > 設定 > 詳細", "付録"
+    ]
+    for start, section in sections:
+        assert text[start:].startswith("#")
+        assert section["section"].split(" > ")[-1] in text[start:text.index("\n", start)]
+
+
+def test_markdown_converter_keeps_literal_backslashes():
+    """エスケープのバックスラッシュだけを取り除き、パスなどのバックスラッシュは残すことをテスト"""
+    from app.loaders.markdown_converter import MarkdownConverter
+
+    text, _ = MarkdownConverter().convert(
+        "保存先は C:\\Users\\share\\設定.ini です。\n\n"
+        "\\*強調ではない\\* と **強調** と \\[括弧\\] と a\\\\b\n"
+    )
+
+    assert text == (
+        "保存先は C:\\Users\\share\\設定.ini です。\n\n"
+        "*強調ではない* と 強調 と [括弧] と a\\b\n"
+    )
+
+
+def test_markdown_converter_keeps_code_comments_out_of_headings():
+    """コードブロック内の"#"で始まる行を見出しとして扱わず、info string付きの行で閉じないことをテスト"""
+    from app.loaders.markdown_converter import MarkdownConverter
+    from app.splitters.text_splitter import TextSplitter
+
+    text, sections = MarkdownConverter().convert(
+        "# A\n\n"
+        "````markdown\n"
+        "```python\n"
+        "# install\n"
+        "pip install rag\n"
+        "```\n"
+        "````\n\n"
+        "本文です。\n"
+    )
+
+    assert text == "# A\n\n```python\n # install\npip install rag\n```\n\n本文です。\n"
+    assert len(sections) == 1
+    assert len(TextSplitter(chunk_size=200, chunk_overlap=20).split_text(text)) == 1
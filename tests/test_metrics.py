@@ -0,0 +1,71 @@
+import random
+
+from app.generators.fake_model import FakeGenerativeModel
+from app.pipeline import Pipeline
+from app.utils.metrics import REGISTRY, Histogram, Metrics, count, stage, tracing
+
+
+def test_histogram_quantiles_within_precision():
+    """ヒストグラムの分位数が相対誤差の範囲内に収まることをテスト"""
+    rng = random.Random(0)
+    values = [rng.lognormvariate(-4, 1) for _ in range(10000)]
+    histogram = Histogram(precision=0.01)
+    for value in values:
+        histogram.record(value)
+
+    values.sort()
+    for q, key in ((0.5, "p50"), (0.95, "p95"), (0.99, "p99")):
+        exact = values[int(q * len(values)) - 1]
+        assert abs(histogram.summary()[key] - exact) / exact <= 0.02
+    assert histogram.summary()["count"] == 10000
+    assert Histogram().summary()["p99"] == 0.0
+
+
+def test_metrics_prometheus_and_trace():
+    """Prometheus形式の出力と、トレース中の段階・カウンターの記録をテスト"""
+    metrics = Metrics(namespace="test")
+    metrics.inc("api_calls_total", api="embed")
+    metrics.inc("api_calls_total", 2, api="generate")
+    metrics.observe("stage_duration_seconds", 0.25, stage="generate")
+
+    text = metrics.to_prometheus()
+    assert "# TYPE test_api_calls_total counter" in text
+    assert 'test_api_calls_total{api="generate"} 2' in text
+    assert 'test_stage_duration_seconds{stage="generate",quantile="0.5"} 0.25' in text
+    assert 'test_stage_duration_seconds_count{stage="generate"} 1' in text
+    assert metrics.snapshot()["counters"]['api_calls_total{api="embed"}'] == 1
+
+    with tracing() as trace:
+        with stage("unit_test_stage"):
+            count("unit_test_total", 3)
+    count("unit_test_total")
+    result = trace.to_dict()
+    assert [item["stage"] for item in result["stages"]] == ["unit_test_stage"]
+    assert result["counters"] == {"unit_test_total": 3}
+    assert REGISTRY.counter("unit_test_total") >= 4
+
+
+def test_pipeline_run_with_trace(tmp_path, make_local_store):
+    """Pipeline.runが段階ごとの所要時間とトークン数を含むトレースを返すことをテスト"""
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir()
+    (docs_dir / "test.md").write_text("# テスト文書\n\nこれはメトリクスのテスト用の文書です。")
+    pipeline = Pipeline(
+        docs_dir=docs_dir,
+        collection_name="test_metrics",
+        document_store=make_local_store("test_metrics"),
+        model=FakeGenerativeModel()
+    )
+    before = REGISTRY.counter("chunks_total")
+    pipeline.initialize()
+    assert REGISTRY.counter("chunks_total") > before
+
+    response = pipeline.run("テスト文書について", trace=True)
+
+    assert response["answer"] == "これはテスト回答です。"
+    stages = {item["stage"] for item in response["trace"]["stages"]}
+    assert {"embed", "vector_query", "prompt_build", "generate", "query"} <= stages
+    assert response["trace"]["counters"]['api_calls_total{api="generate"}'] == 1
+    assert response["trace"]["counters"]["tokens_out_total"] > 0
+    assert "trace" not in pipeline.run("テスト文書について")
+    assert REGISTRY.histogram("stage_duration_seconds", stage="generate")["count"] >= 1
@@ -1,7 +1,10 @@
 import pytest
 from pathlib import Path
+from unittest.mock import MagicMock
 
+from app.retrievers.bm25_index import BM25Index, tokenize
 from app.retrievers.document_store import DocumentStore
+from app.retrievers.manifest import IngestManifest
 from app.retrievers.retriever import Retriever
 
 
@@ -93,4 +96,317 @@ def test_retriever_with_filter(tmp_path):
     assert all(doc["metadata"]["source"] == "test_docs" for doc in results)
     
     # コレクションの削除
-    store.clear() 
\ No newline at end of file
+    store.clear() 
+
+
+class InMemoryVectorStore:
+    """テスト用のVectorStore代替"""
+
+    def __init__(self):
+        self.rows = {}
+        self.added = []
+        self.deleted = []
+
+    def add_texts(self, texts, metadatas=None, ids=None):
+        self.added.extend(ids)
+        for text, meta, id_ in zip(texts, metadatas, ids):
+            self.rows[id_] = (text, meta)
+
+    def delete_texts(self, ids):
+        self.deleted.extend(ids)
+        for id_ in ids:
+            self.rows.pop(id_, None)
+
+    def delete_collection(self):
+        self.rows.clear()
+
+    def flush(self):
+        self.flushed = True
+
+
+def test_incremental_add_documents(tmp_path, make_local_store):
+    """変更のあったファイルだけが再登録されることをテスト"""
+    doc_dir = tmp_path / "test_docs"
+    doc_dir.mkdir()
+    (doc_dir / "a.md").write_text("# A\n\nこれはAの文書です。")
+    (doc_dir / "b.md").write_text("# B\n\nこれはBの文書です。")
+    (doc_dir / "c.md").write_text("# C\n\nこれはCの文書です。")
+
+    store = make_local_store("test_incremental", vector_store=InMemoryVectorStore())
+    stats = store.add_documents(doc_dir)
+    assert stats["added"] == 3
+    first_ids = set(store.vector_store.rows)
+    assert all(meta["source"] in ("a.md", "b.md", "c.md") for _, meta in store.vector_store.rows.values())
+
+    # 変更なしの再実行では何も登録されない
+    store.vector_store.added.clear()
+    stats = store.add_documents(doc_dir)
+    assert stats["unchanged"] == 3
+    assert store.vector_store.added == []
+
+    # マニフェストは永続化され、別インスタンスでも再利用される
+    store2 = make_local_store("test_incremental", vector_store=InMemoryVectorStore())
+    store2.vector_store = store.vector_store
+    stats = store2.add_documents(doc_dir)
+    assert stats["unchanged"] == 3
+
+    # 1ファイル変更・1ファイル削除
+    (doc_dir / "b.md").write_text("# B\n\nBの文書は更新されました。")
+    (doc_dir / "c.md").unlink()
+    stats = store2.add_documents(doc_dir)
+
+    assert stats["updated"] == 1
+    assert stats["deleted"] == 1
+    assert stats["unchanged"] == 1
+    remaining = {text for text, _ in store.vector_store.rows.values()}
+    assert any("更新されました" in text for text in remaining)
+    assert not any("Cの文書" in text for text in remaining)
+    assert not any("これはBの文書" in text for text in remaining)
+    # 未変更ファイルのチャンクIDは変わらない
+    a_ids = {id_ for id_, (_, meta) in store.vector_store.rows.items() if meta["source"] == "a.md"}
+    assert a_ids <= first_ids
+
+
+def test_chunk_ids_are_stable():
+    """チャンクIDがファイル・位置・内容から決まることをテスト"""
+    id1 = IngestManifest.chunk_id("/docs/a.md", 0, "テキスト")
+    assert id1 == IngestManifest.chunk_id("/docs/a.md", 0, "テキスト")
+    assert id1 != IngestManifest.chunk_id("/docs/a.md", 10, "テキスト")
+    assert id1 != IngestManifest.chunk_id("/docs/b.md", 0, "テキスト")
+    assert id1 != IngestManifest.chunk_id("/docs/a.md", 0, "別のテキスト")
+
+
+def test_add_documents_with_process_pool(tmp_path, make_local_store):
+    """プロセスプールでの並列読み込みと分割バッチ登録をテスト"""
+    doc_dir = tmp_path / "test_docs"
+    doc_dir.mkdir()
+    for i in range(6):
+        (doc_dir / f"doc{i}.md").write_text(f"# 文書{i}\n\n" + f"これは{i}番目の文書です。" * 20)
+
+    store = make_local_store("test_incremental", vector_store=InMemoryVectorStore(), ingest_workers=2)
+    store.ingest_batch_size = 5
+    stats = store.add_documents(doc_dir)
+
+    assert stats["added"] == 6
+    assert stats["chunks_added"] == len(store.vector_store.rows)
+    sources = {meta["source"] for _, meta in store.vector_store.rows.values()}
+    assert sources == {f"doc{i}.md" for i in range(6)}
+
+
+def test_bm25_tokenize():
+    """英数字の語はそのまま、日本語は文字bigramに分割されることをテスト"""
+    tokens = tokenize("エラーコードＥＲＲ-404が発生")
+    assert "err-404" in tokens
+    assert "エラ" in tokens
+    assert "発生" in tokens
+
+
+def test_bm25_index_incremental_and_persist(tmp_path):
+    """BM25インデックスの追加・削除・保存・読み込みをテスト"""
+    index = BM25Index(tmp_path / "bm25.npz")
+    index.add(
+        ["a", "b", "c"],
+        ["ERR-404は認証エラーです", "ネットワークの設定について", "サーバーの再起動手順"]
+    )
+    assert index.search("ERR-404の原因")[0][0] == "a"
+    assert index.search("再起動")[0][0] == "c"
+
+    index.remove(["a"])
+    index.add(["b"], ["ERR-500はサーバーエラーです"])
+    assert index.search("ERR-404") == []
+    assert index.search("ERR-500")[0][0] == "b"
+    index.save()
+
+    loaded = BM25Index(tmp_path / "bm25.npz")
+    assert len(loaded) == 2
+    assert loaded.search("ERR-500") == index.search("ERR-500")
+    assert loaded.search("再起動")[0][0] == "c"
+
+    loaded.clear()
+    assert len(loaded) == 0
+    assert not (tmp_path / "bm25.npz").exists()
+
+
+def test_bm25_index_merge_and_common_terms():
+    """差分をまとめ直しても結果が変わらず、多くの文書に現れる語を読み飛ばすことをテスト"""
+    ids = [f"doc-{i}" for i in range(40)]
+    texts = [f"社内規程の第{i}条 CODE-{i}" for i in range(40)]
+    index = BM25Index(merge_threshold=0)
+    index.add(ids[:20], texts[:20])
+    index.add(ids[20:], texts[20:])
+    index.remove(ids[::2])
+    reference = BM25Index(merge_threshold=10**9)
+    reference.add(ids[1::2], texts[1::2])
+    assert index.search("規程 CODE-7", k=3) == reference.search("規程 CODE-7", k=3)
+    assert index.search("CODE-8") == []
+
+    # 「規程」はすべての文書に現れるため、珍しい語があればスコアに加えない
+    capped = BM25Index(max_df_ratio=0.5)
+    capped.add(ids, texts)
+    assert capped.search("規程 CODE-7") == capped.search("CODE-7")
+    assert capped.search("規程", k=3)[0][0] == "doc-0"
+
+
+def test_reciprocal_rank_fusion():
+    """ベクトル検索とBM25の順位が重み付きで統合されることをテスト"""
+    store = MagicMock()
+    store.vector_store.get_texts.return_value = [{"text": "D", "metadata": {}, "id": "d"}]
+    vector_results = [{"text": t.upper(), "metadata": {}, "id": t} for t in "abc"]
+    lexical_results = [("c", 5.0), ("d", 3.0)]
+
+    fused = Retriever(store, rrf_k=60)._fuse(vector_results, lexical_results, 3)
+    # cは両方に含まれるため先頭、次にベクトル1位のa、BM25 2位のdとベクトル2位のbは同点
+    assert [doc["id"] for doc in fused] == ["c", "a", "b"]
+    assert fused[0]["score"] == pytest.approx(1 / 63 + 1 / 61)
+
+    fused = Retriever(store, lexical_weight=3.0)._fuse(vector_results, lexical_results, 2)
+    assert [doc["id"] for doc in fused] == ["c", "d"]
+    # BM25でのみ見つかった文書はベクトルストアから取得する
+    store.vector_store.get_texts.assert_called_with(["d"])
+    assert fused[1]["text"] == "D"
+
+
+def test_hybrid_retrieval_with_local_store(tmp_path, make_local_store):
+    """ハイブリッド検索で識別子を含む文書が見つかり、削除がBM25にも反映されることをテスト"""
+
+    doc_dir = tmp_path / "docs"
+    doc_dir.mkdir()
+    topics = ["ネットワーク", "プリンター", "メール", "ログイン", "バックアップ", "ライセンス"]
+    for i, topic in enumerate(topics):
+        (doc_dir / f"doc{i:02d}.md").write_text(
+            f"# {topic}の障害\n\n{topic}に問題が発生した場合の対処法を説明します。"
+        )
+    (doc_dir / "target.md").write_text("# 障害情報\n\nXR-7731 は電源ユニットの故障を示します。")
+    store = make_local_store("test_hybrid")
+    store.add_documents(doc_dir)
+
+    results = Retriever(store).retrieve("XR-7731 の対処法", n_results=3)
+    assert results[0]["metadata"]["source"] == "target.md"
+    assert all("score" in doc for doc in results)
+
+    # BM25の重みを0にするとベクトル検索のみになる
+    vector_only = Retriever(store, lexical_weight=0).retrieve("XR-7731", n_results=3)
+    assert all("score" not in doc for doc in vector_only)
+
+    # ファイルの削除はBM25インデックスにも反映される
+    (doc_dir / "target.md").unlink()
+    store.add_documents(doc_dir)
+    assert store.lexical_index.search("XR-7731") == []
+    assert len(store.lexical_index) == len(topics)
+
+
+def test_reranker_batches_and_caches_scores():
+    """候補をバッチで採点し、スコアを（質問, チャンクID）ごとにキャッシュすることをテスト"""
+    from app.retrievers.reranker import Reranker
+
+    batches = []
+
+    def scorer(query, texts):
+        batches.append(len(texts))
+        return [float(text.count(query)) for text in texts]
+
+    docs = [{"id": f"c{i}", "text": "ab" * i, "metadata": {}} for i in range(10)]
+    reranker = Reranker(scorer, batch_size=4, latency_budget=None)
+
+    results = reranker.rerank("ab", docs, top_k=3)
+    assert [doc["id"] for doc in results] == ["c9", "c8", "c7"]
+    assert results[0]["rerank_score"] == 9.0
+    assert batches == [4, 4, 2]
+
+    # 2回目はキャッシュから採点する
+    assert reranker.rerank("ab", docs, top_k=3) == results
+    assert batches == [4, 4, 2]
+    stats = reranker.stats()
+    assert stats["cache_hits"] == 10
+    assert stats["scored"] == 10
+
+    # 別の質問は別のキャッシュキーになる
+    reranker.rerank("ba", docs, top_k=3)
+    assert len(batches) == 6
+
+
+def test_reranker_falls_back_when_over_latency_budget():
+    """採点時間が上限を超えた場合は検索時の順位を返すことをテスト"""
+    from app.retrievers.reranker import Reranker
+
+    now = [0.0]
+
+    def slow_scorer(query, texts):
+        now[0] += 1.0
+        return [float(i) for i in range(len(texts))]
+
+    docs = [{"id": f"c{i}", "text": str(i), "metadata": {}} for i in range(6)]
+    reranker = Reranker(slow_scorer, batch_size=2, latency_budget=1.5, clock=lambda: now[0])
+
+    results = reranker.rerank("q", docs, top_k=3)
+    assert [doc["id"] for doc in results] == ["c0", "c1", "c2"]
+    assert reranker.stats()["fallbacks"] == 1
+    assert reranker.stats()["scored"] == 4
+
+
+def test_reranker_latency_budget_is_checked_between_batches():
+    """採点中のバッチは上限を超えても最後まで採点し、その結果で並べ替えることをテスト"""
+    from app.retrievers.reranker import Reranker
+
+    now = [0.0]
+
+    def slow_scorer(query, texts):
+        now[0] += 1.0
+        return [float(i) for i in range(len(texts))]
+
+    docs = [{"id": f"c{i}", "text": str(i), "metadata": {}} for i in range(6)]
+    reranker = Reranker(slow_scorer, batch_size=3, latency_budget=1.5, clock=lambda: now[0])
+
+    # 2バッチ目の開始時点（1.0秒）は上限内のため、終了時点（2.0秒）で上限を超えていても採点を使う
+    results = reranker.rerank("q", docs, top_k=3)
+    assert now[0] == 2.0
+    assert [doc["id"] for doc in results] == ["c2", "c5", "c1"]
+    assert reranker.stats()["fallbacks"] == 0
+    assert reranker.stats()["scored"] == 6
+
+
+def test_reranker_blends_scores_with_retrieval_rank():
+    """rank_weightを指定した場合は検索時の順位とスコアを合わせて並べ替えることをテスト"""
+    from app.retrievers.reranker import Reranker, lexical_overlap_score
+
+    docs = [
+        {"id": "c0", "text": "年次の休みは前日までに申請します", "metadata": {}},
+        {"id": "c1", "text": "関係のない文章", "metadata": {}},
+        {"id": "c2", "text": "有給休暇の規程", "metadata": {}},
+        {"id": "c3", "text": "有給休暇の日数", "metadata": {}},
+    ]
+    query = "有給休暇の取り方"
+    # 語の一致度のみでは、一致する語のない上位の候補が落ちる
+    assert "c0" not in [doc["id"] for doc in Reranker(lexical_overlap_score).rerank(query, docs, top_k=2)]
+
+    blended = Reranker(lexical_overlap_score, rank_weight=0.5).rerank(query, docs, top_k=3)
+    assert [doc["id"] for doc in blended] == ["c2", "c0", "c3"]
+    assert all(0.0 <= doc["rerank_score"] <= 1.0 for doc in blended)
+
+
+def test_lexical_overlap_score_prefers_identifiers():
+    """識別子を含むテキストのスコアが高くなることをテスト"""
+    from app.retrievers.reranker import lexical_overlap_score
+
+    scores = lexical_overlap_score(
+        "E1234 のエラー",
+        ["E1234 が表示された", "エラーが表示された", "関係のない文章"]
+    )
+    assert scores[0] > scores[1] > scores[2] == 0.0
+
+
+def test_retriever_overfetches_for_reranking(tmp_path):
+    """Rerankerを使う場合は多めに候補を取得して上位だけを返すことをテスト"""
+    from app.retrievers.reranker import Reranker
+
+    store = MagicMock()
+    store.lexical_index = None
+    store.vector_store.search.return_value = [
+        {"id": f"c{i}", "text": "対象" if i == 7 else "その他", "metadata": {}} for i in range(10)
+    ]
+    reranker = Reranker(lambda query, texts: [float(text == "対象") for text in texts])
+    retriever = Retriever(store, reranker=reranker, rerank_candidates=10)
+
+    results = retriever.retrieve("質問", n_results=3)
+    assert store.vector_store.search.call_args.kwargs["n_results"] == 10
+    assert [doc["id"] for doc in results] == ["c7", "c0", "c1"]
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import threading
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from api.server import LIMITER, create_app
+from app.generators.fake_model import FakeGenerativeModel
+from app.pipeline import Pipeline
+
+
+def make_pipeline(tmp_path, store, model=None):
+    """ネットワークを使わないPipelineを作成"""
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir()
+    (docs_dir / "test.md").write_text("# テスト文書\n\nこれはサーバーのテスト用の文書です。")
+    return Pipeline(
+        docs_dir=docs_dir,
+        collection_name="test_server",
+        document_store=store,
+        model=model or FakeGenerativeModel()
+    )
+
+
+def test_server_ingest_and_query(tmp_path, make_local_store):
+    """/ingestで取り込んだ文書に対して/queryで回答できることをテスト"""
+    pipeline = make_pipeline(tmp_path, make_local_store("test_server"))
+
+    async def scenario():
+        async with TestClient(TestServer(create_app(pipeline))) as client:
+            response = await client.post("/ingest", json={})
+            assert response.status == 200
+            assert (await response.json())["stats"]["added"] == 1
+
+            response = await client.post("/query", json={"query": "テスト文書について"})
+            assert response.status == 200
+            body = await response.json()
+            assert body["answer"] == "これはテスト回答です。"
+            assert "test.md" in body["sources"]
+
+            response = await client.post("/query", json={})
+            assert response.status == 400
+
+            response = await client.post("/query", json={"query": "テスト文書とは", "trace": True})
+            assert "stages" in (await response.json())["trace"]
+
+            response = await client.get("/metrics")
+            assert response.status == 200
+            assert 'rag_stage_duration_seconds_count{stage="generate"}' in await response.text()
+
+    asyncio.run(scenario())
+
+
+def test_server_query_stream(tmp_path, make_local_store):
+    """/query/streamがServer-Sent Eventsで回答を返すことをテスト"""
+    pipeline = make_pipeline(tmp_path, make_local_store("test_server"), FakeGenerativeModel(chunk_size=3))
+    pipeline.initialize()
+
+    async def scenario():
+        async with TestClient(TestServer(create_app(pipeline))) as client:
+            response = await client.post("/query/stream", json={"query": "テスト"})
+            assert response.status == 200
+            assert response.headers["Content-Type"].startswith("text/event-stream")
+            return await response.text()
+
+    text = asyncio.run(scenario())
+    events = [
+        (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+        for block in text.strip().split("\n\n")
+    ]
+    deltas = [data["text"] for event, data in events if event == "delta"]
+    assert len(deltas) > 1
+    event, done = events[-1]
+    assert event == "done"
+    assert done["answer"] == "".join(deltas) == "これはテスト回答です。"
+    assert done["time_to_first_token"] is not None
+
+
+def test_server_handles_queries_concurrently(tmp_path, make_local_store):
+    """ブロッキングする生成処理が並行に実行され、上限を超えた分は503になることをテスト"""
+    release = threading.Event()
+    started = threading.Semaphore(0)
+
+    def answer(prompt):
+        started.release()
+        release.wait(5)
+        return "回答"
+
+    pipeline = make_pipeline(tmp_path, make_local_store("test_server"), FakeGenerativeModel(answer=answer))
+    pipeline.generator.response_cache = None
+    pipeline.initialize()
+    app = create_app(pipeline, max_workers=4, max_concurrency=2, max_pending=1)
+
+    async def scenario():
+        async with TestClient(TestServer(app)) as client:
+            tasks = [
+                asyncio.create_task(client.post("/query", json={"query": f"質問{i}"}))
+                for i in range(3)
+            ]
+            # 2件が処理中、1件が待機中になるまで待つ
+            loop = asyncio.get_running_loop()
+            for _ in range(2):
+                assert await loop.run_in_executor(None, started.acquire, True, 5)
+            while app[LIMITER].pending < 1:
+                await asyncio.sleep(0.01)
+
+            health = await (await client.get("/health")).json()
+            assert health["active"] == 2
+
+            rejected = await client.post("/query", json={"query": "あふれた質問"})
+            assert rejected.status == 503
+
+            release.set()
+            responses = await asyncio.gather(*tasks)
+            assert [r.status for r in responses] == [200, 200, 200]
+
+    asyncio.run(scenario())
@@ -0,0 +1,141 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.embedders.fake_backend import FakeEmbeddingBackend
+from app.embedders.gemini_embedder import GeminiEmbedder
+from app.generators.fake_model import FakeGenerativeModel
+from app.pipeline import Pipeline
+from app.utils.single_flight import SingleFlight
+
+
+def run_concurrently(n, func, *args):
+    """同じ呼び出しをn個のスレッドから同時に実行"""
+    barrier = threading.Barrier(n)
+
+    def call():
+        barrier.wait()
+        return func(*args)
+
+    with ThreadPoolExecutor(max_workers=n) as executor:
+        futures = [executor.submit(call) for _ in range(n)]
+        return [future.result() for future in futures]
+
+
+def test_single_flight_shares_in_flight_call():
+    """実行中の呼び出しに同じキーで合流すると、関数が1回だけ実行されることをテスト"""
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    executions = []
+
+    def slow(value):
+        executions.append(value)
+        started.set()
+        release.wait(5)
+        return value * 2
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(single_flight.do, "key", slow, 21)
+        assert started.wait(5)
+        followers = [executor.submit(single_flight.do, "key", slow, 21) for _ in range(3)]
+        while single_flight.stats()["calls"] < 4:
+            time.sleep(0.001)
+        release.set()
+        results = [leader.result()] + [f.result() for f in followers]
+
+    assert results == [42] * 4
+    assert executions == [21]
+    stats = single_flight.stats()
+    assert stats["keys"]["key"] == {"calls": 4, "executions": 1, "shared": 3, "errors": 0}
+    assert single_flight.in_flight() == 0
+
+    # 完了後の呼び出しは新たに実行される
+    release.set()
+    assert single_flight.do("key", slow, 1) == 2
+    assert single_flight.stats()["executions"] == 2
+
+
+def test_single_flight_propagates_errors():
+    """実行中の処理の例外が合流した呼び出しにも伝わることをテスト"""
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("boom")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(single_flight.do, "key", failing)
+        assert started.wait(5)
+        follower = executor.submit(single_flight.do, "key", failing)
+        while single_flight.stats()["calls"] < 2:
+            time.sleep(0.001)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(RuntimeError):
+                future.result()
+
+    assert single_flight.stats()["errors"] == 1
+    assert single_flight.in_flight() == 0
+
+
+def test_embed_query_coalesces_concurrent_requests():
+    """同じクエリの同時の埋め込み要求がAPI呼び出し1回にまとめられることをテスト"""
+    backend = FakeEmbeddingBackend(latency=0.2)
+    embedder = GeminiEmbedder(backend=backend, requests_per_minute=None)
+
+    results = run_concurrently(8, embedder.embed_query, "同じ質問")
+
+    assert backend.call_count == 1
+    assert all(result is results[0] for result in results)
+    assert not results[0].flags.writeable
+    assert embedder.single_flight.stats()["shared"] == 7
+
+
+def test_embed_query_coalesces_normalized_variants():
+    """空白や大文字小文字だけが異なるクエリの同時の要求もまとめられることをテスト"""
+    backend = FakeEmbeddingBackend(latency=0.2)
+    embedder = GeminiEmbedder(backend=backend, requests_per_minute=None)
+    queries = ["What is RAG?", "what is rag?", "  What  is RAG? ", "WHAT IS RAG?"]
+    barrier = threading.Barrier(len(queries))
+
+    def call(query):
+        barrier.wait()
+        return embedder.embed_query(query)
+
+    with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+        results = list(executor.map(call, queries))
+
+    assert backend.call_count == 1
+    assert all(result is results[0] for result in results)
+    assert embedder.single_flight.stats()["shared"] == len(queries) - 1
+
+
+def test_pipeline_run_coalesces_identical_queries(tmp_path, make_local_store):
+    """同じ質問の同時リクエストで回答生成が1回だけ行われることをテスト"""
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir()
+    (docs_dir / "test.md").write_text("# テスト文書\n\nこれはテスト用の文書です。")
+    model = FakeGenerativeModel(latency=0.2)
+    pipeline = Pipeline(
+        docs_dir=docs_dir,
+        collection_name="test_single_flight",
+        document_store=make_local_store("test_single_flight"),
+        model=model
+    )
+    pipeline.generator.response_cache = None
+    pipeline.initialize()
+
+    results = run_concurrently(6, pipeline.run, "テスト文書について？")
+
+    assert model.call_count == 1
+    assert all(result == results[0] for result in results)
+    # 呼び出し元ごとに別の辞書が返る
+    assert len({id(result) for result in results}) == 6
+    stats = pipeline.single_flight.stats()
+    assert stats["keys"]["テスト文書について"]["shared"] == 5
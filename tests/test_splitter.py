@@ -82,4 +82,61 @@ def test_custom_chunk_size():
     
     # 各チャンクの長さが制限を超えていないことを確認
     for chunk in chunks:
-        assert len(chunk) <= 50 
\ No newline at end of file
+        assert len(chunk) <= 50 
+
+
+def test_split_text_with_offsets():
+    """チャンクの開始位置が元テキストと一致することをテスト"""
+    splitter = TextSplitter(chunk_size=50, chunk_overlap=10)
+
+    text = "これはテスト用のテキストです。" * 10
+
+    for offset, chunk in splitter.split_text_with_offsets(text):
+        assert text[offset:offset + len(chunk)] == chunk
+
+
+
+def test_split_text_respects_headings_and_pages():
+    """見出しと改ページの前で必ずチャンクが区切られることをテスト"""
+    splitter = TextSplitter(chunk_size=200, chunk_overlap=20)
+
+    text = "# はじめに\n概要の文です。\n## 詳細\n詳細の文です。\f次のページの文です。"
+
+    chunks = splitter.split_text(text)
+
+    assert chunks == ["# はじめに\n概要の文です。", "## 詳細\n詳細の文です。", "次のページの文です。"]
+
+
+def test_split_text_sentence_boundaries_and_overlap():
+    """文の区切りで分割し、前のチャンクの末尾の文がオーバーラップすることをテスト"""
+    splitter = TextSplitter(chunk_size=30, chunk_overlap=12)
+
+    text = "".join(f"これは{i}番目の文です！" for i in range(10))
+
+    chunks = splitter.split_text_with_offsets(text)
+
+    for offset, chunk in chunks:
+        assert text[offset:offset + len(chunk)] == chunk
+        assert len(chunk) <= 30
+        # チャンクは文の途中で始まらず、文の途中で終わらない
+        assert offset == 0 or text[offset - 1] == "！"
+        assert chunk.endswith("！")
+    for (offset, chunk), (next_offset, _) in zip(chunks, chunks[1:]):
+        assert next_offset < offset + len(chunk)
+
+
+def test_split_text_with_token_length_function():
+    """トークン数で長さを数える関数を指定できることをテスト"""
+    from app.utils.text import estimate_tokens
+
+    splitter = TextSplitter(chunk_size=40, chunk_overlap=10, length_function=estimate_tokens)
+
+    text = "Error code E1024 occurred while loading the index. " * 10 + "日本語の文です。" * 10
+
+    chunks = splitter.split_text_with_offsets(text)
+
+    assert max(estimate_tokens(chunk) for _, chunk in chunks) <= 40
+    # 英数字は4文字でおよそ1トークンのため、文字数では上限を大きく超えるチャンクになる
+    assert max(len(chunk) for _, chunk in chunks) > 40
+    for offset, chunk in chunks:
+        assert text[offset:offset + len(chunk)] == chunk
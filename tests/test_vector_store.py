@@ -0,0 +1,218 @@
+import numpy as np
+import pytest
+
+from app.embedders.fake_backend import FakeEmbeddingBackend
+from app.embedders.gemini_embedder import GeminiEmbedder
+from app.retrievers.backends.numpy_backend import NumpyBackend
+from app.retrievers.vector_store import VectorStore
+
+
+def random_vectors(n, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=(n, dim)).astype(np.float32)
+
+
+def test_numpy_backend_exact_search(tmp_path):
+    """厳密検索が全件の内積順と一致することをテスト"""
+    vectors = random_vectors(200)
+    backend = NumpyBackend("test", tmp_path)
+    ids = [f"id{i}" for i in range(200)]
+    backend.upsert(ids, [f"text{i}" for i in range(200)], [{"n": i} for i in range(200)], vectors)
+
+    query = vectors[42]
+    results = backend.query(n_results=5, query_embeddings=[query])[0]
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:5]
+    assert [r["id"] for r in results] == [f"id{i}" for i in expected]
+    assert results[0]["id"] == "id42"
+    assert results[0]["distance"] == pytest.approx(0.0, abs=1e-5)
+
+
+def test_numpy_backend_filter_upsert_delete_and_persist(tmp_path):
+    """メタデータフィルター・上書き・削除・永続化をテスト"""
+    vectors = random_vectors(10)
+    backend = NumpyBackend("test", tmp_path)
+    metadatas = [{"source": "a" if i % 2 else "b", "n": i} for i in range(10)]
+    backend.upsert([f"id{i}" for i in range(10)], [f"t{i}" for i in range(10)], metadatas, vectors)
+
+    results = backend.query(n_results=10, query_embeddings=[vectors[0]], where={"source": "a"})[0]
+    assert {r["id"] for r in results} == {f"id{i}" for i in range(1, 10, 2)}
+
+    results = backend.query(
+        n_results=10,
+        query_embeddings=[vectors[0]],
+        where={"$and": [{"source": "b"}, {"n": {"$gte": 4}}]}
+    )[0]
+    assert {r["id"] for r in results} == {"id4", "id6", "id8"}
+
+    # 上書きと削除
+    backend.upsert(["id0"], ["updated"], [{"source": "c"}], [vectors[5]])
+    backend.delete(["id1", "id2"])
+    assert backend.count() == 8
+    assert backend.get(["id3"])[0]["text"] == "t3"
+    assert not (tmp_path / "test.numpy" / "meta.json").exists()  # flushまでは書き出さない
+    backend.flush()
+
+    # 再読み込み時はメモリマップで読み込まれる
+    reloaded = NumpyBackend("test", tmp_path)
+    assert isinstance(reloaded.embeddings, np.memmap)
+    assert reloaded.count() == 8
+    results = reloaded.query(n_results=1, query_embeddings=[vectors[5]], where={"source": "c"})[0]
+    assert results[0]["text"] == "updated"
+
+
+@pytest.mark.parametrize("dtype", ["float32", "int8"])
+def test_numpy_backend_appends_in_batches(tmp_path, dtype):
+    """小さな登録と削除を繰り返しても行列を作り直さず、結果が一括登録と一致することをテスト"""
+    vectors = random_vectors(600)
+    backend = NumpyBackend("batches", tmp_path, dtype=dtype)
+    for start in range(0, 600, 50):
+        backend.upsert(
+            [f"id{i}" for i in range(start, start + 50)],
+            [f"t{i}" for i in range(start, start + 50)],
+            [{"n": i} for i in range(start, start + 50)],
+            vectors[start:start + 50]
+        )
+        if start == 0:
+            buffer = backend._buffer
+    assert backend._buffer is buffer  # 容量の範囲内では追記するだけ
+    backend.delete([f"id{i}" for i in range(100, 600, 7)] + ["id3", "missing"])
+    backend.upsert(["id5"], ["更新"], [{"n": -1}], [vectors[10]])
+    backend.flush()
+
+    removed = {3} | set(range(100, 600, 7))
+    kept = [i for i in range(600) if i not in removed]
+    expected = NumpyBackend("expected", tmp_path, dtype=dtype, autosave=False)
+    expected.upsert([f"id{i}" for i in kept], [f"t{i}" for i in kept], [{"n": i} for i in kept], vectors[kept])
+    expected.upsert(["id5"], ["更新"], [{"n": -1}], [vectors[10]])
+
+    reloaded = NumpyBackend("batches", tmp_path, dtype=dtype)
+    assert reloaded.count() == expected.count() == len(kept)
+    queries = vectors[:20]
+    for backend_results, expected_results in zip(
+        reloaded.query(n_results=5, query_embeddings=queries),
+        expected.query(n_results=5, query_embeddings=queries)
+    ):
+        assert [r["id"] for r in backend_results] == [r["id"] for r in expected_results]
+        assert [r["text"] for r in backend_results] == [r["text"] for r in expected_results]
+    assert reloaded.get(["id5", "id3", "id101"]) == [
+        {"text": "更新", "metadata": {"n": -1}, "id": "id5"},
+        {"text": "t101", "metadata": {"n": 101}, "id": "id101"},
+    ]
+
+
+def test_numpy_backend_ivf_recall(tmp_path):
+    """IVFによる近似検索の再現率をテスト"""
+    rng = np.random.default_rng(1)
+    centers = rng.normal(size=(20, 32))
+    vectors = (centers[rng.integers(20, size=2000)] + rng.normal(scale=0.3, size=(2000, 32))).astype(np.float32)
+    ids = [f"id{i}" for i in range(2000)]
+
+    flat = NumpyBackend("flat", tmp_path, autosave=False)
+    ivf = NumpyBackend("ivf", tmp_path, index_type="ivf", nlist=20, nprobe=4, ivf_min_size=1000, autosave=False)
+    for backend in (flat, ivf):
+        backend.upsert(ids, ids, [{} for _ in ids], vectors)
+
+    queries = vectors[:50]
+    exact = flat.query(n_results=10, query_embeddings=queries)
+    approx = ivf.query(n_results=10, query_embeddings=queries)
+    recall = np.mean([
+        len({r["id"] for r in e} & {r["id"] for r in a}) / 10
+        for e, a in zip(exact, approx)
+    ])
+    assert recall > 0.9
+
+
+@pytest.mark.parametrize("dtype, min_recall", [("float16", 0.99), ("int8", 0.9)])
+def test_numpy_backend_quantized_recall_and_reload(tmp_path, dtype, min_recall):
+    """量子化した埋め込みの再現率と、メモリマップでの再読み込みをテスト"""
+    vectors = random_vectors(500, dim=64)
+    ids = [f"id{i}" for i in range(500)]
+    metadatas = [{"n": i} for i in range(500)]
+    flat = NumpyBackend("flat", tmp_path, autosave=False)
+    quantized = NumpyBackend("q", tmp_path, dtype=dtype)
+    for backend in (flat, quantized):
+        backend.upsert(ids, [f"text{i}" for i in range(500)], metadatas, vectors)
+
+    queries = vectors[:30]
+    exact = flat.query(n_results=10, query_embeddings=queries)
+    approx = quantized.query(n_results=10, query_embeddings=queries)
+    recall = np.mean([
+        len({r["id"] for r in e} & {r["id"] for r in a}) / 10
+        for e, a in zip(exact, approx)
+    ])
+    assert recall >= min_recall
+    assert quantized.nbytes() < flat.nbytes() / 1.9
+    quantized.flush()
+
+    # 再読み込み時は行列をメモリマップし、テキストは検索結果の行だけを読む
+    reloaded = NumpyBackend("q", tmp_path, dtype=dtype)
+    assert isinstance(reloaded.embeddings, np.memmap)
+    assert reloaded.embeddings.dtype == np.dtype(dtype)
+    results = reloaded.query(n_results=1, query_embeddings=[vectors[7]])[0]
+    assert results[0] == {**results[0], "id": "id7", "text": "text7", "metadata": {"n": 7}}
+    assert reloaded._texts is None
+    assert reloaded.get(["id3"])[0]["text"] == "text3"
+
+
+def test_numpy_backend_migrates_legacy_format(tmp_path):
+    """旧形式（records.jsonとembeddings.npy）のデータを新しい形式に変換することをテスト"""
+    import json
+
+    vectors = random_vectors(3)
+    directory = tmp_path / "legacy.numpy"
+    directory.mkdir()
+    np.save(directory / "embeddings.npy", vectors / np.linalg.norm(vectors, axis=1, keepdims=True))
+    with open(directory / "records.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "embedding_model": "fake-embedding",
+            "ids": ["a", "b", "c"],
+            "texts": ["テキストA", "テキストB", "テキストC"],
+            "metadatas": [{}, {}, {}],
+        }, f)
+
+    backend = NumpyBackend("legacy", tmp_path, dtype="int8")
+    assert not (directory / "records.json").exists()
+    assert (directory / "meta.json").exists()
+
+    reloaded = NumpyBackend("legacy", tmp_path, dtype="int8")
+    assert reloaded.embedding_model == "fake-embedding"
+    assert reloaded.query(n_results=1, query_embeddings=[vectors[1]])[0][0]["text"] == "テキストB"
+    assert backend.count() == reloaded.count() == 3
+
+
+def test_vector_store_uses_embedder_for_numpy_backend(tmp_path):
+    """埋め込みが必要なバックエンドでEmbedderが使われることをテスト"""
+    embedder = GeminiEmbedder(backend=FakeEmbeddingBackend(), requests_per_minute=None)
+    store = VectorStore("test", backend=NumpyBackend("test", tmp_path), embedder=embedder)
+
+    store.add_texts(
+        texts=["りんごは赤い果物です。", "東京は日本の首都です。"],
+        metadatas=[{"source": "fruit"}, {"source": "city"}]
+    )
+    results = store.search("赤い果物はりんごです。", n_results=1)
+
+    assert results[0]["metadata"]["source"] == "fruit"
+    assert store.similarity_search("日本の首都は東京", k=1)[0]["metadata"]["source"] == "city"
+
+
+def test_chroma_backend_with_precomputed_embeddings(tmp_path):
+    """Chromaに計算済みの埋め込みを渡し、モデル名の不一致を検出することをテスト"""
+    from app.retrievers.backends.chroma_backend import ChromaBackend
+
+    embedder = GeminiEmbedder(backend=FakeEmbeddingBackend(), requests_per_minute=None)
+    backend = ChromaBackend("test_chroma", tmp_path, embedding_model=embedder.model_name)
+    store = VectorStore("test_chroma", backend=backend, embedder=embedder)
+
+    store.add_texts(
+        texts=["りんごは赤い果物です。", "東京は日本の首都です。"],
+        metadatas=[{"source": "fruit"}, {"source": "city"}]
+    )
+    results = store.search("赤い果物はりんごです。", n_results=1)
+    assert results[0]["metadata"]["source"] == "fruit"
+    assert backend.collection.metadata["embedding_model"] == "fake-embedding"
+
+    # 別のモデルで開こうとするとエラーになる
+    with pytest.raises(ValueError, match="fake-embedding"):
+        ChromaBackend("test_chroma", tmp_path, embedding_model="other-model")